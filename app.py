@@ -4,6 +4,7 @@ from flask import Flask, render_template, request, jsonify, Response # type: ign
 import threading
 import time
 import csv
+import io
 import os
 import pyotp # type: ignore
 from datetime import datetime, timezone, timedelta
@@ -14,15 +15,18 @@ import atexit
 from selenium.common.exceptions import WebDriverException
 
 # Scheduling Imports
-from apscheduler.schedulers.background import BackgroundScheduler # type: ignore
-from apscheduler.jobstores.memory import MemoryJobStore # type: ignore
 from apscheduler.triggers.date import DateTrigger # type: ignore
-from apscheduler.executors.pool import ThreadPoolExecutor # type: ignore
 from apscheduler.jobstores.base import JobLookupError # type: ignore
 
 # Local Imports
 import config
 from logic_download import WebAutomation, regions_data, DownloadFailedException # Import custom exception
+from session_store import SessionStore, sign_in
+from browser_pool import get_browser_pool, shutdown_browser_pool
+from run_ledger import RunCheckpoint, get_ledger, ledger_scope, save_last_run
+from download_plan import compile_plan
+from page_waits import describe_wait_stats, merge_wait_stats
+from retry_policy import describe_retry_stats, get_circuit_breaker, get_retry_policy, merge_retry_stats
 import link_report
 
 app = Flask(__name__)
@@ -50,27 +54,17 @@ app.register_blueprint(sse_bp)    # /stream-status
 
 # Constants
 CONFIG_FILE_PATH = os.path.join(os.path.dirname(__file__), 'configs.json')
-LOG_FILE_PATH = os.path.join(os.path.dirname(__file__), 'logs', 'download_log.csv')
-
-# --- Ensure log file exists with header ---
-def ensure_log_file():
-    log_dir = os.path.dirname(LOG_FILE_PATH)
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir, exist_ok=True)
-    if not os.path.exists(LOG_FILE_PATH):
-        with open(LOG_FILE_PATH, 'w', encoding='utf-8') as f:
-            f.write('SessionID,Timestamp,File Name,Start Date,End Date,Status,Error Message\n')
-
-ensure_log_file()
 
 # Global state (import từ globals)
-from globals import status_messages, is_running, download_thread, lock
+from globals import lock
+from status_broker import get_status_broker
+from job_manager import DownloadJob, get_job_manager
+from schedule_queue import get_schedule_queue
+from scheduler_store import get_scheduler
+from run_history import get_run_history
 
-# Scheduler Setup
-jobstores = {'default': MemoryJobStore()}
-executors = {'default': ThreadPoolExecutor(2)} # Reduced pool size for sequential stability
-job_defaults = {'coalesce': True, 'max_instances': 1}
-scheduler = BackgroundScheduler(jobstores=jobstores, executors=executors, job_defaults=job_defaults, timezone=timezone.utc)
+# Scheduler Setup (schedules persist in SQLite, see scheduler_store.py)
+scheduler = get_scheduler()
 
 # Utility Functions
 def load_configs():
@@ -96,35 +90,25 @@ def save_configs(configs):
         print(f"Error saving config file {CONFIG_FILE_PATH}: {e}")
 
 def stream_status_update(message):
-    """Adds a message to the status list for SSE."""
-    global status_messages
+    """Publishes a message to the status broker for SSE."""
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     full_message = f"{timestamp}: {message}"
     print(full_message) # Log to console
-    with lock:
-        status_messages.append(full_message)
-        MAX_LOG_MESSAGES = 500
-        if len(status_messages) > MAX_LOG_MESSAGES:
-            status_messages = status_messages[-MAX_LOG_MESSAGES:]
+    get_status_broker().publish(full_message)
 
 
 # --- Download Process Function ---
 from logic_download import run_download_process
-def run_download_process(params):
-    """Main download function executed in a background thread."""
-    global is_running, status_messages
+def run_download_process(params, job=None):
+    """Main download function, executed by the job manager (job_manager.py) on a job thread."""
+    job = job or DownloadJob(params, source='direct') # Called without the job manager
+    stream_status_update = job.log # Run channel (/stream-status/<run_id>) and shared channel
     automation = None
+    browser_lease = None
+    session_store = None
+    profile_dir = None
     process_successful = True # Assume success initially
 
-    # --- Setup within Lock ---
-    with lock:
-        if is_running: # Double check inside lock
-             print("Download process already running, exiting new thread request.")
-             # Cannot easily send status back from here, rely on API response
-             return
-        is_running = True
-        status_messages = [] # Clear logs for this run
-
     stream_status_update("Starting report download process...")
 
     try:
@@ -140,6 +124,23 @@ def run_download_process(params):
         if not reports_to_download:
             raise ValueError("No reports configured for download.")
 
+        # --- Chunk Ledger (resumable runs) ---
+        resume = bool(params.get('resume'))
+        scope = ledger_scope(params)
+        save_last_run(params)
+        if resume:
+            stream_status_update(f"Resuming '{scope}': chunks already downloaded (per the chunk ledger) will be skipped.")
+
+        # --- Compile Download Plan (report_registry.py, download_plan.py) ---
+        plan = compile_plan(reports_to_download, selected_regions_indices_str, scope, log_func=stream_status_update)
+        for line in plan.describe():
+            stream_status_update(line)
+        if plan.has_errors:
+            process_successful = False
+        if not plan.items:
+            stream_status_update("Nothing to download in this run.")
+            return
+
         # --- Prepare Download Folder ---
         # timestamp_folder = datetime.now().strftime("%Y%m%d")
         timestamp_folder = "001" + datetime.now().strftime("%Y%m%d")
@@ -150,116 +151,88 @@ def run_download_process(params):
         except OSError as e:
             raise RuntimeError(f"Failed to create download directory '{specific_download_folder}': {e}")
 
-        # --- Initialize Automation ---
-        stream_status_update("Initializing browser automation...")
-        # Pass status callback to WebAutomation constructor
-        automation = WebAutomation(config.DRIVER_PATH, specific_download_folder, status_callback=stream_status_update)
-
-        # --- Login ---
-        stream_status_update(f"Logging in with user: {email}...")
         # Use first report's URL for login initiation
-        first_report_info = reports_to_download[0]
-        first_report_url = link_report.get_report_url(first_report_info.get('report_type'))
-        if not first_report_url:
-            raise ValueError(f"Could not find URL for initial report type '{first_report_info.get('report_type')}' needed for login.")
+        first_report_url = plan.items[0].url # Used for login initiation
         if not config.OTP_SECRET:
             raise ValueError("OTP_SECRET is not configured.")
 
-        if not automation.login(first_report_url, email, password, config.OTP_SECRET, status_callback=stream_status_update):
-            raise RuntimeError("Login failed after multiple attempts. Cannot proceed.")
+        if config.BROWSER_POOL_ENABLED:
+            # --- Lease Warm Browser (already logged in when reused) ---
+            stream_status_update(f"Leasing browser for user: {email}...")
+            browser_pool = get_browser_pool()
+            session_store = browser_pool.session_store
+            browser_lease = browser_pool.lease(
+                specific_download_folder, first_report_url, email, password, config.OTP_SECRET,
+                status_callback=stream_status_update
+            )
+            automation = browser_lease.automation
+        else:
+            # --- Initialize Automation ---
+            stream_status_update("Initializing browser automation...")
+            # Pass status callback to WebAutomation constructor
+            session_store = SessionStore()
+            profile_dir = session_store.acquire_profile(email)
+            automation = WebAutomation(config.DRIVER_PATH, specific_download_folder, status_callback=stream_status_update, profile_dir=profile_dir)
+
+            # --- Login ---
+            stream_status_update(f"Logging in with user: {email}...")
+            if not sign_in(automation, first_report_url, email, password, config.OTP_SECRET, store=session_store, status_callback=stream_status_update):
+                raise RuntimeError("Login failed after multiple attempts. Cannot proceed.")
         stream_status_update("Login successful.")
 
-        # --- Download Reports Loop ---
-        # Iterate through the list of report dictionaries
-        for report_info in reports_to_download:
-            report_type_key = report_info.get('report_type')
-            from_date = report_info.get('from_date')
-            to_date = report_info.get('to_date')
-            chunk_size_str = report_info.get('chunk_size', '5') # Default to '5' if missing
-
-            # Validate essential info for this report
-            if not all([report_type_key, from_date, to_date]):
-                 stream_status_update(f"Warning: Skipping report entry due to missing info: {report_info}")
-                 process_successful = False # Mark partial failure
-                 continue
-
-            # Validate and parse chunk_size
-            chunk_size = 5 # Default
-            try:
-                if isinstance(chunk_size_str, str) and chunk_size_str.lower() == 'month':
-                    chunk_size = 'month'
-                elif chunk_size_str:
-                    chunk_size_days = int(chunk_size_str)
-                    chunk_size = chunk_size_days if chunk_size_days > 0 else 5
-                # If chunk_size_str is empty or None, default 5 is kept
-            except (ValueError, TypeError):
-                stream_status_update(f"Warning: Invalid chunk size '{chunk_size_str}' for '{report_type_key}'. Using default: 5 days.")
-                chunk_size = 5
-
-            # Get report URL
-            report_url = link_report.get_report_url(report_type_key)
-            if not report_url:
-                stream_status_update(f"Error: Could not find URL for report type '{report_type_key}'. Skipping.")
+        # --- Optional Parallel Worker Pool ---
+        try:
+            worker_count = int(params.get('workers') or config.DOWNLOAD_WORKERS)
+        except (ValueError, TypeError):
+            worker_count = 1
+        if worker_count > 1:
+            from worker_pool import DownloadWorkerPool
+            stream_status_update(f"Parallel download enabled with {worker_count} browser workers.")
+            automation.worker_pool = DownloadWorkerPool(
+                config.DRIVER_PATH, specific_download_folder, first_report_url,
+                email, password, config.OTP_SECRET, size=worker_count,
+                status_callback=stream_status_update, session_store=session_store
+            )
+
+        automation.cancel_event = job.cancel_event # Checked between chunks (pooled browsers are reused)
+        if automation.worker_pool is not None:
+            automation.worker_pool.cancel_event = job.cancel_event
+        automation.page_stats = {'loads': 0, 'reused': 0} # Counted per run (pooled browsers are reused)
+        automation.wait_stats = {}
+        automation.retry_stats = {}
+
+        # --- Download Reports Loop (in plan order) ---
+        for item in plan.items:
+            if job.cancel_event.is_set():
+                stream_status_update("Run cancelled. Skipping the remaining reports.")
                 process_successful = False
-                continue
-
+                break
+            report_type_key = item.report_type
             stream_status_update(f"--- Starting download for report: {report_type_key} ---")
-            stream_status_update(f"Date Range: {from_date} to {to_date}, Chunk Size/Mode: {chunk_size}")
+            stream_status_update(f"Date Range: {item.from_date} to {item.to_date}, Chunk Size/Mode: {item.chunk_size}")
+            automation.export_engine = item.engine
+            automation.checkpoint = RunCheckpoint(get_ledger(), scope, report_type_key, automation.session_id, resume=resume or item.incremental, log_func=stream_status_update)
+            automation.report_type = report_type_key
+            if automation.worker_pool is not None:
+                automation.worker_pool.report_type = report_type_key
+            if config.RETRY_POLICY_ENABLED:
+                automation.retry_policy = get_retry_policy(report_type_key) # Per-report overrides (RETRY_POLICY_BY_REPORT)
+                if automation.worker_pool is not None:
+                    automation.worker_pool.retry_policy = automation.retry_policy
 
             report_failed = False
             try:
-                # --- Determine Download Method ---
-                if report_url in config.REGION_REQUIRED_REPORT_URLS:
-                    if not selected_regions_indices_str:
-                        stream_status_update(f"Error: Report '{report_type_key}' requires region selection, but none provided. Skipping.")
-                        report_failed = True
-                    else:
-                        try:
-                            selected_regions_indices_int = [int(idx) for idx in selected_regions_indices_str]
-                            region_names = [regions_data[i]['name'] for i in selected_regions_indices_int if i in regions_data]
-                            stream_status_update(f"Downloading '{report_type_key}' for regions: {', '.join(region_names)}")
-
-                            if hasattr(automation, 'download_reports_for_all_regions'):
-                                # Call the multi-region chunking method
-                                automation.download_reports_for_all_regions(
-                                    report_url, from_date, to_date, chunk_size,
-                                    region_indices=selected_regions_indices_int,
-                                    status_callback=stream_status_update
-                                )
-                            else:
-                                stream_status_update("ERROR: 'download_reports_for_all_regions' method missing.")
-                                report_failed = True
-                        except (ValueError, TypeError, KeyError) as region_err:
-                            stream_status_update(f"Error processing region indices for '{report_type_key}': {region_err}. Skipping.")
-                            report_failed = True
-                # Report-specific chunking methods
-                elif report_type_key == "FAF001 - Sales Report" and hasattr(automation, 'download_reports_in_chunks_1'):
-                    automation.download_reports_in_chunks_1(report_url, from_date, to_date, chunk_size, stream_status_update)
-                elif report_type_key == "FAF004N - Internal Rotation Report (Imports)" and hasattr(automation, 'download_reports_in_chunks_4n'):
-                     automation.download_reports_in_chunks_4n(report_url, from_date, to_date, chunk_size, stream_status_update)
-                elif report_type_key == "FAF004X - Internal Rotation Report (Exports)" and hasattr(automation, 'download_reports_in_chunks_4x'):
-                     automation.download_reports_in_chunks_4x(report_url, from_date, to_date, chunk_size, stream_status_update)
-                # Add elif for other specific reports (2, 3, 5, 6, 28) mapped to generic or specific methods
-                elif report_type_key == "FAF002 - Dosage Report" and hasattr(automation, 'download_reports_in_chunks_2'):
-                     automation.download_reports_in_chunks_2(report_url, from_date, to_date, chunk_size, stream_status_update)
-                elif report_type_key == "FAF003 - Report Of Other Imports And Exports" and hasattr(automation, 'download_reports_in_chunks_3'):
-                     automation.download_reports_in_chunks_3(report_url, from_date, to_date, chunk_size, stream_status_update)
-                elif report_type_key == "FAF005 - Detailed Report Of Imports" and hasattr(automation, 'download_reports_in_chunks_5'):
-                     automation.download_reports_in_chunks_5(report_url, from_date, to_date, chunk_size, stream_status_update)
-                elif report_type_key == "FAF006 - Supplier Return Report" and hasattr(automation, 'download_reports_in_chunks_6'):
-                     automation.download_reports_in_chunks_6(report_url, from_date, to_date, chunk_size, stream_status_update)
-                elif report_type_key == "FAF028 - Detailed Import - Export Transaction Report" and hasattr(automation, 'download_reports_in_chunks_28'):
-                     automation.download_reports_in_chunks_28(report_url, from_date, to_date, chunk_size, stream_status_update)
-                # Generic fallback chunking method
-                elif hasattr(automation, 'download_reports_in_chunks'):
-                    stream_status_update(f"Using generic chunking download logic for '{report_type_key}'.")
-                    automation.download_reports_in_chunks(report_url, from_date, to_date, chunk_size, stream_status_update)
+                if item.region_required:
+                    region_names = [regions_data[i]['name'] for i in item.region_indices if i in regions_data]
+                    stream_status_update(f"Downloading '{report_type_key}' for regions: {', '.join(region_names)}")
+                    automation.download_reports_for_all_regions(
+                        item.url, item.from_date, item.to_date, item.chunk_size,
+                        region_indices=item.region_indices,
+                        status_callback=stream_status_update
+                    )
                 else:
-                    stream_status_update(f"ERROR: No suitable download method found for report type '{report_type_key}'. Skipping.")
-                    report_failed = True
-
-            # --- Catch Errors During Report Download ---
-            except DownloadFailedException as report_err: # Specific download failure
+                    automation.download_report_chunks(item.variant, item.url, item.from_date, item.to_date, item.chunk_size, stream_status_update)
+            except DownloadFailedException as report_err:
                  stream_status_update(f"ERROR downloading report {report_type_key}: {report_err}")
                  report_failed = True
                  # traceback.print_exc() # Optional: log traceback for specific failures too
@@ -287,6 +260,24 @@ def run_download_process(params):
                 stream_status_update(f"--- Download COMPLETED for report: {report_type_key} ---")
         # --- End of Reports Loop ---
 
+        # --- Page-State Reuse Summary ---
+        page_stats = dict(automation.page_stats)
+        if automation.worker_pool is not None:
+            for key, value in automation.worker_pool.page_stats().items():
+                page_stats[key] += value
+        stream_status_update(f"Report page loads: {page_stats['loads']}, page loads saved by page reuse: {page_stats['reused']}.")
+        wait_stats = merge_wait_stats({}, automation.wait_stats)
+        if automation.worker_pool is not None:
+            merge_wait_stats(wait_stats, automation.worker_pool.wait_stats())
+        stream_status_update(describe_wait_stats(wait_stats))
+        retry_stats = merge_retry_stats({}, automation.retry_stats)
+        if automation.worker_pool is not None:
+            merge_retry_stats(retry_stats, automation.worker_pool.retry_stats())
+        stream_status_update(describe_retry_stats(retry_stats))
+        breaker_stats = get_circuit_breaker().stats()
+        if breaker_stats['opens']:
+            stream_status_update(f"Circuit breaker opened {breaker_stats['opens']} time(s) so far, downloads paused {breaker_stats['paused_seconds']:.0f}s in total.")
+
     except (RuntimeError, ValueError, WebDriverException) as setup_err:
         error_message = f"A critical error occurred during setup or login: {setup_err}"
         stream_status_update(f"FATAL ERROR: {error_message}")
@@ -301,13 +292,26 @@ def run_download_process(params):
     finally:
         # --- Cleanup ---
         if automation:
+            if automation.worker_pool is not None:
+                try:
+                    stream_status_update("Closing parallel browser workers...")
+                    automation.worker_pool.close()
+                except Exception as pool_e:
+                    stream_status_update(f"ERROR: Failed to close browser workers: {pool_e}")
             try:
-                stream_status_update("Attempting to close browser...")
-                automation.close()
-                # stream_status_update("Browser closed.") # Already logged in close()
+                if browser_lease is not None:
+                    # Keep the logged-in browser warm for the next manual or scheduled run
+                    browser_lease.release(healthy=automation.is_session_valid())
+                    stream_status_update("Returned browser to the warm browser pool.")
+                else:
+                    stream_status_update("Attempting to close browser...")
+                    automation.close()
+                    # stream_status_update("Browser closed.") # Already logged in close()
             except Exception as close_e:
                 stream_status_update(f"CRITICAL ERROR: Failed to close browser session properly: {close_e}")
                 traceback.print_exc()
+        if session_store is not None:
+            session_store.release_profile(profile_dir)
 
         # --- Final Status ---
         final_message = "PROCESS FINISHED: "
@@ -317,45 +321,42 @@ def run_download_process(params):
         else:
              final_message += " Check logs and CSV file for individual report status."
         stream_status_update(f"--- {final_message} ---")
-
-        # Reset running state
-        with lock:
-            is_running = False
-            # download_thread = None # Optional: clear thread variable
+        job.outcome = 'cancelled' if job.cancel_event.is_set() else ('success' if process_successful else 'failed')
 
 # --- Function Called by Scheduler ---
 def trigger_scheduled_download(config_name):
-    """Loads a saved configuration and starts the download process."""
+    """Queues a saved configuration for download (schedule_queue.py); it runs when a download slot is free."""
     print(f"Scheduler attempting job for config: {config_name}")
-    global is_running
-
-    with lock:
-        if is_running:
-            print(f"Scheduler: Download process already running. Skipping job for '{config_name}'.")
-            return
-        # No need to set is_running=True here; run_download_process does it
+    params = load_configs().get(config_name) or {}
+    try:
+        priority = int(params.get('priority', config.SCHEDULE_DEFAULT_PRIORITY))
+    except (TypeError, ValueError):
+        priority = config.SCHEDULE_DEFAULT_PRIORITY
+    get_schedule_queue().enqueue(config_name, priority=priority)
 
+def dispatch_scheduled_download(config_name):
+    """Loads a saved configuration and submits its download run. Returns the DownloadJob, or None."""
     configs = load_configs()
     params = configs.get(config_name)
 
     if not params:
         print(f"Scheduler: Configuration '{config_name}' not found.")
-        return
+        return None
 
     # Validate essential keys in the loaded config structure
     required_keys = ['email', 'password', 'reports'] # Regions is optional
     if not all(key in params for key in required_keys) or not isinstance(params['reports'], list):
          print(f"Scheduler: Config '{config_name}' missing required keys or 'reports' is not a list.")
-         return
+         return None
     if not params['reports']: # Check if reports list is empty
         print(f"Scheduler: Config '{config_name}' has no reports defined.")
-        return
+        return None
 
-    print(f"Scheduler: Starting download thread for config '{config_name}'...")
     thread_params = params.copy() # Pass a copy
-    scheduled_thread = threading.Thread(target=run_download_process, args=(thread_params,))
-    scheduled_thread.daemon = True
-    scheduled_thread.start()
+    thread_params['config_name'] = config_name # Chunk ledger scope
+    job = get_job_manager().submit(thread_params, source=f"schedule:{config_name}", runner=run_download_process)
+    print(f"Scheduler: Submitted run {job.run_id} ({job.state}) for config '{config_name}'.")
+    return job
 
 # --- Flask Routes REMOVED: All routes moved to blueprints. ---
 # from auth_google_sheet import is_user_allowed
@@ -383,43 +384,31 @@ def trigger_scheduled_download(config_name):
 
 @app.route('/get-logs', methods=['GET'])
 def get_download_logs():
-    """Reads and returns the download log file content."""
-    logs_data = []
-    status_code = 200
-    response_status = 'success'
-    message = ''
-
-    if not os.path.exists(LOG_FILE_PATH):
-        message = 'Log file does not exist yet.'
-        response_status = 'warning'
-    else:
-        try:
-            # Use low_memory=False for potentially mixed types if needed
-            df = pd.read_csv(LOG_FILE_PATH, dtype=str, keep_default_na=False, na_values=[''], on_bad_lines='warn')
-            df = df.fillna('') # Replace any remaining NaN with empty string
-            logs_data = df.to_dict('records')
-
-            if 'Timestamp' in df.columns and not df.empty:
-                try:
-                    df['TimestampParsed'] = pd.to_datetime(df['Timestamp'], errors='coerce')
-                    df_sorted = df.sort_values(by='TimestampParsed', ascending=False, na_position='last')
-                    logs_data = df_sorted.drop(columns=['TimestampParsed']).to_dict('records')
-                except Exception as sort_err:
-                   print(f"Could not sort logs by timestamp: {sort_err}")
-
-            if not logs_data:
-                message = 'Log file is empty.'
-        except pd.errors.EmptyDataError:
-            message = 'Log file is empty.'
-            response_status = 'warning' # Empty is not an error
-        except Exception as e:
-            print(f"Error reading or processing log file: {e}")
-            traceback.print_exc()
-            response_status = 'error'
-            message = f'Error reading log file: {e}'
-            status_code = 500
-
-    return jsonify({'status': response_status, 'message': message, 'logs': logs_data}), status_code
+    """
+    Download log rows from the run history (run_history.py), newest first.
+    Optional filters: session_id, report, status (prefix, e.g. 'Failed'),
+    since/until ('YYYY-MM-DD HH:MM:SS'), limit and offset. ``format=csv``
+    returns the rows as a download_log.csv file instead.
+    """
+    filters = {key: request.args.get(key) for key in ('session_id', 'report', 'status', 'since', 'until') if request.args.get(key)}
+    try:
+        history = get_run_history()
+        history.flush() # Include rows still buffered by the writer
+        if request.args.get('format') == 'csv':
+            output = io.StringIO()
+            history.export_csv(output, **filters)
+            return Response(output.getvalue(), mimetype='text/csv',
+                            headers={'Content-Disposition': 'attachment; filename="download_log.csv"'})
+        limit = request.args.get('limit', type=int) or config.RUN_HISTORY_PAGE_SIZE
+        logs_data = history.query(limit=limit, offset=request.args.get('offset', 0, type=int), **filters)
+        total = history.count(**filters)
+    except Exception as e:
+        print(f"Error reading run history: {e}")
+        traceback.print_exc()
+        return jsonify({'status': 'error', 'message': f'Error reading log history: {e}', 'logs': []}), 500
+    if not total:
+        return jsonify({'status': 'warning', 'message': 'Log history is empty.', 'logs': [], 'total': 0})
+    return jsonify({'status': 'success', 'message': '', 'logs': logs_data, 'total': total})
 
 # --- Configuration Endpoints ---
 # --- Config management API routes moved to blueprints/config_mgmt.py ---
@@ -450,6 +439,8 @@ if __name__ == '__main__':
             print(f"CRITICAL ERROR: Failed to start APScheduler: {e}")
             traceback.print_exc()
             # exit(1) # Exit if scheduler is critical
+    atexit.register(shutdown_browser_pool) # Quit warm browsers with the app
+    get_schedule_queue().start(dispatch_scheduled_download) # Also resumes scheduled runs queued before a restart
 
     # Run Flask App
     print("Starting Flask application...")
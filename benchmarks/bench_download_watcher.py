@@ -0,0 +1,92 @@
+# filename: benchmarks/bench_download_watcher.py
+"""
+Compares download completion detection backends (polling vs inotify).
+
+A writer thread simulates Chrome: it streams data into ``<name>.crdownload``
+and renames it to the final name. The waiter measures the latency between
+the rename and detection, plus the CPU time it spent waiting, against a
+folder pre-filled with thousands of files (like a busy 001YYYYMMDD folder).
+
+Usage:
+    python benchmarks/bench_download_watcher.py [--files 5000] [--rounds 10]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from download_watcher import inotify_available, wait_with_inotify, wait_with_polling # noqa: E402
+
+
+def _fill_folder(folder, count):
+    for i in range(count):
+        with open(os.path.join(folder, f"BaoCao_{i:06d}.csv"), 'w') as f:
+            f.write("x")
+
+
+def _simulate_download(folder, name, delay, result):
+    time.sleep(delay)
+    partial = os.path.join(folder, name + ".crdownload")
+    with open(partial, 'wb') as f:
+        for _ in range(8):
+            f.write(b"0" * 4096)
+            f.flush()
+            time.sleep(0.01)
+    result['renamed_at'] = time.perf_counter()
+    os.rename(partial, os.path.join(folder, name))
+
+
+def _run_backend(backend, folder, rounds, delay, poll_interval):
+    latencies, cpu_times = [], []
+    quiet = lambda message: None
+    for i in range(rounds):
+        name = f"{backend}_export_{i}.csv"
+        before = set(os.listdir(folder))
+        result = {}
+        writer = threading.Thread(target=_simulate_download, args=(folder, name, delay, result))
+        cpu_start = time.thread_time()
+        writer.start()
+        if backend == 'inotify':
+            found = wait_with_inotify(folder, before, timeout=30, log_func=quiet)
+        else:
+            found = wait_with_polling(folder, before, timeout=30, log_func=quiet, poll_interval=poll_interval)
+        detected_at = time.perf_counter()
+        cpu_times.append(time.thread_time() - cpu_start)
+        writer.join()
+        if found != name:
+            raise RuntimeError(f"{backend}: expected {name}, detected {found}")
+        latencies.append(detected_at - result['renamed_at'])
+    return latencies, cpu_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=5000, help="Filler files in the download folder")
+    parser.add_argument('--rounds', type=int, default=10, help="Downloads simulated per backend")
+    parser.add_argument('--delay', type=float, default=0.5, help="Seconds before each simulated download starts")
+    parser.add_argument('--poll-interval', type=float, default=2, help="Polling backend interval (SHORT_WAIT)")
+    args = parser.parse_args()
+
+    backends = ['polling'] + (['inotify'] if inotify_available() else [])
+    folder = tempfile.mkdtemp(prefix="bench_watcher_")
+    try:
+        _fill_folder(folder, args.files)
+        print(f"Folder: {folder} ({args.files} files), rounds: {args.rounds}")
+        print(f"{'backend':<10}{'median ms':>12}{'max ms':>12}{'cpu ms/wait':>14}")
+        for backend in backends:
+            latencies, cpu_times = _run_backend(backend, folder, args.rounds, args.delay, args.poll_interval)
+            print(f"{backend:<10}{statistics.median(latencies) * 1000:>12.1f}{max(latencies) * 1000:>12.1f}"
+                  f"{statistics.mean(cpu_times) * 1000:>14.2f}")
+        if 'inotify' not in backends:
+            print("inotify backend not available on this platform; only polling was measured.")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# filename: benchmarks/bench_page_load.py
+"""
+Side-by-side page-load timing of the PHARFAF report pages for the 'standard'
+and 'lean' browser profiles (see BROWSER_PROFILE in config.py).
+
+Each profile starts its own Chrome, signs in once (reusing the saved session
+when possible) and loads every report page ``--rounds`` times. Reported per
+page and profile: median wall time of ``driver.get``, DOMContentLoaded, load
+event, number of resources fetched and bytes transferred.
+
+Usage:
+    python benchmarks/bench_page_load.py [--rounds 3] [--csv page_load.csv]
+    # credentials: DEFAULT_EMAIL / DEFAULT_PASSWORD / OTP_SECRET from config.py
+"""
+import argparse
+import csv
+import os
+import statistics
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config # noqa: E402
+import link_report # noqa: E402
+from logic_download import WebAutomation # noqa: E402
+from session_store import SessionStore, sign_in # noqa: E402
+
+METRICS = ('wall_ms', 'dom_content_loaded_ms', 'load_event_ms', 'resource_count', 'resource_bytes')
+
+
+def _report_pages(only=None):
+    """Unique PHARFAF report URLs keyed by a short page name."""
+    pages = {}
+    for name, url in link_report.get_report_url().items():
+        page = os.path.splitext(url.rsplit('/', 1)[-1])[0]
+        if not only or page in only:
+            pages.setdefault(page, url)
+    return pages
+
+
+def _measure_profile(profile, pages, rounds, email, password):
+    quiet = lambda message: None
+    download_folder = tempfile.mkdtemp(prefix=f"bench_page_load_{profile}_")
+    automation = WebAutomation(config.DRIVER_PATH, download_folder, status_callback=quiet, browser_profile=profile)
+    results = {}
+    try:
+        first_url = next(iter(pages.values()))
+        if not sign_in(automation, first_url, email, password, config.OTP_SECRET, store=SessionStore(), status_callback=quiet):
+            raise RuntimeError(f"{profile}: login failed.")
+        for page, url in pages.items():
+            automation.measure_page_load(url) # Warm-up: excludes first-visit DNS/TLS setup
+            samples = [automation.measure_page_load(url) for _ in range(rounds)]
+            results[page] = {m: statistics.median(s.get(m, 0) for s in samples) for m in METRICS}
+            print(f"  {profile:<9}{page:<12}{results[page]['wall_ms']:>10.0f} ms")
+    finally:
+        automation.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=3, help="Measured loads per page and profile")
+    parser.add_argument('--pages', nargs='*', help="Only these pages, e.g. PHARFAF001 PHARFAF028")
+    parser.add_argument('--profiles', nargs='*', default=['standard', 'lean'])
+    parser.add_argument('--email', default=config.DEFAULT_EMAIL)
+    parser.add_argument('--password', default=config.DEFAULT_PASSWORD)
+    parser.add_argument('--csv', help="Also write the results to this CSV file")
+    args = parser.parse_args()
+
+    pages = _report_pages(args.pages)
+    if not pages:
+        parser.error("No matching report pages.")
+    print(f"Measuring {len(pages)} pages x {args.rounds} rounds for profiles: {', '.join(args.profiles)}")
+    results = {profile: _measure_profile(profile, pages, args.rounds, args.email, args.password) for profile in args.profiles}
+
+    header = f"{'page':<12}" + "".join(f"{p + ' ms':>14}{p + ' KB':>12}{p + ' req':>10}" for p in args.profiles)
+    if len(args.profiles) == 2:
+        header += f"{'saved ms':>10}{'saved KB':>10}"
+    print("\n" + header)
+    rows = []
+    for page in pages:
+        line = f"{page:<12}"
+        row = {'page': page}
+        for profile in args.profiles:
+            r = results[profile][page]
+            line += f"{r['wall_ms']:>14.0f}{r['resource_bytes'] / 1024:>12.1f}{r['resource_count']:>10.0f}"
+            row.update({f"{profile}_{m}": round(r[m], 1) for m in METRICS})
+        if len(args.profiles) == 2:
+            base, other = (results[p][page] for p in args.profiles)
+            line += f"{base['wall_ms'] - other['wall_ms']:>10.0f}{(base['resource_bytes'] - other['resource_bytes']) / 1024:>10.1f}"
+        print(line)
+        rows.append(row)
+
+    if args.csv:
+        with open(args.csv, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"\nWrote {args.csv}")
+
+
+if __name__ == '__main__':
+    main()
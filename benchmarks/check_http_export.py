@@ -0,0 +1,144 @@
+# filename: benchmarks/check_http_export.py
+"""
+End-to-end check of the HTTP export engine against the local PHARFAF stub.
+
+Starts tools/stub_pharfaf_server.py on a free port and, with the run history
+in a temporary SQLite file, checks that:
+  * the N and X variants are exported under their dated names, with the
+    matching rblType option posted
+  * an expired cookie is refreshed once through ``refresh_cookies``, and a
+    refresh that still does not log in fails as a session expiry
+  * an HTML export response and an empty attachment fail without leaving a
+    file behind
+  * every chunk is recorded in the run history with the expected status
+
+Usage:
+    python benchmarks/check_http_export.py
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tools'))
+import config # noqa: E402
+import run_history # noqa: E402
+from http_export import HttpExportEngine # noqa: E402
+from logic_download import build_target_name # noqa: E402
+from stub_pharfaf_server import (EMPTY_EXPORT_CODE, HTML_ERROR_CODE, SESSION_COOKIE, SESSION_VALUE, # noqa: E402
+                                 StubPharfafHandler)
+
+FROM_DATE, TO_DATE = '2024-01-01', '2024-01-07'
+VALID_COOKIES = [{'name': SESSION_COOKIE, 'value': SESSION_VALUE}]
+EXPIRED_COOKIES = [{'name': SESSION_COOKIE, 'value': 'expired-session'}]
+
+
+def _report_url(port, code):
+    return f"http://127.0.0.1:{port}/MIS/PHAR/PHARFAF{code}.aspx"
+
+
+def _download(folder, session_id, cookies, method_name, url, refresh_cookies=None):
+    engine = HttpExportEngine(folder, session_id, cookies=cookies, status_callback=lambda message: None)
+    engine.report_type = method_name
+    try:
+        return engine.download(method_name, url, FROM_DATE, TO_DATE, refresh_cookies=refresh_cookies)
+    finally:
+        engine.close()
+
+
+def _check_variants(folder, port):
+    for method_name, suffix in (('download_report_004N', 'N'), ('download_report_004X', 'X')):
+        stored = _download(folder, f'check-{suffix}', VALID_COOKIES, method_name, _report_url(port, '004'))
+        expected = build_target_name('BaoCaoPHARFAF004.csv', FROM_DATE, TO_DATE, suffix)
+        assert stored == expected, f"{method_name}: stored {stored!r}, expected {expected!r}"
+        with open(os.path.join(folder, stored), encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        assert lines[1].split(',')[1] == suffix, f"{method_name}: export posted rblType {lines[1]!r}"
+        print(f"ok  {method_name} -> {stored}")
+
+
+def _check_session_refresh(folder, port):
+    refreshes = []
+
+    def refresh():
+        refreshes.append(1)
+        return VALID_COOKIES
+
+    stored = _download(folder, 'check-refresh', EXPIRED_COOKIES, 'download_report_004N',
+                       _report_url(port, '005'), refresh_cookies=refresh)
+    assert stored == build_target_name('BaoCaoPHARFAF005.csv', FROM_DATE, TO_DATE, 'N'), stored
+    assert len(refreshes) == 1, f"cookies refreshed {len(refreshes)} times"
+    print(f"ok  expired cookie refreshed once -> {stored}")
+
+    stored = _download(folder, 'check-refresh-failed', EXPIRED_COOKIES, 'download_report_004N',
+                       _report_url(port, '006'), refresh_cookies=lambda: EXPIRED_COOKIES)
+    assert stored is None, stored
+    print("ok  refresh without a valid session fails")
+
+
+def _check_failed_exports(folder, port):
+    before = set(os.listdir(folder))
+    for session_id, code in (('check-html', HTML_ERROR_CODE), ('check-empty', EMPTY_EXPORT_CODE)):
+        stored = _download(folder, session_id, VALID_COOKIES, 'download_report_004N', _report_url(port, code))
+        assert stored is None, f"PHARFAF{code}: stored {stored!r}"
+        print(f"ok  PHARFAF{code} export fails")
+    left = set(os.listdir(folder)) - before
+    assert not left, f"failed exports left files behind: {sorted(left)}"
+
+
+def _check_history(store):
+    assert store.flush(), "run history rows were not written in time"
+    expected = {
+        'check-N': ('Success', build_target_name('BaoCaoPHARFAF004.csv', FROM_DATE, TO_DATE, 'N')),
+        'check-X': ('Success', build_target_name('BaoCaoPHARFAF004.csv', FROM_DATE, TO_DATE, 'X')),
+        'check-refresh': ('Success', build_target_name('BaoCaoPHARFAF005.csv', FROM_DATE, TO_DATE, 'N')),
+        'check-refresh-failed': ('Failed (HTTP Session Expired)', ''),
+        'check-html': ('Failed (HTTP Session Expired)', ''),
+        'check-empty': ('Failed (HTTP Export)', ''),
+    }
+    for session_id, (status, file_name) in expected.items():
+        rows = store.query(session_id=session_id)
+        assert len(rows) == 1, f"{session_id}: {len(rows)} run history rows"
+        row = rows[0]
+        assert row['Status'] == status, f"{session_id}: status {row['Status']!r}, expected {status!r}"
+        assert row['File Name'] == file_name, f"{session_id}: file name {row['File Name']!r}"
+        assert (row['Start Date'], row['End Date']) == (FROM_DATE, TO_DATE), row
+        assert row['Report'] == 'download_report_004' + ('X' if session_id == 'check-X' else 'N'), row
+    print(f"ok  {len(expected)} run history rows")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="check_http_export_")
+    folder = os.path.join(workdir, 'downloads')
+    os.makedirs(folder)
+    config.RUN_HISTORY_IMPORT_CSV = [] # Keep the real download logs out of the temporary history
+    config.RUN_HISTORY_DB_PATH = os.path.join(workdir, 'run_history.db')
+    store = run_history.get_run_history()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubPharfafHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    port = server.server_address[1]
+    print(f"Stub PHARFAF server on port {port}, download folder: {folder}")
+    try:
+        _check_variants(folder, port)
+        _check_session_refresh(folder, port)
+        _check_failed_exports(folder, port)
+        _check_history(store)
+        print("All HTTP export checks passed.")
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
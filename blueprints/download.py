@@ -4,9 +4,8 @@ import link_report
 from logic_download import regions_data
 from functools import wraps
 
-# Import state and core logic from app context
-from globals import lock, is_running, status_messages, download_thread
-from logic_download import run_download_process  # Import hàm xử lý download chính
+# Download runs are submitted as jobs (queued when all download slots are busy)
+from job_manager import get_job_manager
 
 def login_required(f):
     @wraps(f)
@@ -44,10 +43,15 @@ def get_reports_regions_data():
     try:
         report_url_map = link_report.get_report_url()
         report_names = list(report_url_map.keys()) if report_url_map else []
-        regions_info = {idx: data['name'] for idx, data in regions_data.items()}
+        region_tree_info = None
+        if config.REGION_TREE_DISCOVERY:
+            from region_tree import get_region_tree
+            region_tree_info = get_region_tree().stats() # Merges discovered regions into regions_data
+        regions_info = {idx: data['name'] for idx, data in sorted(regions_data.items())}
         return jsonify({
             'reports': report_names,
             'regions': regions_info,
+            'region_tree': region_tree_info,
             'region_required_urls': config.REGION_REQUIRED_REPORT_URLS,
             'report_urls_map': report_url_map
         })
@@ -59,11 +63,6 @@ def get_reports_regions_data():
 @download_bp.route('/api/start-download', methods=['POST'])
 @login_required
 def handle_start_download_api():
-    global is_running
-    from app import download_thread # Import here to avoid circular import
-    with lock:
-        if is_running:
-            return jsonify({'status': 'error', 'message': 'A download process is already running. Please wait.'}), 409
     try:
         # Hỗ trợ cả JSON và form-data
         if request.is_json:
@@ -78,17 +77,113 @@ def handle_start_download_api():
         import traceback; traceback.print_exc()
         return jsonify({'status': 'error', 'message': f'Error processing request data: {e}'}), 400
     try:
-        # Khởi động luồng download nền
-        with lock:
-            download_thread = None
-        import threading
-        thread_data = data.copy()
-        download_thread = threading.Thread(target=run_download_process, args=(thread_data,))
-        download_thread.daemon = True
-        download_thread.start()
-        return jsonify({'status': 'started', 'message': 'Report download process initiated.'})
+        # Khởi động luồng download nền (job_manager.py)
+        job = get_job_manager().submit(data.copy(), source='manual')
+        return jsonify({'status': 'started', 'message': f'Report download run {job.run_id} initiated.', **job.to_dict()})
     except Exception as e:
         import traceback; traceback.print_exc()
-        with lock:
-            is_running = False
         return jsonify({'status': 'error', 'message': f'Internal Server Error: Failed to start download process ({e}).'}), 500
+
+@download_bp.route('/api/plan', methods=['POST'])
+@login_required
+def preview_download_plan():
+    """Compiles the posted run configuration into its ordered plan with estimated durations, without running it."""
+    data = request.get_json(silent=True) or {}
+    if not data.get('reports'):
+        return jsonify({'status': 'error', 'message': 'No reports configured for download.'}), 400
+    from download_plan import compile_plan
+    from run_ledger import ledger_scope
+    try:
+        plan = compile_plan(data['reports'], data.get('regions'), ledger_scope(data), log_func=lambda message: None)
+    except Exception as e:
+        import traceback; traceback.print_exc()
+        return jsonify({'status': 'error', 'message': f'Could not compile download plan: {e}'}), 500
+    return jsonify({'status': 'ok', **plan.to_dict()})
+
+@download_bp.route('/api/browser-pool', methods=['GET'])
+@login_required
+def get_browser_pool_stats():
+    """Warm browser pool metrics: size, utilisation and lease wait times."""
+    if not config.BROWSER_POOL_ENABLED:
+        return jsonify({'enabled': False})
+    from browser_pool import get_browser_pool
+    return jsonify({'enabled': True, **get_browser_pool().stats()})
+
+@download_bp.route('/api/export-cache', methods=['GET'])
+@login_required
+def get_export_cache_stats():
+    """Export result cache metrics: entries, size, hits, misses and evictions."""
+    if not config.EXPORT_CACHE_ENABLED:
+        return jsonify({'enabled': False})
+    from export_cache import get_export_cache
+    return jsonify({'enabled': True, **get_export_cache().stats()})
+
+@download_bp.route('/api/coalescing', methods=['GET'])
+@login_required
+def get_coalescing_stats():
+    """Request coalescing metrics: exports led, chunks/days taken over from other runs, waits."""
+    if not config.COALESCE_ENABLED:
+        return jsonify({'enabled': False})
+    from coalesce import get_coalescer
+    return jsonify({'enabled': True, **get_coalescer().stats()})
+
+@download_bp.route('/api/retry-policy', methods=['GET'])
+@login_required
+def get_retry_policy_stats():
+    """Effective retry policy (optionally for ?report=) and circuit breaker state."""
+    if not config.RETRY_POLICY_ENABLED:
+        return jsonify({'enabled': False})
+    from retry_policy import get_circuit_breaker, get_retry_policy
+    return jsonify({
+        'enabled': True,
+        'policy': get_retry_policy(request.args.get('report')).to_dict(),
+        'circuit_breaker': get_circuit_breaker().stats()
+    })
+
+@download_bp.route('/api/resume-last-run', methods=['POST'])
+@login_required
+def resume_last_run_api():
+    """Re-runs the last download with resume on, so only chunks missing from the chunk ledger are fetched."""
+    from run_ledger import load_last_run
+    params = load_last_run()
+    if not params:
+        return jsonify({'status': 'error', 'message': 'No previous run to resume.'}), 404
+    data = request.get_json(silent=True) or {}
+    password = data.get('password')
+    if not password and params.get('config_name'):
+        from app import load_configs # Import here to avoid circular import
+        password = load_configs().get(params['config_name'], {}).get('password')
+    if not password:
+        return jsonify({'status': 'error', 'message': 'Password is required to resume the last run.'}), 400
+    params.update(password=password, resume=True)
+    params.pop('saved_at', None)
+    try:
+        job = get_job_manager().submit(params, source='resume')
+        return jsonify({'status': 'started', 'message': f"Resuming last run ({len(params.get('reports', []))} reports).", **job.to_dict()})
+    except Exception as e:
+        import traceback; traceback.print_exc()
+        return jsonify({'status': 'error', 'message': f'Internal Server Error: Failed to resume download process ({e}).'}), 500
+
+@download_bp.route('/api/runs', methods=['GET'])
+@login_required
+def list_runs():
+    """Queued, running and recently finished download runs (newest first)."""
+    manager = get_job_manager()
+    return jsonify({'runs': manager.jobs(), **manager.stats()})
+
+@download_bp.route('/api/runs/<run_id>', methods=['GET'])
+@login_required
+def get_run(run_id):
+    job = get_job_manager().get(run_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': f'Unknown run {run_id}.'}), 404
+    return jsonify(job.to_dict())
+
+@download_bp.route('/api/runs/<run_id>/cancel', methods=['POST'])
+@login_required
+def cancel_run(run_id):
+    """Cancels a queued run, or stops a running one after its current chunk."""
+    job = get_job_manager().cancel(run_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': f'Unknown run {run_id}.'}), 404
+    return jsonify({'status': 'ok', **job.to_dict()})
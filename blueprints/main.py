@@ -13,13 +13,10 @@ def index():
         'emails': 0,
         'system_status': 'Online'
     }
-    # Đếm số lần tải báo cáo từ log
+    # Đếm số lần tải báo cáo từ lịch sử chạy (run_history.py)
     try:
-        import os
-        log_path = os.path.join(os.getcwd(), 'logs', 'download_log.csv')
-        if os.path.exists(log_path):
-            with open(log_path, 'r', encoding='utf-8') as f:
-                stats['downloads'] = sum(1 for _ in f) - 1  # Trừ header
+        from run_history import get_run_history
+        stats['downloads'] = get_run_history().count()
     except Exception:
         pass
     # Đếm số job trong APScheduler
@@ -30,6 +27,7 @@ def index():
         pass
     # Đếm số email đã gửi từ log
     try:
+        import os
         email_log_path = os.path.join(os.getcwd(), 'logs', 'email_log.csv')
         if os.path.exists(email_log_path):
             with open(email_log_path, 'r', encoding='utf-8') as f:
@@ -2,7 +2,9 @@ from flask import Blueprint, render_template, session, redirect, url_for, reques
 from functools import wraps
 from globals import lock
 # Import các hàm này ngay bên trong function sử dụng để tránh circular import
+from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.jobstores.base import JobLookupError
 from datetime import datetime, timedelta
 import time
@@ -23,6 +25,49 @@ def index():
     permissions = session.get('permissions', [])
     return render_template('dl_schedule.html', permissions=permissions)
 
+def build_trigger(data):
+    """
+    Trigger for the posted schedule: 'date' (run_datetime, the default),
+    'cron' (cron expression, e.g. "0 6 * * *") or 'interval' (interval_minutes,
+    optional start_datetime). Returns (trigger, job id prefix) or raises ValueError.
+    """
+    from app import scheduler
+    trigger_type = (data.get('trigger_type') or 'date').lower()
+    if trigger_type == 'date':
+        run_datetime_str = data.get('run_datetime')
+        if not run_datetime_str:
+            raise ValueError('Run date/time required.')
+        try:
+            run_datetime_naive = datetime.fromisoformat(run_datetime_str)
+        except ValueError:
+            raise ValueError('Invalid date/time format (YYYY-MM-DDTHH:MM).')
+        if run_datetime_naive <= datetime.now() + timedelta(seconds=60):
+            raise ValueError('Scheduled time must be > 1 min in the future.')
+        return DateTrigger(run_date=run_datetime_naive, timezone=scheduler.timezone), 'sched'
+    if trigger_type == 'cron':
+        expression = (data.get('cron') or '').strip()
+        if not expression:
+            raise ValueError('Cron expression required (minute hour day month day_of_week, e.g. "0 6 * * *").')
+        try:
+            return CronTrigger.from_crontab(expression, timezone=scheduler.timezone), 'cron'
+        except ValueError as e:
+            raise ValueError(f'Invalid cron expression "{expression}": {e}')
+    if trigger_type == 'interval':
+        try:
+            minutes = int(data.get('interval_minutes') or 0)
+        except (TypeError, ValueError):
+            minutes = 0
+        if minutes < 1:
+            raise ValueError('Interval (minutes) must be a positive number.')
+        start_date = None
+        if data.get('start_datetime'):
+            try:
+                start_date = datetime.fromisoformat(data['start_datetime'])
+            except ValueError:
+                raise ValueError('Invalid start date/time format (YYYY-MM-DDTHH:MM).')
+        return IntervalTrigger(minutes=minutes, start_date=start_date, timezone=scheduler.timezone), 'every'
+    raise ValueError(f'Unknown trigger type "{trigger_type}" (date, cron or interval).')
+
 @schedule_bp.route('/api/schedule-job', methods=['POST'])
 @login_required
 def schedule_job():
@@ -31,27 +76,22 @@ def schedule_job():
         data = request.get_json()
         if not data: return jsonify({'status': 'error', 'message': 'Invalid request: No data.'}), 400
         config_name = data.get('config_name')
-        run_datetime_str = data.get('run_datetime')
         if not config_name: return jsonify({'status': 'error', 'message': 'Configuration name required.'}), 400
-        if not run_datetime_str: return jsonify({'status': 'error', 'message': 'Run date/time required.'}), 400
         configs = load_configs()
         if config_name not in configs:
             return jsonify({'status': 'error', 'message': f'Configuration "{config_name}" not found.'}), 404
-        job_id = f"sched_{config_name.replace(' ','_').lower()}_{int(time.time())}"
         try:
-            run_datetime_naive = datetime.fromisoformat(run_datetime_str)
-            if run_datetime_naive <= datetime.now() + timedelta(seconds=60):
-                return jsonify({'status': 'error', 'message': 'Scheduled time must be > 1 min in the future.'}), 400
-            trigger = DateTrigger(run_date=run_datetime_naive)
-        except ValueError:
-            return jsonify({'status': 'error', 'message': 'Invalid date/time format (YYYY-MM-DDTHH:MM).'}), 400
+            trigger, id_prefix = build_trigger(data)
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        job_id = f"{id_prefix}_{config_name.replace(' ','_').lower()}_{int(time.time())}"
         with lock:
-            scheduler.add_job(
+            job = scheduler.add_job(
                 func=trigger_scheduled_download, trigger=trigger, args=[config_name],
-                id=job_id, name=f"Download: {config_name}", replace_existing=False,
-                misfire_grace_time=600
-            )
-        return jsonify({'status': 'success', 'message': f'Job scheduled for config "{config_name}".', 'job_id': job_id})
+                id=job_id, name=f"Download: {config_name}", replace_existing=False
+            ) # Misfire grace time and coalescing come from the scheduler defaults (scheduler_store.py)
+        next_run = job.next_run_time.isoformat() if getattr(job, 'next_run_time', None) else None
+        return jsonify({'status': 'success', 'message': f'Job scheduled for config "{config_name}".', 'job_id': job_id, 'next_run_time': next_run})
     except Exception as e:
         import traceback; traceback.print_exc()
         return jsonify({'status': 'error', 'message': f'Failed to schedule job: {e}'}), 500
@@ -60,28 +100,28 @@ def schedule_job():
 @login_required
 def get_schedules():
     from app import scheduler
-    jobs_info = []
+    from scheduler_store import get_job_store
     try:
-        with lock:
-            jobs = scheduler.get_jobs()
-            for job in jobs:
-                next_run_iso = None
-                if job.next_run_time:
-                    try:
-                        next_run_iso = job.next_run_time.isoformat()
-                    except Exception as fmt_e:
-                        next_run_iso = str(job.next_run_time)
-                jobs_info.append({
-                    'id': job.id, 'name': job.name,
-                    'next_run_time': next_run_iso,
-                    'trigger': str(job.trigger),
-                    'args': job.args
-                })
+        if scheduler.running:
+            jobs_info = get_job_store().list_jobs() # One indexed query, no unpickling
+        else:
+            jobs_info = [{
+                'id': job.id, 'name': job.name, 'next_run_time': None,
+                'trigger': str(job.trigger), 'args': job.args
+            } for job in scheduler.get_jobs()] # Not started yet: jobs are still pending in memory
         return jsonify({'status': 'success', 'schedules': jobs_info})
     except Exception as e:
         import traceback; traceback.print_exc()
         return jsonify({'status': 'error', 'message': f'Failed to get schedules: {e}'}), 500
 
+@schedule_bp.route('/api/queue', methods=['GET'])
+@login_required
+def get_schedule_queue_state():
+    """Scheduled runs waiting for (or holding) a download slot, with queue depth and wait-time metrics."""
+    from schedule_queue import get_schedule_queue
+    queue = get_schedule_queue()
+    return jsonify({'status': 'success', 'entries': queue.entries(), 'metrics': queue.stats()})
+
 @schedule_bp.route('/api/cancel-schedule/<job_id>', methods=['DELETE'])
 @login_required
 def cancel_schedule(job_id):
@@ -1,36 +1,50 @@
-from flask import Blueprint, Response
-from globals import status_messages, is_running, lock
-import time
+from flask import Blueprint, Response, request
+import config
+from status_broker import get_status_broker
+from job_manager import get_job_manager
 
 sse_bp = Blueprint('sse', __name__, template_folder='../templates')
 
+def format_event(message, seq=None):
+    """One SSE event; multi-line messages become several data: lines."""
+    lines = [f"id: {seq}"] if seq is not None else []
+    lines.extend(f"data: {line}" for line in str(message).splitlines() or [''])
+    return "\n".join(lines) + "\n\n"
+
+def broker_response(broker):
+    """Streams ``broker`` as SSE, resuming after the client's Last-Event-ID."""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    def event_stream():
+        seen_seq = broker.start_seq(last_event_id)
+        yield f"retry: {config.SSE_RETRY_MS}\n\n"
+        while True:
+            messages, skipped, running = broker.read_since(seen_seq, timeout=config.SSE_KEEPALIVE_SECONDS)
+            if skipped:
+                yield format_event(f"WARNING: {skipped} status message(s) were dropped from the buffer before they could be sent.")
+            for seq, message in messages:
+                yield format_event(message, seq)
+                seen_seq = seq
+            if not running and not messages:
+                yield format_event("FINISHED")
+                return
+            if not messages and not skipped:
+                yield ": keepalive\n\n" # Lets proxies and the server notice closed connections
+    return Response(event_stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @sse_bp.route('/stream-status')
 def stream_status():
-    def event_stream():
-        last_yielded_index = 0
-        keep_running = True
-        try:
-            while keep_running:
-                with lock:
-                    current_message_count = len(status_messages)
-                    is_process_active = is_running
-                    messages_to_yield = status_messages[last_yielded_index:current_message_count]
-                if messages_to_yield:
-                    for message in messages_to_yield:
-                        yield f"data: {message}\n\n"
-                    last_yielded_index = current_message_count
-                if not is_process_active and last_yielded_index == current_message_count:
-                    time.sleep(0.1)
-                    with lock:
-                        final_process_check = is_running
-                        final_message_count = len(status_messages)
-                    if not final_process_check and last_yielded_index == final_message_count:
-                        yield f"data: FINISHED\n\n"
-                        keep_running = False
-                        break
-                time.sleep(0.5)
-        except GeneratorExit:
-            keep_running = False
-        finally:
-            pass
-    return Response(event_stream(), mimetype='text/event-stream')
+    """Messages of all runs, each tagged with its run ID."""
+    return broker_response(get_status_broker())
+
+@sse_bp.route('/stream-status/<run_id>')
+def stream_run_status(run_id):
+    """Messages of one run (see job_manager.py)."""
+    job = get_job_manager().get(run_id)
+    if job is None:
+        return Response(format_event(f"ERROR: Unknown run {run_id}.") + format_event("FINISHED"), mimetype='text/event-stream')
+    return broker_response(job.broker)
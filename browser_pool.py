@@ -0,0 +1,267 @@
+# filename: browser_pool.py
+"""
+Process-wide pool of warm, logged-in browsers shared by manual and scheduled runs.
+
+A run leases a WebAutomation for its account instead of starting ChromeDriver
+and logging in from scratch. Browsers are health-checked on lease, closed after
+BROWSER_POOL_IDLE_SECONDS without use, and recycled after
+BROWSER_POOL_MAX_USES leases. ``get_browser_pool().stats()`` exposes lease-wait
+and utilisation metrics.
+"""
+import threading
+import time
+import traceback
+
+import config
+from logic_download import WebAutomation
+from session_store import SessionStore, sign_in
+
+REAPER_INTERVAL = 30 # Seconds between idle-browser sweeps
+
+
+class BrowserLeaseTimeout(RuntimeError):
+    """Raised when no browser becomes available within the lease timeout."""
+    pass
+
+
+class _PooledBrowser:
+    """Book-keeping for one pooled browser."""
+
+    def __init__(self, automation, account, profile_dir):
+        self.automation = automation
+        self.account = account
+        self.profile_dir = profile_dir
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.uses = 0
+        self.in_use = False
+        self.leased_at = None
+
+
+class BrowserLease:
+    """A browser leased from the pool. Call ``release()`` when the run is over."""
+
+    def __init__(self, pool, entry):
+        self._pool = pool
+        self._entry = entry
+        self.automation = entry.automation
+        self._released = False
+
+    def release(self, healthy=True):
+        """Returns the browser to the pool (or closes it when unhealthy / worn out)."""
+        if not self._released:
+            self._released = True
+            self._pool._release(self._entry, healthy)
+
+
+class BrowserPool:
+    """Bounded pool of warm WebAutomation browsers keyed by account."""
+
+    def __init__(self, max_size=None, idle_seconds=None, max_uses=None, session_store=None):
+        self.max_size = max(1, max_size if max_size is not None else config.BROWSER_POOL_SIZE)
+        self.idle_seconds = idle_seconds if idle_seconds is not None else config.BROWSER_POOL_IDLE_SECONDS
+        self.max_uses = max_uses if max_uses is not None else config.BROWSER_POOL_MAX_USES
+        self.session_store = session_store or SessionStore()
+        self._entries = []
+        self._cond = threading.Condition()
+        self._metrics = {
+            'leases': 0, 'warm_leases': 0, 'browsers_started': 0, 'browsers_recycled': 0,
+            'browsers_expired': 0, 'health_check_failures': 0, 'lease_timeouts': 0,
+            'lease_wait_total': 0.0, 'lease_wait_max': 0.0, 'busy_seconds': 0.0,
+        }
+        self._started_at = time.time()
+        self._reaper = threading.Thread(target=self._reap_idle, name="browser-pool-reaper", daemon=True)
+        self._reaper.start()
+
+    # --- Lease / Release ---
+
+    def lease(self, download_folder, login_url, email, password, otp_secret, status_callback=None, timeout=None):
+        """
+        Returns a BrowserLease with a logged-in browser for ``email`` whose downloads
+        go to ``download_folder``. Waits up to ``timeout`` seconds (default
+        BROWSER_POOL_LEASE_TIMEOUT) for a free slot.
+        """
+        log_func = status_callback or print
+        timeout = timeout if timeout is not None else config.BROWSER_POOL_LEASE_TIMEOUT
+        wait_start = time.time()
+        entry, to_close = None, []
+        while True:
+            with self._cond:
+                while True:
+                    entry = self._take_idle(email)
+                    if entry is not None:
+                        break
+                    if len(self._entries) < self.max_size:
+                        break # Free slot: start a new browser below
+                    # Pool full: evict an idle browser of another account if there is one
+                    victim = next((e for e in self._entries if not e.in_use), None)
+                    if victim is not None:
+                        self._entries.remove(victim)
+                        to_close.append(victim)
+                        break
+                    remaining = timeout - (time.time() - wait_start)
+                    if remaining <= 0:
+                        self._metrics['lease_timeouts'] += 1
+                        raise BrowserLeaseTimeout(f"No browser available within {timeout}s (pool size {self.max_size}).")
+                    log_func(f"All {self.max_size} pooled browsers are busy. Waiting for one to be released...")
+                    self._cond.wait(min(remaining, 30))
+                if entry is None:
+                    # Reserve the slot before starting Chrome outside the lock
+                    entry = _PooledBrowser(None, email, None)
+                    entry.in_use = True
+                    self._entries.append(entry)
+            # Health check of a reused browser outside the lock: a hung Chrome must not block the pool
+            if entry.automation is None or entry.automation.is_session_valid():
+                break
+            with self._cond:
+                self._metrics['health_check_failures'] += 1
+                if entry in self._entries:
+                    self._entries.remove(entry)
+                self._cond.notify_all()
+            threading.Thread(target=self._close_entry, args=(entry, "failed health check"), daemon=True).start()
+            entry = None
+
+        with self._cond:
+            waited = time.time() - wait_start
+            self._metrics['leases'] += 1
+            self._metrics['lease_wait_total'] += waited
+            self._metrics['lease_wait_max'] = max(self._metrics['lease_wait_max'], waited)
+            entry.leased_at = time.time()
+
+        for victim in to_close:
+            self._close_entry(victim, "evicted for another account")
+
+        try:
+            if entry.automation is not None:
+                with self._cond:
+                    self._metrics['warm_leases'] += 1
+                log_func(f"Reusing warm browser (use {entry.uses + 1}/{self.max_uses}, idle {int(time.time() - entry.last_used)}s).")
+                entry.automation.retarget(download_folder, status_callback=log_func)
+                if entry.automation.probe_session(login_url, status_callback=log_func):
+                    return BrowserLease(self, entry)
+                log_func("Warm browser is no longer logged in. Signing in again...")
+            else:
+                entry.profile_dir = self.session_store.acquire_profile(email)
+                log_func("Starting a new pooled browser...")
+                entry.automation = WebAutomation(config.DRIVER_PATH, download_folder, status_callback=log_func, profile_dir=entry.profile_dir)
+                with self._cond:
+                    self._metrics['browsers_started'] += 1
+            if not sign_in(entry.automation, login_url, email, password, otp_secret, store=self.session_store, status_callback=log_func):
+                raise RuntimeError("Login failed after multiple attempts. Cannot proceed.")
+            return BrowserLease(self, entry)
+        except BaseException:
+            self._release(entry, healthy=False)
+            raise
+
+    def _take_idle(self, account):
+        """Reserves an idle browser for ``account`` (lock held); the caller checks its health."""
+        for entry in self._entries:
+            if not entry.in_use and entry.account == account:
+                entry.in_use = True
+                return entry
+        return None
+
+    def _release(self, entry, healthy):
+        close_reason = None
+        with self._cond:
+            if entry.leased_at:
+                self._metrics['busy_seconds'] += time.time() - entry.leased_at
+                entry.leased_at = None
+            entry.uses += 1
+            entry.last_used = time.time()
+            entry.in_use = False
+            if entry.automation is None or not healthy:
+                close_reason = "unhealthy"
+            elif entry.uses >= self.max_uses:
+                close_reason = f"reached {self.max_uses} uses"
+                self._metrics['browsers_recycled'] += 1
+            if close_reason and entry in self._entries:
+                self._entries.remove(entry)
+            self._cond.notify_all()
+        if close_reason:
+            self._close_entry(entry, close_reason)
+        elif entry.automation is not None:
+            entry.automation.retarget(entry.automation.download_folder, status_callback=None)
+
+    def _close_entry(self, entry, reason):
+        if entry.automation is not None:
+            print(f"Browser pool: closing browser for '{entry.account}' ({reason}).")
+            try:
+                entry.automation.close()
+            except Exception:
+                traceback.print_exc()
+        self.session_store.release_profile(entry.profile_dir)
+
+    # --- Maintenance ---
+
+    def _reap_idle(self):
+        while True:
+            time.sleep(REAPER_INTERVAL)
+            expired = []
+            with self._cond:
+                now = time.time()
+                for entry in list(self._entries):
+                    if not entry.in_use and now - entry.last_used > self.idle_seconds:
+                        self._entries.remove(entry)
+                        expired.append(entry)
+                        self._metrics['browsers_expired'] += 1
+                if expired:
+                    self._cond.notify_all()
+            for entry in expired:
+                self._close_entry(entry, f"idle for more than {self.idle_seconds}s")
+
+    def close_all(self):
+        """Closes every idle browser (used at shutdown)."""
+        with self._cond:
+            idle = [e for e in self._entries if not e.in_use]
+            for entry in idle:
+                self._entries.remove(entry)
+        for entry in idle:
+            self._close_entry(entry, "shutdown")
+
+    def stats(self):
+        """Returns pool size, utilisation and lease-wait metrics."""
+        with self._cond:
+            in_use = sum(1 for e in self._entries if e.in_use)
+            metrics = dict(self._metrics)
+            now = time.time()
+            busy = metrics.pop('busy_seconds') + sum(now - e.leased_at for e in self._entries if e.leased_at)
+            browsers = [{
+                'account': e.account, 'in_use': e.in_use, 'uses': e.uses,
+                'age_seconds': int(now - e.created_at), 'idle_seconds': 0 if e.in_use else int(now - e.last_used),
+            } for e in self._entries]
+        leases = metrics['leases']
+        capacity_seconds = max(1e-9, (now - self._started_at) * self.max_size)
+        return {
+            'max_size': self.max_size,
+            'size': len(browsers),
+            'in_use': in_use,
+            'idle': len(browsers) - in_use,
+            'utilisation_now': round(in_use / self.max_size, 3),
+            'utilisation_avg': round(busy / capacity_seconds, 4),
+            'lease_wait_avg_ms': round(metrics.pop('lease_wait_total') / leases * 1000, 1) if leases else 0.0,
+            'lease_wait_max_ms': round(metrics.pop('lease_wait_max') * 1000, 1),
+            'browsers': browsers,
+            **{k: v for k, v in metrics.items() if k not in ('lease_wait_total', 'lease_wait_max')},
+        }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_browser_pool():
+    """Returns the process-wide BrowserPool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool()
+        return _pool
+
+
+def shutdown_browser_pool():
+    """Closes the idle pooled browsers, if the pool was ever started."""
+    with _pool_lock:
+        pool = _pool
+    if pool is not None:
+        pool.close_all()
@@ -0,0 +1,178 @@
+# filename: cdp_downloads.py
+"""
+Chrome DevTools (CDP) download tracking for WebAutomation.
+
+Every export is sent to its own empty target directory with
+``Browser.setDownloadBehavior``. When Selenium's CDP connection is available
+(``driver.bidi_connection()``, needs trio) the tracker also listens for
+``Browser.downloadWillBegin`` / ``Browser.downloadProgress`` events, so the
+finished file name (GUID -> suggested filename) and final byte count are
+known without scanning the download folder.
+"""
+import os
+import threading
+import time
+import traceback
+
+from download_watcher import wait_for_new_file
+
+EVENT_STARTUP_TIMEOUT = 30 # Seconds to wait for the CDP event listener to start
+
+
+def _state_value(state):
+    """DownloadProgress.state is an enum in some devtools versions, a str in others."""
+    return getattr(state, 'value', state)
+
+
+class CdpDownloadTracker:
+    """Routes each download to a per-chunk directory and tracks it via CDP events."""
+
+    def __init__(self, driver, status_callback=None):
+        self.driver = driver
+        self._status_callback = status_callback
+        self._cond = threading.Condition()
+        self._downloads = {} # guid -> {'filename', 'total_bytes', 'received_bytes', 'state'}
+        self._target_dir = None
+        self._ready = threading.Event()
+        self._session = None
+        self._devtools = None
+        self._trio_token = None
+        self._stop_event = None
+        self._thread = None
+        self.events_enabled = False
+        self._start_listener()
+
+    def _log(self, message):
+        if self._status_callback:
+            self._status_callback(message)
+        else:
+            print(message)
+
+    # --- Event Listener ---
+
+    def _start_listener(self):
+        try:
+            import trio # type: ignore # noqa: F401
+        except ImportError:
+            self._log("CDP download events unavailable (trio not installed). Using per-chunk folder detection.")
+            return
+        self._thread = threading.Thread(target=self._run_listener, name="cdp-download-events", daemon=True)
+        self._thread.start()
+        self._ready.wait(EVENT_STARTUP_TIMEOUT)
+        self.events_enabled = self._session is not None
+        if not self.events_enabled:
+            self._log("CDP download events unavailable. Using per-chunk folder detection.")
+
+    def _run_listener(self):
+        import trio # type: ignore
+        try:
+            trio.run(self._listen)
+        except Exception as e:
+            self._log(f"Warning: CDP download event listener stopped: {type(e).__name__} - {e}")
+            traceback.print_exc()
+        finally:
+            self._session = None
+            self.events_enabled = False
+            self._ready.set()
+            with self._cond:
+                self._cond.notify_all()
+
+    async def _listen(self):
+        import trio # type: ignore
+        async with self.driver.bidi_connection() as connection:
+            session, devtools = connection.session, connection.devtools
+            self._stop_event = trio.Event()
+            self._trio_token = trio.lowlevel.current_trio_token()
+            async with trio.open_nursery() as nursery:
+                nursery.start_soon(self._consume_will_begin, session.listen(devtools.browser.DownloadWillBegin))
+                nursery.start_soon(self._consume_progress, session.listen(devtools.browser.DownloadProgress))
+                self._session, self._devtools = session, devtools
+                self._ready.set()
+                await self._stop_event.wait()
+                nursery.cancel_scope.cancel()
+
+    async def _consume_will_begin(self, receiver):
+        async for event in receiver:
+            with self._cond:
+                info = self._downloads.setdefault(event.guid, {})
+                info['filename'] = event.suggested_filename
+                info.setdefault('state', 'inProgress')
+                self._cond.notify_all()
+
+    async def _consume_progress(self, receiver):
+        async for event in receiver:
+            with self._cond:
+                info = self._downloads.setdefault(event.guid, {})
+                info['total_bytes'] = int(event.total_bytes or 0)
+                info['received_bytes'] = int(event.received_bytes or 0)
+                info['state'] = _state_value(event.state)
+                self._cond.notify_all()
+
+    # --- Public API ---
+
+    def set_target(self, target_dir):
+        """Sends the next download(s) to ``target_dir`` and resets tracked state."""
+        os.makedirs(target_dir, exist_ok=True)
+        with self._cond:
+            self._downloads.clear()
+            self._target_dir = target_dir
+        if self.events_enabled:
+            import trio # type: ignore
+            command = self._devtools.browser.set_download_behavior(
+                behavior='allow', download_path=target_dir, events_enabled=True
+            )
+            trio.from_thread.run(self._session.execute, command, trio_token=self._trio_token)
+        else:
+            self.driver.execute_cdp_cmd('Browser.setDownloadBehavior', {'behavior': 'allow', 'downloadPath': target_dir})
+
+    def wait(self, timeout, log_func=None):
+        """
+        Waits for the download sent to the current target directory to finish.
+        Returns ``(file_name, total_bytes)`` or ``(None, 0)`` on timeout/cancel.
+        """
+        log_func = log_func or self._log
+        target_dir = self._target_dir
+        if not self.events_enabled:
+            # Target directory is empty, so the folder scan is O(1) per check
+            name = wait_for_new_file(target_dir, set(), timeout, log_func)
+            return name, (os.path.getsize(os.path.join(target_dir, name)) if name else 0)
+
+        deadline = time.time() + timeout
+        last_log = 0
+        with self._cond:
+            while True:
+                for guid, info in self._downloads.items():
+                    state = info.get('state')
+                    if state == 'completed' and info.get('filename'):
+                        total = info.get('total_bytes') or info.get('received_bytes') or 0
+                        log_func(f"CDP: download {guid} completed ({info['filename']}, {total} bytes).")
+                        return info['filename'], total
+                    if state == 'canceled':
+                        log_func(f"CDP: download {guid} was canceled.")
+                        return None, 0
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None, 0
+                if not self.events_enabled:
+                    # Listener died mid-wait: finish with folder detection
+                    break
+                now = time.time()
+                if now - last_log > 10:
+                    for info in self._downloads.values():
+                        if info.get('state') == 'inProgress':
+                            log_func(f"Download in progress ({info.get('filename', '?')}): {info.get('received_bytes', 0)}/{info.get('total_bytes', 0)} bytes...")
+                    last_log = now
+                self._cond.wait(min(remaining, 5))
+        name = wait_for_new_file(target_dir, set(), max(0, deadline - time.time()), log_func)
+        return name, (os.path.getsize(os.path.join(target_dir, name)) if name else 0)
+
+    def close(self):
+        """Stops the event listener thread."""
+        if self._stop_event is not None and self._trio_token is not None and self.events_enabled:
+            try:
+                import trio # type: ignore
+                trio.from_thread.run_sync(self._stop_event.set, trio_token=self._trio_token)
+            except Exception:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout=5)
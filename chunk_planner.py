@@ -0,0 +1,185 @@
+# filename: chunk_planner.py
+"""
+Adaptive chunk sizing for chunk_size 'auto'.
+
+``ChunkCostModel`` learns, per report (cost key), how many export seconds and
+bytes one day of data costs, from every chunk downloaded in past runs
+(exponentially weighted, persisted to CHUNK_COST_MODEL_PATH).
+
+``AdaptiveChunkPlanner`` turns that into chunk lengths that keep each export
+under CHUNK_TARGET_SECONDS (and CHUNK_MAX_BYTES), and re-sizes the remaining
+chunks of a run after every observed chunk: fast chunks grow the next one,
+slow or failed chunks shrink it.
+
+``bisect_range`` splits a failed chunk in half so it can be retried in
+smaller pieces (down to CHUNK_BISECT_MIN_DAYS).
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import config
+
+EWMA_ALPHA = 0.3 # Weight of the newest observation
+MAX_GROWTH = 2.0 # Next chunk is at most this many times longer ...
+MAX_SHRINK = 0.25 # ... or at least this fraction of the previous one
+
+
+def span_days(from_date, to_date):
+    """Inclusive number of days between two 'YYYY-MM-DD' dates."""
+    return (datetime.strptime(to_date, '%Y-%m-%d') - datetime.strptime(from_date, '%Y-%m-%d')).days + 1
+
+
+def bisect_range(from_date, to_date, min_days=1):
+    """
+    Splits a failed chunk into two halves for retrying.
+    Returns [(from, mid), (mid + 1, to)], or None when a half would be shorter than ``min_days``.
+    """
+    days = span_days(from_date, to_date)
+    first_days = days // 2
+    if first_days < max(1, min_days):
+        return None
+    mid = datetime.strptime(from_date, '%Y-%m-%d') + timedelta(days=first_days - 1)
+    return [(from_date, mid.strftime('%Y-%m-%d')), ((mid + timedelta(days=1)).strftime('%Y-%m-%d'), to_date)]
+
+
+def cost_key(report_url, method_name, region=None, engine='browser'):
+    """Identifies a report variant (and export engine) in the cost model."""
+    key = f"{engine}|{method_name}|{report_url}"
+    return f"{key}|{region}" if region is not None else key
+
+
+class ChunkCostModel:
+    """Per-report export cost (seconds/day, bytes/day), persisted as JSON."""
+
+    def __init__(self, path=None):
+        self.path = path or config.CHUNK_COST_MODEL_PATH
+        self._lock = threading.Lock()
+        self._costs = self._load()
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read chunk cost model {self.path}: {e}")
+            return {}
+
+    def _save(self):
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._costs, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Warning: Could not save chunk cost model {self.path}: {e}")
+
+    def estimate(self, key):
+        """Returns {'seconds_per_day', 'bytes_per_day', 'samples'} or None if unknown."""
+        with self._lock:
+            entry = self._costs.get(key)
+            return dict(entry) if entry else None
+
+    def record(self, key, days, seconds, size_bytes):
+        """Adds one successful chunk export of ``days`` days to the model."""
+        if days <= 0:
+            return None
+        seconds_per_day = max(0.0, seconds - config.CHUNK_FIXED_OVERHEAD_SECONDS) / days
+        bytes_per_day = max(0, size_bytes) / days
+        with self._lock:
+            entry = self._costs.get(key)
+            if entry:
+                entry['seconds_per_day'] += EWMA_ALPHA * (seconds_per_day - entry['seconds_per_day'])
+                entry['bytes_per_day'] += EWMA_ALPHA * (bytes_per_day - entry['bytes_per_day'])
+                entry['samples'] += 1
+            else:
+                entry = {'seconds_per_day': seconds_per_day, 'bytes_per_day': bytes_per_day, 'samples': 1}
+                self._costs[key] = entry
+            entry['updated_at'] = time.time()
+            self._save()
+            return dict(entry)
+
+
+class AdaptiveChunkPlanner:
+    """Chooses chunk lengths for one report download from the cost model."""
+
+    def __init__(self, key, model=None, fallback_days=None, log_func=None):
+        self.key = key
+        self.model = model or get_cost_model()
+        self.target_seconds = config.CHUNK_TARGET_SECONDS
+        self.min_days = max(1, config.CHUNK_MIN_DAYS)
+        self.max_days = max(self.min_days, config.CHUNK_MAX_DAYS)
+        self._log = log_func or print
+        self.days = self._days_from_model(self.model.estimate(key), fallback_days or config.CHUNK_AUTO_DEFAULT_DAYS)
+
+    def _clamp(self, days):
+        return int(max(self.min_days, min(self.max_days, days)))
+
+    def _days_from_model(self, estimate, fallback_days):
+        if not estimate:
+            return self._clamp(fallback_days)
+        budget = max(1.0, self.target_seconds - config.CHUNK_FIXED_OVERHEAD_SECONDS)
+        limits = [self.max_days]
+        if estimate['seconds_per_day'] > 0:
+            limits.append(budget / estimate['seconds_per_day'])
+        if config.CHUNK_MAX_BYTES and estimate['bytes_per_day'] > 0:
+            limits.append(config.CHUNK_MAX_BYTES / estimate['bytes_per_day'])
+        return self._clamp(min(limits))
+
+    def describe(self):
+        estimate = self.model.estimate(self.key)
+        if not estimate:
+            return f"no history yet, starting with {self.days}-day chunks"
+        return (f"{estimate['seconds_per_day']:.1f}s and {estimate['bytes_per_day'] / 1024:.0f} KB per day "
+                f"over {estimate['samples']} past chunks -> {self.days}-day chunks (target {self.target_seconds}s)")
+
+    def split(self, start_date, end_date):
+        """Splits the remaining range into chunks of the current length."""
+        start = datetime.strptime(start_date, '%Y-%m-%d')
+        end = datetime.strptime(end_date, '%Y-%m-%d')
+        ranges = []
+        while start <= end:
+            chunk_end = min(start + timedelta(days=self.days - 1), end)
+            ranges.append((start.strftime('%Y-%m-%d'), chunk_end.strftime('%Y-%m-%d')))
+            start = chunk_end + timedelta(days=1)
+        return ranges
+
+    def observe(self, from_date, to_date, seconds, size_bytes, ok):
+        """
+        Feeds back one finished chunk and re-sizes the next ones.
+        Returns True when the chunk length changed.
+        """
+        days = span_days(from_date, to_date)
+        previous = self.days
+        if ok:
+            estimate = self.model.record(self.key, days, seconds, size_bytes)
+            # The long-term average lags behind the current run: size from whichever is costlier
+            estimate['seconds_per_day'] = max(estimate['seconds_per_day'], max(0.0, seconds - config.CHUNK_FIXED_OVERHEAD_SECONDS) / days)
+            estimate['bytes_per_day'] = max(estimate['bytes_per_day'], max(0, size_bytes) / days)
+            proposed = self._days_from_model(estimate, previous)
+        else:
+            proposed = days / 2
+        proposed = max(previous * MAX_SHRINK, min(previous * MAX_GROWTH, proposed))
+        self.days = self._clamp(proposed)
+        if self.days != previous:
+            reason = f"took {seconds:.0f}s for {days} days" if ok else "failed"
+            self._log(f"Adaptive chunking: last chunk {reason}; chunk length {previous} -> {self.days} days.")
+            return True
+        return False
+
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_cost_model():
+    """Returns the process-wide ChunkCostModel."""
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = ChunkCostModel()
+        return _model
@@ -0,0 +1,199 @@
+# filename: coalesce.py
+"""
+Request coalescing across overlapping configs and concurrent runs.
+
+``merge_report_entries`` folds report entries of one run that ask for the
+same report with overlapping (or adjacent) date ranges into their union, so
+each day is requested once per run.
+
+``ChunkCoalescer`` is a process-wide single-flight registry of chunk exports,
+keyed by (report URL, setup variant, region). Before a chunk is exported, any
+export of a sub-range that another run has in flight (or finished within
+COALESCE_RETAIN_SECONDS) is awaited and its file handed to the requester; only
+the remaining gaps are exported. A manual run and a scheduled job back-filling
+the same month therefore drive each export once.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+import config
+
+
+def _parse(date_str):
+    return datetime.strptime(date_str, '%Y-%m-%d')
+
+
+def _fmt(day):
+    return day.strftime('%Y-%m-%d')
+
+
+def subtract_ranges(from_date, to_date, taken):
+    """Gaps of [from_date, to_date] not covered by the (from, to) ranges in ``taken``."""
+    gaps = []
+    cursor = _parse(from_date)
+    end = _parse(to_date)
+    for taken_from, taken_to in sorted(taken):
+        taken_start = _parse(taken_from)
+        if taken_start > cursor:
+            gaps.append((_fmt(cursor), _fmt(min(end, taken_start - timedelta(days=1)))))
+        cursor = max(cursor, _parse(taken_to) + timedelta(days=1))
+        if cursor > end:
+            break
+    if cursor <= end:
+        gaps.append((_fmt(cursor), _fmt(end)))
+    return gaps
+
+
+def merge_report_entries(reports, log_func=None):
+    """
+    Merges report entries of the same report type (and engine) whose fixed
+    date ranges overlap or touch. Entries with relative dates (resolved at run
+    time) are kept as they are. Returns the new list of entries.
+    """
+    log = log_func or print
+    groups = {}
+    merged = []
+    for entry in reports:
+        try:
+            start, end = _parse(entry.get('from_date')), _parse(entry.get('to_date'))
+        except (TypeError, ValueError):
+            merged.append(entry) # Relative or invalid dates: handled by the download loop
+            continue
+        key = (entry.get('report_type'), (entry.get('engine') or '').lower())
+        if key not in groups:
+            groups[key] = []
+            merged.append(key) # Placeholder keeps the first entry's position
+        groups[key].append((start, end, entry))
+
+    result = []
+    for item in merged:
+        if not isinstance(item, tuple):
+            result.append(item)
+            continue
+        spans = sorted(groups[item], key=lambda span: span[0])
+        requested_days = sum((end - start).days + 1 for start, end, _ in spans)
+        unions = []
+        for start, end, entry in spans:
+            if unions and start <= unions[-1][1] + timedelta(days=1):
+                unions[-1][1] = max(unions[-1][1], end)
+            else:
+                unions.append([start, end, entry])
+        union_days = sum((end - start).days + 1 for start, end, _ in unions)
+        if requested_days > union_days:
+            log(f"Coalesced overlapping entries of '{item[0]}': {requested_days} requested days -> {union_days} unique days.")
+        result.extend(dict(entry, from_date=_fmt(start), to_date=_fmt(end)) for start, end, entry in unions)
+    return result
+
+
+class Flight:
+    """One chunk export in progress (or recently finished) by some run."""
+
+    def __init__(self, key, from_date, to_date, owner):
+        self.key = key
+        self.from_date = from_date
+        self.to_date = to_date
+        self.owner = owner
+        self.started_at = time.time()
+        self.finished_at = None
+        self.done = threading.Event()
+        self.ok = False
+        self.file_path = None
+        self.suffix = ""
+
+    def inside(self, from_date, to_date):
+        return from_date <= self.from_date and self.to_date <= to_date
+
+
+class ChunkCoalescer:
+    """Single-flight registry that lets concurrent runs share chunk exports."""
+
+    def __init__(self, retain_seconds=None, wait_timeout=None):
+        self.retain_seconds = config.COALESCE_RETAIN_SECONDS if retain_seconds is None else retain_seconds
+        self.wait_timeout = config.COALESCE_WAIT_TIMEOUT if wait_timeout is None else wait_timeout
+        self._lock = threading.Lock()
+        self._flights = {} # key -> [Flight]
+        self.counters = {'leads': 0, 'borrowed_chunks': 0, 'borrowed_days': 0, 'waits': 0, 'wait_seconds': 0.0}
+
+    def _prune(self, key):
+        now = time.time()
+        self._flights[key] = [
+            f for f in self._flights.get(key, [])
+            if not f.done.is_set() or (f.ok and now - f.finished_at < self.retain_seconds)
+        ]
+
+    def claim(self, key, from_date, to_date, owner, allow_partial=True):
+        """
+        Plans one chunk for ``owner``. Returns (flight, borrowed, gaps):
+        - flight: a new Flight the caller now leads (must be passed to finish()),
+          or None when exports of other runs were borrowed;
+        - borrowed: finished Flights (non-overlapping, inside the chunk) whose
+          files the caller should adopt;
+        - gaps: the (from, to) ranges the caller still has to export itself.
+        Without ``allow_partial`` only a flight of exactly this range is shared.
+        """
+        deadline = time.time() + self.wait_timeout
+        while True:
+            with self._lock:
+                self._prune(key)
+                candidates = [
+                    f for f in self._flights[key]
+                    if f.inside(from_date, to_date) and (allow_partial or (f.from_date, f.to_date) == (from_date, to_date))
+                ]
+                pending = [f for f in candidates if not f.done.is_set()]
+                ready = [f for f in candidates if f.done.is_set() and f.ok and f.file_path]
+                if not pending and not ready:
+                    flight = Flight(key, from_date, to_date, owner)
+                    self._flights[key].append(flight)
+                    self.counters['leads'] += 1
+                    return flight, [], [(from_date, to_date)]
+                if not pending or time.time() >= deadline:
+                    borrowed, last_to = [], None
+                    for f in sorted(ready, key=lambda f: (f.from_date, f.to_date)):
+                        if last_to is None or f.from_date > last_to:
+                            borrowed.append(f)
+                            last_to = f.to_date
+                    if borrowed:
+                        self.counters['borrowed_chunks'] += len(borrowed)
+                        self.counters['borrowed_days'] += sum((_parse(f.to_date) - _parse(f.from_date)).days + 1 for f in borrowed)
+                        return None, borrowed, subtract_ranges(from_date, to_date, [(f.from_date, f.to_date) for f in borrowed])
+                    if time.time() >= deadline:
+                        # Waited long enough for the other run: export it ourselves
+                        flight = Flight(key, from_date, to_date, owner)
+                        self._flights[key].append(flight)
+                        self.counters['leads'] += 1
+                        return flight, [], [(from_date, to_date)]
+                    continue
+                self.counters['waits'] += 1
+                waiting_for = pending[0]
+            wait_started = time.time()
+            waiting_for.done.wait(max(0.0, deadline - wait_started))
+            with self._lock:
+                self.counters['wait_seconds'] += time.time() - wait_started
+
+    def finish(self, flight, ok, file_path=None, suffix=""):
+        """Publishes the outcome of a led flight and wakes up runs waiting for it."""
+        with self._lock:
+            flight.ok = bool(ok and file_path)
+            flight.file_path = file_path
+            flight.suffix = suffix or ""
+            flight.finished_at = time.time()
+            flight.done.set()
+
+    def stats(self):
+        with self._lock:
+            in_flight = sum(1 for flights in self._flights.values() for f in flights if not f.done.is_set())
+            return dict(self.counters, in_flight=in_flight, retain_seconds=self.retain_seconds)
+
+
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+
+def get_coalescer():
+    """Returns the process-wide ChunkCoalescer."""
+    global _coalescer
+    with _coalescer_lock:
+        if _coalescer is None:
+            _coalescer = ChunkCoalescer()
+        return _coalescer
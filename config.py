@@ -25,7 +25,8 @@ import os
 
 # --- Required Configuration ---
 # Load from environment variables first, then fallback to hardcoded (unsafe) example
-OTP_SECRET = os.getenv('OTP_SECRET', 'TAPHLYTABSKHTZWM') # <-- REPLACE or set ENV VAR
+EXAMPLE_OTP_SECRET = 'TAPHLYTABSKHTZWM' # Publicly known example value, never a real secret
+OTP_SECRET = os.getenv('OTP_SECRET', EXAMPLE_OTP_SECRET) # <-- REPLACE or set ENV VAR
 DRIVER_PATH = os.getenv('CHROMEDRIVER_PATH', os.path.abspath('chromedriver.exe')) # Verify path or set ENV VAR
 DOWNLOAD_BASE_PATH = os.getenv('DOWNLOAD_PATH', os.path.abspath(r"D:\OneDrive\KT\Checking")) # Verify path or set ENV VAR
 
@@ -41,9 +42,167 @@ REGION_REQUIRED_REPORT_URLS = [
     # Add other report URLs here if they need region selection
 ]
 
+# --- Parallel Download Configuration ---
+# Number of browser workers (each with its own login and download folder) used
+# to process date chunks in parallel. 1 keeps the original sequential behaviour.
+DOWNLOAD_WORKERS = int(os.getenv('DOWNLOAD_WORKERS', '1'))
+# Maximum number of concurrent exports for the same region when region reports
+# (e.g. FAF030) are fanned out across the workers.
+REGION_MAX_CONCURRENCY = int(os.getenv('REGION_MAX_CONCURRENCY', '1'))
+
+# --- Download Completion Detection ---
+# 'auto' uses inotify on Linux and falls back to folder polling elsewhere;
+# 'inotify' or 'polling' force a backend.
+DOWNLOAD_WATCHER = os.getenv('DOWNLOAD_WATCHER', 'auto')
+# Route every export to its own folder via Chrome DevTools and track it with
+# Browser.downloadWillBegin / Browser.downloadProgress events ('0' to disable).
+CDP_DOWNLOAD_TRACKING = os.getenv('CDP_DOWNLOAD_TRACKING', '1') == '1'
+
+# --- Export Engine ---
+# Default engine for reports without an explicit "engine" entry in their config:
+# 'browser' drives Chrome for every chunk, 'http' logs in with Chrome once and
+# replays the ASP.NET export postback with a pooled HTTP session.
+DEFAULT_EXPORT_ENGINE = os.getenv('DEFAULT_EXPORT_ENGINE', 'browser')
+
+# --- Saved Login Sessions ---
+# Encrypted cookie cache + Chrome profiles per account, so runs can skip the
+# email/password/OTP login while the BI session is still valid.
+SESSION_STORE_PATH = os.getenv('SESSION_STORE_PATH', os.path.abspath('session_store'))
+# Key used to encrypt saved cookies. Cookies are only saved when SESSION_STORE_KEY is set
+# (and is not the example OTP secret).
+SESSION_STORE_KEY = os.getenv('SESSION_STORE_KEY', '')
+SESSION_MAX_AGE_HOURS = float(os.getenv('SESSION_MAX_AGE_HOURS', '12'))
+SESSION_PROFILE_ENABLED = os.getenv('SESSION_PROFILE_ENABLED', '1') == '1'
+
+# --- Warm Browser Pool ---
+# Logged-in browsers kept alive between manual and scheduled runs (browser_pool.py).
+BROWSER_POOL_ENABLED = os.getenv('BROWSER_POOL_ENABLED', '1') == '1'
+BROWSER_POOL_SIZE = int(os.getenv('BROWSER_POOL_SIZE', '2'))
+BROWSER_POOL_IDLE_SECONDS = int(os.getenv('BROWSER_POOL_IDLE_SECONDS', '1800')) # Close browsers idle this long
+BROWSER_POOL_MAX_USES = int(os.getenv('BROWSER_POOL_MAX_USES', '20')) # Recycle a browser after this many runs
+BROWSER_POOL_LEASE_TIMEOUT = int(os.getenv('BROWSER_POOL_LEASE_TIMEOUT', '600')) # Max wait for a free browser
+
+# --- Browser Profile ---
+# 'standard': headed Chrome loading everything (original behaviour).
+# 'lean': headless with a fixed viewport; images, fonts and analytics are
+# blocked with CDP Network.setBlockedURLs. Compare with benchmarks/bench_page_load.py.
+BROWSER_PROFILE = os.getenv('BROWSER_PROFILE', 'standard').lower()
+LEAN_WINDOW_SIZE = os.getenv('LEAN_WINDOW_SIZE', '1920,1080')
+LEAN_BLOCKED_URL_PATTERNS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico', '*.bmp',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*',
+    '*facebook.net*', '*hotjar.com*', '*clarity.ms*',
+]
+# Stylesheets are kept by default: the Telerik date pickers and region tree
+# rely on them to show the elements that are clicked.
+LEAN_BLOCK_CSS = os.getenv('LEAN_BLOCK_CSS', '0') == '1'
+
+# --- Adaptive Chunk Sizing (chunk_size 'auto', see chunk_planner.py) ---
+CHUNK_COST_MODEL_PATH = os.getenv('CHUNK_COST_MODEL_PATH', os.path.abspath('chunk_costs.json'))
+CHUNK_TARGET_SECONDS = int(os.getenv('CHUNK_TARGET_SECONDS', '600')) # Aim for exports of about 10 minutes
+CHUNK_MAX_BYTES = int(os.getenv('CHUNK_MAX_BYTES', str(300 * 1024 * 1024))) # 0 = no size cap
+CHUNK_FIXED_OVERHEAD_SECONDS = int(os.getenv('CHUNK_FIXED_OVERHEAD_SECONDS', '20')) # Page load + form setup per chunk
+CHUNK_MIN_DAYS = int(os.getenv('CHUNK_MIN_DAYS', '1'))
+CHUNK_MAX_DAYS = int(os.getenv('CHUNK_MAX_DAYS', '92'))
+CHUNK_AUTO_DEFAULT_DAYS = int(os.getenv('CHUNK_AUTO_DEFAULT_DAYS', '5')) # Used until a report has history
+# Failed or timed-out chunks are split in half and retried, recursively down to this many days
+CHUNK_BISECT_ON_FAILURE = os.getenv('CHUNK_BISECT_ON_FAILURE', '1') == '1'
+CHUNK_BISECT_MIN_DAYS = int(os.getenv('CHUNK_BISECT_MIN_DAYS', '1'))
+
+# --- Resumable Runs (run_ledger.py) ---
+CHUNK_LEDGER_PATH = os.getenv('CHUNK_LEDGER_PATH', os.path.abspath('chunk_ledger.jsonl'))
+LAST_RUN_PATH = os.getenv('LAST_RUN_PATH', os.path.abspath('last_run.json'))
+# from_date 'since_last_success' without ledger history (and no initial_from_date) fetches this many days up to to_date
+INCREMENTAL_FIRST_RUN_DAYS = int(os.getenv('INCREMENTAL_FIRST_RUN_DAYS', '7'))
+
+# --- Export Result Cache (export_cache.py) ---
+# Finished exports of closed days are kept once per content hash and reused by
+# any config that asks for the same report, variant, region and date range.
+EXPORT_CACHE_ENABLED = os.getenv('EXPORT_CACHE_ENABLED', '1') == '1'
+EXPORT_CACHE_PATH = os.getenv('EXPORT_CACHE_PATH', os.path.abspath('export_cache'))
+EXPORT_CACHE_MAX_BYTES = int(os.getenv('EXPORT_CACHE_MAX_BYTES', str(5 * 1024 * 1024 * 1024))) # LRU eviction above this; 0 = unbounded
+EXPORT_CACHE_MUTABLE_DAYS = int(os.getenv('EXPORT_CACHE_MUTABLE_DAYS', '3')) # Chunks ending in the last N days are always re-fetched
+EXPORT_CACHE_LINK_MODE = os.getenv('EXPORT_CACHE_LINK_MODE', 'hardlink') # 'hardlink' (falls back to copy) or 'copy'
+
+# --- Request Coalescing (coalesce.py) ---
+# Concurrent runs asking for the same report, region and days share one export.
+COALESCE_ENABLED = os.getenv('COALESCE_ENABLED', '1') == '1'
+COALESCE_RETAIN_SECONDS = int(os.getenv('COALESCE_RETAIN_SECONDS', '900')) # Finished exports stay shareable this long
+COALESCE_WAIT_TIMEOUT = int(os.getenv('COALESCE_WAIT_TIMEOUT', '1800')) # Max wait for another run's export before fetching it ourselves
+
+# --- Download Plan (download_plan.py) ---
+PLAN_DEFAULT_CHUNK_SECONDS = int(os.getenv('PLAN_DEFAULT_CHUNK_SECONDS', '90')) # Estimate per chunk when the cost model has no history
+
+# --- Page-State Reuse ---
+# Consecutive chunks of the same report (and setup variant / region) reuse the
+# loaded report page: only the dates are re-entered before the next export.
+PAGE_REUSE_ENABLED = os.getenv('PAGE_REUSE_ENABLED', '1') == '1'
+
+# --- Combined Region Export (region_split.py) ---
+# Ticks all selected regions in one export and splits the file locally per region.
+REGION_COMBINED_EXPORT = os.getenv('REGION_COMBINED_EXPORT', '0') == '1'
+REGION_SPLIT_COLUMN = os.getenv('REGION_SPLIT_COLUMN', 'Vùng') # Header of the region column in the export
+REGION_SPLIT_ALIASES = os.getenv('REGION_SPLIT_ALIASES', '') # JSON map of column values to region names, e.g. {"Ho Chi Minh": "HCM"}
+REGION_SPLIT_KEEP_COMBINED = os.getenv('REGION_SPLIT_KEEP_COMBINED', '0') == '1' # Keep the combined file next to the split files
+
+# --- Region Tree Discovery (region_tree.py) ---
+# Regions are read from the page's department tree (cached on disk) instead of fixed XPaths.
+REGION_TREE_DISCOVERY = os.getenv('REGION_TREE_DISCOVERY', '1') == '1'
+REGION_TREE_SELECTOR = os.getenv('REGION_TREE_SELECTOR', "[id^='ctl00_MainContent_TreeShopThuoc1'] .RadTreeView") # CSS selector of the tree
+REGION_TREE_DEPTH = int(os.getenv('REGION_TREE_DEPTH', '1')) # Depth of the region nodes (0 = tree root)
+REGION_TREE_CACHE_PATH = os.getenv('REGION_TREE_CACHE_PATH', os.path.abspath('region_tree.json'))
+REGION_TREE_TTL_HOURS = float(os.getenv('REGION_TREE_TTL_HOURS', '24'))
+
+# --- Condition-Based Waits (page_waits.py) ---
+SETTLE_WAIT_TIMEOUT = int(os.getenv('SETTLE_WAIT_TIMEOUT', '60')) # Max wait for a postback to finish after a click
+SETTLE_POLL_SECONDS = float(os.getenv('SETTLE_POLL_SECONDS', '0.2'))
+SETTLE_GRACE_MS = int(os.getenv('SETTLE_GRACE_MS', '150')) # Lets a postback scheduled via setTimeout start before checking
+INTER_CHUNK_PAUSE_SECONDS = float(os.getenv('INTER_CHUNK_PAUSE_SECONDS', '0')) # Optional throttle between chunks/regions
+
+# --- Retry Policy and Circuit Breaker (retry_policy.py) ---
+RETRY_POLICY_ENABLED = os.getenv('RETRY_POLICY_ENABLED', '1') == '1' # '0' restores the fixed-delay retries
+RETRY_POLICY = os.getenv('RETRY_POLICY', '') # JSON per error class, e.g. {"timeout": {"retries": 3, "base_delay": 20}}
+RETRY_POLICY_BY_REPORT = os.getenv('RETRY_POLICY_BY_REPORT', '') # JSON {report name: {error class: {...}}}
+RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', '6')) # Overall attempt budget per call, all classes together
+RETRY_JITTER = float(os.getenv('RETRY_JITTER', '0.5')) # Backoff is reduced by up to this fraction at random
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5')) # Server errors/timeouts that open the breaker (0 = off)
+CIRCUIT_WINDOW_SECONDS = int(os.getenv('CIRCUIT_WINDOW_SECONDS', '300'))
+CIRCUIT_COOLDOWN_SECONDS = int(os.getenv('CIRCUIT_COOLDOWN_SECONDS', '120'))
+CIRCUIT_MAX_COOLDOWN_SECONDS = int(os.getenv('CIRCUIT_MAX_COOLDOWN_SECONDS', '900'))
+
+# --- Status Stream (status_broker.py) ---
+STATUS_BUFFER_SIZE = int(os.getenv('STATUS_BUFFER_SIZE', '500')) # Status messages kept for SSE clients and resume
+SSE_KEEPALIVE_SECONDS = int(os.getenv('SSE_KEEPALIVE_SECONDS', '15')) # Comment line sent on idle streams
+SSE_RETRY_MS = int(os.getenv('SSE_RETRY_MS', '3000')) # Browser reconnect delay after a dropped stream
+
+# --- Download Jobs (job_manager.py) ---
+JOB_MAX_CONCURRENT = int(os.getenv('JOB_MAX_CONCURRENT', '0')) # Runs executing at once; 0 = warm browser pool size (1 without the pool)
+JOB_HISTORY_SIZE = int(os.getenv('JOB_HISTORY_SIZE', '50')) # Finished runs kept for /download/api/runs
+
+# --- Scheduled Run Queue (schedule_queue.py) ---
+SCHEDULE_QUEUE_PATH = os.getenv('SCHEDULE_QUEUE_PATH', os.path.abspath('schedule_queue.json'))
+SCHEDULE_QUEUE_DEADLINE_MINUTES = int(os.getenv('SCHEDULE_QUEUE_DEADLINE_MINUTES', '360')) # Drop scheduled runs waiting longer; 0 = never
+SCHEDULE_QUEUE_POLL_SECONDS = float(os.getenv('SCHEDULE_QUEUE_POLL_SECONDS', '5')) # Dispatcher check for free download slots
+SCHEDULE_DEFAULT_PRIORITY = int(os.getenv('SCHEDULE_DEFAULT_PRIORITY', '0')) # Configs may set "priority"; higher runs first
+
+# --- Persistent Schedules (scheduler_store.py) ---
+SCHEDULER_DB_PATH = os.getenv('SCHEDULER_DB_PATH', os.path.abspath('schedules.sqlite'))
+SCHEDULE_TIMEZONE = os.getenv('SCHEDULE_TIMEZONE', '') # e.g. 'Asia/Ho_Chi_Minh'; empty = server time zone
+SCHEDULE_MISFIRE_GRACE_SECONDS = int(os.getenv('SCHEDULE_MISFIRE_GRACE_SECONDS', '3600')) # Later catch-up runs are skipped
+
+# --- Run History (run_history.py) ---
+RUN_HISTORY_DB_PATH = os.getenv('RUN_HISTORY_DB_PATH', os.path.abspath('run_history.sqlite'))
+RUN_HISTORY_IMPORT_CSV = [path for path in os.getenv(
+    'RUN_HISTORY_IMPORT_CSV', os.pathsep.join([os.path.abspath('download_log.csv'), os.path.abspath(os.path.join('logs', 'download_log.csv'))])
+).split(os.pathsep) if path] # Old CSV download logs, imported once
+RUN_HISTORY_BATCH_SIZE = int(os.getenv('RUN_HISTORY_BATCH_SIZE', '200')) # Rows written per transaction
+RUN_HISTORY_FLUSH_SECONDS = float(os.getenv('RUN_HISTORY_FLUSH_SECONDS', '1')) # Max delay before a buffered row is written
+RUN_HISTORY_PAGE_SIZE = int(os.getenv('RUN_HISTORY_PAGE_SIZE', '1000')) # Default row limit of /get-logs
+
 
 # --- Validation and Warnings ---
-if not OTP_SECRET or OTP_SECRET == 'TAPHLYTABSKHTZWM': # Check against the example value
+if not OTP_SECRET or OTP_SECRET == EXAMPLE_OTP_SECRET: # Check against the example value
     print("\n" + "="*60)
     print("== WARNING: OTP_SECRET is using the default example value or is empty! ==")
     print("== Please configure it securely via Environment Variables or other methods. ==")
@@ -0,0 +1,189 @@
+# filename: download_plan.py
+"""
+Compiles a run configuration into an ordered download plan.
+
+``compile_plan`` resolves every report entry against the registry
+(report_registry.py), merges overlapping entries, resolves relative dates,
+validates chunk sizes and regions, then orders the work by report page and
+setup variant so entries sharing a page run back to back (FAF004N and
+FAF004X both use PHARFAF004) and the page state can be reused between them.
+Each item carries an estimated duration from the chunk cost model, so the
+whole run can be previewed before it starts.
+"""
+import math
+from datetime import datetime
+
+import config
+from chunk_planner import AdaptiveChunkPlanner, cost_key, get_cost_model, span_days
+from coalesce import merge_report_entries
+from logic_download import regions_data
+from region_tree import get_region_tree
+from report_registry import get_report_spec
+from run_ledger import get_ledger, is_incremental, resolve_report_dates
+
+
+def parse_chunk_size(value, report_type, log_func):
+    """Chunk size of an entry: a positive number of days, 'month' or 'auto' (default 5)."""
+    try:
+        if isinstance(value, str) and value.strip().lower() in ('month', 'auto'):
+            return value.strip().lower() # 'auto': sized from past export cost (chunk_planner.py)
+        if value:
+            days = int(value)
+            return days if days > 0 else 5
+    except (ValueError, TypeError):
+        log_func(f"Warning: Invalid chunk size '{value}' for '{report_type}'. Using default: 5 days.")
+    return 5
+
+
+def count_chunks(from_date, to_date, chunk_size, planner=None):
+    """Number of chunks the date range splits into (as WebAutomation.split_date_range)."""
+    days = span_days(from_date, to_date)
+    if chunk_size == 'auto':
+        chunk_size = planner.days if planner is not None else config.CHUNK_AUTO_DEFAULT_DAYS
+    if chunk_size == 'month':
+        start = datetime.strptime(from_date, '%Y-%m-%d')
+        end = datetime.strptime(to_date, '%Y-%m-%d')
+        return (end.year - start.year) * 12 + end.month - start.month + 1
+    return math.ceil(days / chunk_size)
+
+
+class PlanItem:
+    """One report entry of the plan, ready to hand to WebAutomation."""
+
+    def __init__(self, spec, entry, from_date, to_date, chunk_size, engine, region_indices):
+        self.report_type = spec['name']
+        self.url = spec['url']
+        self.variant = spec['variant']
+        self.region_required = spec['region_required']
+        self.entry = entry
+        self.from_date = from_date
+        self.to_date = to_date
+        self.chunk_size = chunk_size
+        self.engine = engine
+        self.region_indices = region_indices
+        self.chunks = 0
+        self.estimated_seconds = 0.0
+        self.from_history = False
+        self.incremental = is_incremental(entry) # since_last_success: covered days are skipped, only gaps fetched
+
+    def estimate(self):
+        """Estimates chunk count and duration from the chunk cost model."""
+        if self.region_required:
+            key = cost_key(self.url, 'download_report_for_region')
+        else:
+            key = cost_key(self.url, self.variant, None, self.engine)
+        planner = AdaptiveChunkPlanner(key, log_func=lambda message: None) if self.chunk_size == 'auto' else None
+        self.chunks = count_chunks(self.from_date, self.to_date, self.chunk_size, planner) * max(1, len(self.region_indices or []))
+        cost = get_cost_model().estimate(key)
+        if cost:
+            self.from_history = True
+            days = span_days(self.from_date, self.to_date) * max(1, len(self.region_indices or []))
+            self.estimated_seconds = cost['seconds_per_day'] * days + config.CHUNK_FIXED_OVERHEAD_SECONDS * self.chunks
+        else:
+            self.estimated_seconds = config.PLAN_DEFAULT_CHUNK_SECONDS * self.chunks
+        return self
+
+    def to_dict(self):
+        return {
+            'report_type': self.report_type, 'url': self.url, 'variant': self.variant,
+            'from_date': self.from_date, 'to_date': self.to_date, 'chunk_size': self.chunk_size,
+            'engine': self.engine, 'regions': self.region_indices, 'chunks': self.chunks,
+            'estimated_seconds': round(self.estimated_seconds), 'from_history': self.from_history,
+        }
+
+
+class DownloadPlan:
+    """Ordered plan items plus the entries that were skipped (and why)."""
+
+    def __init__(self):
+        self.items = []
+        self.skipped = [] # (report_type, reason, is_error)
+
+    @property
+    def estimated_seconds(self):
+        return sum(item.estimated_seconds for item in self.items)
+
+    @property
+    def page_count(self):
+        return len({item.url for item in self.items})
+
+    @property
+    def has_errors(self):
+        return any(is_error for _, _, is_error in self.skipped)
+
+    def describe(self):
+        """Human readable summary lines, logged before the run starts."""
+        minutes = self.estimated_seconds / 60
+        lines = [f"Download plan: {len(self.items)} report(s) on {self.page_count} page(s), "
+                 f"{sum(item.chunks for item in self.items)} chunk(s), estimated {minutes:.0f} min."]
+        for number, item in enumerate(self.items, start=1):
+            basis = "history" if item.from_history else "default"
+            lines.append(f"  {number}. {item.report_type}: {item.from_date} to {item.to_date}, "
+                         f"{item.chunks} chunk(s), ~{item.estimated_seconds / 60:.0f} min ({basis})")
+        for report_type, reason, _ in self.skipped:
+            lines.append(f"  Skipped {report_type}: {reason}")
+        return lines
+
+    def to_dict(self):
+        return {
+            'items': [item.to_dict() for item in self.items],
+            'skipped': [{'report_type': r, 'reason': reason, 'error': e} for r, reason, e in self.skipped],
+            'pages': self.page_count,
+            'chunks': sum(item.chunks for item in self.items),
+            'estimated_seconds': round(self.estimated_seconds),
+        }
+
+
+def compile_plan(reports, regions=None, scope=None, log_func=None):
+    """
+    Turns the report entries of a run configuration into a DownloadPlan.
+    Entries are grouped by page URL (in order of first appearance), then by
+    setup variant, then by start date.
+    """
+    log = log_func or print
+    plan = DownloadPlan()
+    if config.REGION_TREE_DISCOVERY:
+        get_region_tree() # Regions discovered earlier (region_tree.py) are valid selections
+    if config.COALESCE_ENABLED:
+        # Overlapping entries for the same report are fetched once, as their union
+        reports = merge_report_entries(reports, log_func=log)
+    for entry in reports:
+        report_type = entry.get('report_type')
+        if not all([report_type, entry.get('from_date'), entry.get('to_date')]):
+            plan.skipped.append((report_type or '?', f"missing report type or dates ({entry})", True))
+            continue
+        spec = get_report_spec(report_type)
+        if not spec:
+            plan.skipped.append((report_type, "no URL is registered for this report", True))
+            continue
+        region_indices = None
+        if spec['region_required']:
+            try:
+                region_indices = [int(idx) for idx in (regions or [])]
+            except (ValueError, TypeError) as e:
+                plan.skipped.append((report_type, f"invalid region selection: {e}", True))
+                continue
+            if not region_indices:
+                plan.skipped.append((report_type, "requires a region selection, but none was provided", True))
+                continue
+        ledger_regions = [regions_data[i]['name'] for i in region_indices if i in regions_data] if region_indices else None
+        try:
+            # Relative / incremental dates (e.g. since_last_success .. yesterday)
+            from_date, to_date = resolve_report_dates(entry, get_ledger(), scope, ledger_regions, log_func=log)
+        except ValueError as e:
+            plan.skipped.append((report_type, str(e), True))
+            continue
+        if from_date > to_date:
+            plan.skipped.append((report_type, "nothing new to download", False))
+            continue
+        chunk_size = parse_chunk_size(entry.get('chunk_size', '5'), report_type, log)
+        engine = (entry.get('engine') or config.DEFAULT_EXPORT_ENGINE).lower()
+        plan.items.append(PlanItem(spec, entry, from_date, to_date, chunk_size, engine, region_indices).estimate())
+
+    # Group by page, then variant (same radio state), then date
+    page_order, variant_order = {}, {}
+    for item in plan.items:
+        page_order.setdefault(item.url, len(page_order))
+        variant_order.setdefault((item.url, item.variant), len(variant_order))
+    plan.items.sort(key=lambda item: (page_order[item.url], variant_order[(item.url, item.variant)], item.from_date))
+    return plan
@@ -0,0 +1,219 @@
+# filename: download_watcher.py
+"""
+Download completion detection backends used by WebAutomation.
+
+Two backends are available:
+  * ``polling``  - lists the download folder every ``poll_interval`` seconds
+                   (portable, the original behaviour).
+  * ``inotify``  - Linux only; blocks on IN_CLOSE_WRITE / IN_MOVED_TO events
+                   for the folder and returns as soon as the final file lands.
+
+``wait_for_new_file`` picks the backend ('auto' prefers inotify when available).
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+PARTIAL_EXTENSIONS = ('.tmp', '.crdownload', '.part')
+
+# --- inotify constants (from <sys/inotify.h>) ---
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct('iIII') # wd, mask, cookie, len
+_READ_SIZE = 64 * 1024
+
+_libc = None
+
+
+def _load_libc():
+    """Loads libc with the inotify symbols, or returns None if unavailable."""
+    global _libc
+    if _libc is not None:
+        return _libc or None
+    _libc = False
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        _libc = libc
+    except (OSError, AttributeError):
+        return None
+    return _libc
+
+
+def inotify_available():
+    """True when the inotify backend can be used on this platform."""
+    return _load_libc() is not None
+
+
+def _is_partial(name):
+    return name.lower().endswith(PARTIAL_EXTENSIONS)
+
+
+def _newest_completed(folder, names):
+    """Returns the newest non-empty completed file among ``names`` or None."""
+    paths = [os.path.join(folder, f) for f in names if not _is_partial(f)]
+    valid = [p for p in paths if os.path.isfile(p) and os.path.getsize(p) > 0]
+    if not valid:
+        return None
+    return os.path.basename(max(valid, key=os.path.getmtime))
+
+
+# --- Polling Backend ---
+
+def wait_with_polling(folder, before_download, timeout, log_func=print, poll_interval=2):
+    """Waits for a new completed file by listing ``folder`` every ``poll_interval`` seconds."""
+    start_time = time.time()
+    last_partial_file_info = {} # {filename: (size, timestamp)}
+
+    while time.time() - start_time < timeout:
+        current_files = set()
+        try:
+            if os.path.exists(folder):
+                current_files = set(os.listdir(folder))
+            else:
+                log_func("Warning: Download folder disappeared during wait.")
+                time.sleep(poll_interval)
+                continue
+        except OSError as e:
+            log_func(f"Error accessing download folder during wait: {e}")
+            time.sleep(poll_interval)
+            continue
+
+        new_files = current_files - before_download
+        completed_files = [f for f in new_files if not _is_partial(f)]
+        partial_files = {f for f in new_files if _is_partial(f)}
+
+        # 1. Check completed files
+        if completed_files:
+            try:
+                completed_paths = [os.path.join(folder, f) for f in completed_files]
+                valid_files = [p for p in completed_paths if os.path.isfile(p)]
+                if valid_files:
+                    newest_file_path = max(valid_files, key=os.path.getmtime)
+                    new_file_name = os.path.basename(newest_file_path)
+                    # Check file size is > 0 (simple check for validity)
+                    if os.path.getsize(newest_file_path) > 0:
+                        log_func(f"Detected completed file: {new_file_name}")
+                        return new_file_name # Success
+                    else:
+                        log_func(f"Warning: Detected zero-byte completed file: {new_file_name}. Continuing wait.")
+            except (ValueError, OSError) as e:
+                log_func(f"Error identifying latest completed file: {e}")
+
+        # 2. Monitor partial files for progress
+        now = time.time()
+        for partial_file in partial_files:
+            partial_file_path = os.path.join(folder, partial_file)
+            try:
+                current_size = os.path.getsize(partial_file_path)
+                last_size, last_time = last_partial_file_info.get(partial_file, (-1, 0))
+                if current_size > last_size:
+                    if now - last_time > 10: # Log approx every 10 seconds
+                        log_func(f"Download in progress ({partial_file}): {current_size} bytes...")
+                    last_partial_file_info[partial_file] = (current_size, now)
+                elif current_size == last_size and now - last_time > 60:
+                    if (now - last_time) % 60 < poll_interval: # Log warning once per minute
+                        log_func(f"Warning: Download progress for '{partial_file}' seems stalled at {current_size} bytes.")
+            except OSError: # File might have been renamed/deleted
+                last_partial_file_info.pop(partial_file, None)
+
+        # Cleanup info for partials that disappeared
+        for stale in set(last_partial_file_info.keys()) - partial_files:
+            del last_partial_file_info[stale]
+
+        time.sleep(poll_interval)
+
+    return None
+
+
+# --- inotify Backend ---
+
+def wait_with_inotify(folder, before_download, timeout, log_func=print, progress_interval=10):
+    """
+    Waits for a new completed file using inotify. The watch is registered
+    before a single catch-up listing, so files finished between the download
+    click and this call are still detected without any later rescans.
+    """
+    libc = _load_libc()
+    if libc is None:
+        raise OSError("inotify is not available on this platform.")
+
+    fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if fd < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, f"inotify_init1 failed: {os.strerror(err)}")
+    try:
+        wd = libc.inotify_add_watch(fd, os.fsencode(folder), IN_CLOSE_WRITE | IN_MOVED_TO)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_add_watch failed for '{folder}': {os.strerror(err)}")
+
+        # Catch-up: anything completed before the watch was registered
+        try:
+            found = _newest_completed(folder, set(os.listdir(folder)) - before_download)
+        except OSError:
+            found = None
+        if found:
+            log_func(f"Detected completed file: {found}")
+            return found
+
+        deadline = time.time() + timeout
+        last_progress_log = time.time()
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            ready, _, _ = select.select([fd], [], [], min(remaining, progress_interval))
+            if not ready:
+                if time.time() - last_progress_log >= progress_interval:
+                    log_func("Download still in progress (waiting for file events)...")
+                    last_progress_log = time.time()
+                continue
+            try:
+                buf = os.read(fd, _READ_SIZE)
+            except BlockingIOError:
+                continue
+
+            candidates = []
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(buf):
+                _wd, _mask, _cookie, name_len = _EVENT_HEADER.unpack_from(buf, offset)
+                offset += _EVENT_HEADER.size
+                name = buf[offset:offset + name_len].rstrip(b'\0').decode(errors='surrogateescape')
+                offset += name_len
+                if name and name not in before_download and not _is_partial(name):
+                    candidates.append(name)
+
+            found = _newest_completed(folder, candidates)
+            if found:
+                log_func(f"Detected completed file: {found}")
+                return found
+            if candidates:
+                log_func(f"Warning: Detected zero-byte completed file(s): {candidates}. Continuing wait.")
+    finally:
+        os.close(fd)
+
+
+def wait_for_new_file(folder, before_download, timeout, log_func=print, backend='auto', poll_interval=2):
+    """
+    Waits for a new, completed (non-partial, non-empty) file in ``folder``
+    that is not in ``before_download``. Returns its name or None on timeout.
+    ``backend`` is 'auto', 'inotify' or 'polling'.
+    """
+    if backend in ('auto', 'inotify') and inotify_available():
+        try:
+            return wait_with_inotify(folder, before_download, timeout, log_func)
+        except OSError as e:
+            log_func(f"Warning: inotify watcher failed ({e}). Falling back to polling.")
+    elif backend == 'inotify':
+        log_func("Warning: inotify backend requested but not available. Falling back to polling.")
+    return wait_with_polling(folder, before_download, timeout, log_func, poll_interval)
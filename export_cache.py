@@ -0,0 +1,217 @@
+# filename: export_cache.py
+"""
+Content-addressed cache of finished exports for immutable date ranges.
+
+Closed days of reports like FAF001 or FAF006 never change, yet the same
+ranges are often exported again by different configs. Every successful
+chunk whose last day is older than EXPORT_CACHE_MUTABLE_DAYS is stored once
+per content hash under EXPORT_CACHE_PATH/objects and indexed by
+(report URL, setup variant, region, from_date, to_date). A later chunk with
+the same key is materialised into the run folder by hardlink (or copy)
+instead of driving the browser.
+
+The cache is bounded by EXPORT_CACHE_MAX_BYTES; the least recently used
+entries are evicted first.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+
+import config
+from run_ledger import file_sha256
+
+
+def place_file(source, destination, link_mode):
+    """Hardlinks ``source`` to ``destination`` (when allowed), falling back to a copy."""
+    if link_mode == 'hardlink':
+        try:
+            os.link(source, destination)
+            return
+        except OSError:
+            pass # Different volume or no hardlink support
+    shutil.copy2(source, destination)
+
+
+def place_in_folder(source, folder, file_name, link_mode):
+    """Places ``source`` in ``folder`` as ``file_name`` (numbered on conflicts). Returns the new path."""
+    name_part, ext_part = os.path.splitext(file_name)
+    final_name = file_name
+    counter = 1
+    while os.path.exists(os.path.join(folder, final_name)):
+        final_name = f"{name_part}_{counter}{ext_part}"
+        counter += 1
+    destination = os.path.join(folder, final_name)
+    place_file(source, destination, link_mode)
+    return destination
+
+
+class ExportCache:
+    """Index of cached exports plus the content-addressed objects they point to."""
+
+    def __init__(self, root=None, max_bytes=None, mutable_days=None, link_mode=None):
+        self.root = root or config.EXPORT_CACHE_PATH
+        self.max_bytes = config.EXPORT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.mutable_days = config.EXPORT_CACHE_MUTABLE_DAYS if mutable_days is None else mutable_days
+        self.link_mode = (link_mode or config.EXPORT_CACHE_LINK_MODE).lower()
+        self.objects_dir = os.path.join(self.root, 'objects')
+        self.index_path = os.path.join(self.root, 'index.json')
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'bytes_served': 0}
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._index = self._load()
+
+    # --- Index Persistence ---
+
+    def _load(self):
+        if not os.path.isfile(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read export cache index {self.index_path}: {e}")
+            return {}
+
+    def _save(self):
+        tmp_path = self.index_path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._index, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print(f"Warning: Could not save export cache index {self.index_path}: {e}")
+
+    def _object_path(self, sha256, extension):
+        return os.path.join(self.objects_dir, sha256[:2], sha256 + extension)
+
+    # --- Keys and Cacheability ---
+
+    @staticmethod
+    def key(report_url, variant, region, from_date, to_date):
+        """Cache key of one chunk; ``variant`` is the setup method (e.g. 'download_report_004N')."""
+        raw = json.dumps([report_url, variant, region or '', from_date, to_date], ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def is_immutable(self, to_date, today=None):
+        """True when ``to_date`` lies before the mutable window (the last EXPORT_CACHE_MUTABLE_DAYS days)."""
+        today = today or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        cutoff = today - timedelta(days=max(0, self.mutable_days))
+        try:
+            return datetime.strptime(to_date, '%Y-%m-%d') <= cutoff
+        except (TypeError, ValueError):
+            return False
+
+    # --- Lookup / Store ---
+
+    def lookup(self, key):
+        """Returns the index entry of ``key`` when its object is still intact, else None."""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry:
+                path = self._object_path(entry['sha256'], entry['extension'])
+                if os.path.isfile(path) and os.path.getsize(path) == entry['size']:
+                    return dict(entry)
+                # Object removed or damaged outside the cache: forget the entry
+                del self._index[key]
+                self._save()
+            self.counters['misses'] += 1
+            return None
+
+    def materialise(self, key, destination_folder):
+        """
+        Places the cached export of ``key`` in ``destination_folder`` under its
+        original file name. Returns (path, entry), or (None, None) on a miss.
+        """
+        entry = self.lookup(key)
+        if entry is None:
+            return None, None
+        try:
+            destination = place_in_folder(self._object_path(entry['sha256'], entry['extension']),
+                                          destination_folder, entry['file_name'], self.link_mode)
+        except OSError as e:
+            print(f"Warning: Could not materialise cached export {entry['file_name']}: {e}")
+            with self._lock:
+                self.counters['misses'] += 1
+            return None, None
+        with self._lock:
+            if key in self._index:
+                self._index[key]['last_used'] = time.time()
+                self._index[key]['hits'] = self._index[key].get('hits', 0) + 1
+                self._save()
+            self.counters['hits'] += 1
+            self.counters['bytes_served'] += entry['size']
+        return destination, entry
+
+    def store(self, key, file_path, **meta):
+        """Adds a finished export to the cache (deduplicated by content). Returns the entry or None."""
+        if not file_path or not os.path.isfile(file_path):
+            return None
+        try:
+            sha256 = file_sha256(file_path)
+            extension = os.path.splitext(file_path)[1].lower()
+            object_path = self._object_path(sha256, extension)
+            if not os.path.isfile(object_path):
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                tmp_path = object_path + '.tmp'
+                place_file(file_path, tmp_path, self.link_mode)
+                os.replace(tmp_path, object_path)
+        except OSError as e:
+            print(f"Warning: Could not store {os.path.basename(file_path)} in the export cache: {e}")
+            return None
+        now = time.time()
+        entry = dict(meta, sha256=sha256, extension=extension, file_name=os.path.basename(file_path),
+                     size=os.path.getsize(object_path), stored_at=now, last_used=now, hits=0)
+        with self._lock:
+            self._index[key] = entry
+            self.counters['stores'] += 1
+            self._evict()
+            self._save()
+        return dict(entry)
+
+    # --- Eviction ---
+
+    def _object_sizes(self):
+        """(sha256, extension) -> size of every object referenced by the index."""
+        return {(entry['sha256'], entry['extension']): entry['size'] for entry in self._index.values()}
+
+    def _evict(self):
+        """Drops least recently used entries until the objects fit in max_bytes. Caller holds the lock."""
+        if not self.max_bytes:
+            return
+        sizes = self._object_sizes()
+        total = sum(sizes.values())
+        for key, entry in sorted(self._index.items(), key=lambda item: item[1]['last_used']):
+            if total <= self.max_bytes:
+                break
+            del self._index[key]
+            self.counters['evictions'] += 1
+            obj = (entry['sha256'], entry['extension'])
+            if any((other['sha256'], other['extension']) == obj for other in self._index.values()):
+                continue # Same content still cached under another key
+            total -= sizes[obj]
+            try:
+                os.remove(self._object_path(*obj))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, entries=len(self._index), bytes=sum(self._object_sizes().values()),
+                        max_bytes=self.max_bytes, mutable_days=self.mutable_days, link_mode=self.link_mode)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_export_cache():
+    """Returns the process-wide ExportCache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ExportCache()
+        return _cache
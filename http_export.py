@@ -0,0 +1,298 @@
+# filename: http_export.py
+"""
+Browserless export engine for the PHARFAF ASP.NET WebForms report pages.
+
+The browser is only used to log in. Its cookies are copied into a pooled
+``requests.Session`` which then, per chunk:
+  1. GETs the report page and collects the form state (__VIEWSTATE,
+     __EVENTVALIDATION, inputs, checked radios, selected options),
+  2. fills in the date pickers and report-specific radio choices,
+  3. replays the postback of the export button and streams the file to disk.
+"""
+import json
+import os
+import traceback
+from datetime import datetime
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+import requests # type: ignore
+from requests.adapters import HTTPAdapter # type: ignore
+from urllib3.util.retry import Retry # type: ignore
+
+from logic_download import DownloadFailedException, build_target_name
+from run_history import get_run_history
+
+HTTP_TIMEOUT = (30, 3600) # (connect, read) seconds - exports can take a long time
+STREAM_CHUNK_SIZE = 1024 * 1024
+EXPORT_BUTTON_TARGET = 'ctl00$MainContent$btnExportCSVDemo'
+FROM_DATE_FIELD = 'ctl00$MainContent$cbo_fromDate'
+TO_DATE_FIELD = 'ctl00$MainContent$cbo_toDate'
+REPORT_TYPE_RADIO = 'ctl00$MainContent$rblType'
+
+# Report-specific setup for each WebAutomation download method.
+# 'radio' maps a radio group name to the index of the option to select
+# (same index as the '..._rblType_<n>' element IDs clicked in the browser).
+HTTP_EXPORT_VARIANTS = {
+    'download_report_001': {'radio': {REPORT_TYPE_RADIO: 1}, 'suffix': ""},
+    'download_report_004N': {'radio': {REPORT_TYPE_RADIO: 1}, 'suffix': "N"},
+    'download_report_004X': {'radio': {REPORT_TYPE_RADIO: 0}, 'suffix': "X"},
+    'download_generic_report': {'radio': {}, 'suffix': ""},
+}
+
+
+class SessionExpiredError(DownloadFailedException):
+    """Raised when the BI site answers with the login page instead of the report."""
+    pass
+
+
+class _FormStateParser(HTMLParser):
+    """Collects the values a browser would submit for the first <form> on the page."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.fields = {}
+        self.radio_options = {} # name -> [value, ...] in document order
+        self.form_action = None
+        self._in_form = False
+        self._select_name = None
+        self._select_first = None
+        self._select_chosen = False
+        self._textarea_name = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'form' and self.form_action is None:
+            self._in_form = True
+            self.form_action = attrs.get('action') or ''
+            return
+        if not self._in_form:
+            return
+        name = attrs.get('name')
+        if tag == 'input' and name:
+            input_type = (attrs.get('type') or 'text').lower()
+            value = attrs.get('value', '')
+            if input_type == 'radio':
+                self.radio_options.setdefault(name, []).append(value)
+                if 'checked' in attrs:
+                    self.fields[name] = value
+            elif input_type == 'checkbox':
+                if 'checked' in attrs:
+                    self.fields[name] = value or 'on'
+            elif input_type not in ('submit', 'button', 'image', 'reset', 'file'):
+                self.fields[name] = value
+        elif tag == 'select' and name:
+            self._select_name, self._select_first, self._select_chosen = name, None, False
+        elif tag == 'option' and self._select_name:
+            value = attrs.get('value', '')
+            if self._select_first is None:
+                self._select_first = value
+            if 'selected' in attrs and not self._select_chosen:
+                self.fields[self._select_name] = value
+                self._select_chosen = True
+        elif tag == 'textarea' and name:
+            self._textarea_name = name
+            self.fields[name] = ''
+
+    def handle_endtag(self, tag):
+        if tag == 'form':
+            self._in_form = False
+        elif tag == 'select' and self._select_name:
+            if not self._select_chosen and self._select_first is not None:
+                self.fields[self._select_name] = self._select_first
+            self._select_name = None
+        elif tag == 'textarea':
+            self._textarea_name = None
+
+    def handle_data(self, data):
+        if self._textarea_name:
+            self.fields[self._textarea_name] += data
+
+
+def _date_picker_fields(field_name, date_str):
+    """Form values of a Telerik RadDatePicker for 'YYYY-MM-DD' ``date_str``."""
+    dt = datetime.strptime(date_str, '%Y-%m-%d')
+    client_id = field_name.replace('$', '_')
+    validation_text = dt.strftime('%Y-%m-%d-00-00-00')
+    display_text = dt.strftime('%d/%m/%Y')
+    client_state = {
+        'enabled': True, 'emptyMessage': '', 'validationText': validation_text,
+        'valueAsString': validation_text, 'lastSetTextBoxValue': display_text,
+    }
+    return {
+        field_name: dt.strftime('%Y-%m-%d'),
+        f"{field_name}$dateInput": display_text,
+        f"{client_id}_dateInput_ClientState": json.dumps(client_state, separators=(',', ':')),
+    }
+
+
+def _filename_from_response(response):
+    """Extracts the attachment file name from Content-Disposition."""
+    disposition = response.headers.get('Content-Disposition', '')
+    for part in disposition.split(';'):
+        part = part.strip()
+        if part.lower().startswith("filename*="):
+            value = part.split('=', 1)[1]
+            return requests.utils.unquote(value.split("''", 1)[-1]).strip('"')
+    for part in disposition.split(';'):
+        part = part.strip()
+        if part.lower().startswith('filename='):
+            return part.split('=', 1)[1].strip('"')
+    return None
+
+
+class HttpExportEngine:
+    """Replays the report export postback with a pooled, cookie-authenticated HTTP session."""
+
+    def __init__(self, download_folder, session_id, cookies=None, user_agent=None, pool_size=4, status_callback=None):
+        self.download_folder = download_folder
+        self.session_id = session_id
+        self.report_type = None # Report being downloaded, set by WebAutomation (tags the run history rows)
+        self._status_callback = status_callback
+        self.session = requests.Session()
+        retry = Retry(total=3, backoff_factor=2, status_forcelist=(502, 503, 504), allowed_methods=frozenset(['GET']))
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if user_agent:
+            self.session.headers['User-Agent'] = user_agent
+        self.load_cookies(cookies or [])
+
+    @classmethod
+    def from_automation(cls, automation, status_callback=None):
+        """Creates an engine that reuses the logged-in cookies of a WebAutomation browser."""
+        user_agent = None
+        try:
+            user_agent = automation.driver.execute_script("return navigator.userAgent;")
+        except Exception:
+            pass
+        return cls(automation.download_folder, automation.session_id, automation.driver.get_cookies(),
+                   user_agent=user_agent, status_callback=status_callback or automation._log)
+
+    def _log(self, message):
+        if self._status_callback:
+            self._status_callback(message)
+        else:
+            print(message)
+
+    def load_cookies(self, cookies):
+        """Loads Selenium-style cookie dicts into the HTTP session."""
+        for cookie in cookies:
+            self.session.cookies.set(
+                cookie['name'], cookie['value'],
+                domain=cookie.get('domain', ''), path=cookie.get('path', '/')
+            )
+
+    def close(self):
+        self.session.close()
+
+    # --- Export ---
+
+    def _load_form(self, report_url):
+        response = self.session.get(report_url, timeout=HTTP_TIMEOUT)
+        response.raise_for_status()
+        parser = _FormStateParser()
+        parser.feed(response.text)
+        if '__VIEWSTATE' not in parser.fields:
+            raise SessionExpiredError(f"Report page did not contain a WebForms form (redirected to {response.url}?). Session expired?")
+        return response.url, parser
+
+    def export(self, report_url, from_date, to_date, radio=None, suffix="", event_target=EXPORT_BUTTON_TARGET, status_callback=None):
+        """
+        Exports one date range and writes it to the download folder under the
+        standard dated name. Returns the stored file name.
+        """
+        log_func = status_callback or self._log
+        log_func(f"[HTTP] Loading form state from {report_url}")
+        page_url, parser = self._load_form(report_url)
+        form = dict(parser.fields)
+
+        for group, index in (radio or {}).items():
+            options = parser.radio_options.get(group)
+            if not options or index >= len(options):
+                raise DownloadFailedException(f"Radio option {group}[{index}] not found on report page.")
+            form[group] = options[index]
+
+        form.update(_date_picker_fields(FROM_DATE_FIELD, from_date))
+        form.update(_date_picker_fields(TO_DATE_FIELD, to_date))
+        form['__EVENTTARGET'] = event_target
+        form['__EVENTARGUMENT'] = ''
+
+        post_url = urljoin(page_url, parser.form_action or page_url)
+        log_func(f"[HTTP] Posting export for {from_date} to {to_date}...")
+        with self.session.post(post_url, data=form, stream=True, timeout=HTTP_TIMEOUT, headers={'Referer': page_url}) as response:
+            response.raise_for_status()
+            original_name = _filename_from_response(response)
+            if not original_name:
+                content_type = response.headers.get('Content-Type', '')
+                if 'html' in content_type.lower():
+                    raise SessionExpiredError("Export returned an HTML page instead of a file (session expired or server error).")
+                raise DownloadFailedException(f"Export response has no attachment (Content-Type: {content_type}).")
+
+            final_name = build_target_name(original_name, from_date, to_date, suffix)
+            name_part, ext_part = os.path.splitext(final_name)
+            counter = 1
+            while os.path.exists(os.path.join(self.download_folder, final_name)):
+                final_name = f"{name_part}_{counter}{ext_part}"
+                counter += 1
+            final_path = os.path.join(self.download_folder, final_name)
+            partial_path = final_path + '.part'
+            total = 0
+            try:
+                with open(partial_path, 'wb') as f:
+                    for block in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                        if block:
+                            f.write(block)
+                            total += len(block)
+                os.replace(partial_path, final_path)
+            except BaseException:
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+                raise
+        if total == 0:
+            os.remove(final_path)
+            raise DownloadFailedException(f"Export for {from_date} to {to_date} returned an empty file.")
+        log_func(f"[HTTP] Stored {final_name} ({total} bytes).")
+        return final_name
+
+    def download(self, method_name, report_url, from_date, to_date, status_callback=None, refresh_cookies=None):
+        """
+        HTTP equivalent of a WebAutomation per-chunk download method
+        (see HTTP_EXPORT_VARIANTS). Records the result in the run history and
+        returns the stored file name, or None on failure. ``refresh_cookies``
+        is called once to reload cookies from the browser if the HTTP session
+        has expired.
+        """
+        log_func = status_callback or self._log
+        variant = HTTP_EXPORT_VARIANTS[method_name]
+        log_file_name, log_status, log_error = "", "Failed (HTTP Initial)", ""
+        try:
+            try:
+                log_file_name = self.export(report_url, from_date, to_date, variant['radio'], variant['suffix'], status_callback=log_func)
+            except SessionExpiredError:
+                if not refresh_cookies:
+                    raise
+                log_func("[HTTP] Session expired. Reloading cookies from the browser and retrying...")
+                self.load_cookies(refresh_cookies())
+                log_file_name = self.export(report_url, from_date, to_date, variant['radio'], variant['suffix'], status_callback=log_func)
+            log_status = "Success"
+        except SessionExpiredError as e:
+            log_status, log_error = "Failed (HTTP Session Expired)", str(e)
+            log_func(f"ERROR: {log_error}")
+        except DownloadFailedException as e:
+            log_status, log_error = "Failed (HTTP Export)", str(e)
+            log_func(f"ERROR: {log_error}")
+        except requests.RequestException as e:
+            log_status, log_error = "Failed (HTTP Error)", f"{type(e).__name__} - {str(e)[:150]}..."
+            log_func(f"ERROR: HTTP export failed: {log_error}")
+        except Exception as e:
+            log_status, log_error = "Failed (Unexpected Error)", f"{type(e).__name__} - {e}"
+            log_func(f"FATAL ERROR: Unexpected HTTP export error: {log_error}")
+            traceback.print_exc()
+        finally:
+            get_run_history().record([
+                self.session_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                log_file_name, from_date, log_status, to_date, log_error
+            ], report=self.report_type)
+            log_func(f"Logged download status '{log_status}' for {from_date}-{to_date}.")
+        return log_file_name if log_status.startswith("Success") else None
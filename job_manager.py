@@ -0,0 +1,190 @@
+# filename: job_manager.py
+"""
+Download runs as jobs.
+
+Manual downloads, resumed runs and scheduled configs are submitted to the
+process-wide JobManager instead of being refused while another run is
+active. Each job gets a run ID, moves through the states queued -> running ->
+done (or queued/running -> cancelling -> done) and publishes its status
+messages to its own StatusBroker (/stream-status/<run_id>); every message is
+also published, tagged with the run ID, to the shared broker behind
+/stream-status. At most JOB_MAX_CONCURRENT runs execute at the same time
+(by default as many as the warm browser pool holds); further jobs wait in
+submission order.
+"""
+import threading
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+
+import config
+from status_broker import StatusBroker, get_status_broker
+
+QUEUED = 'queued'
+RUNNING = 'running'
+CANCELLING = 'cancelling'
+DONE = 'done'
+
+
+class DownloadJob:
+    """One download run: parameters, state, status channel and cancel flag."""
+
+    def __init__(self, params, source='manual', runner=None):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.params = params
+        self.source = source # 'manual', 'resume' or 'schedule:<config name>'
+        self.runner = runner # runner(params, job); defaults to logic_download.run_download_process
+        self.state = QUEUED
+        self.outcome = None # 'success', 'failed' or 'cancelled' once done
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.broker = StatusBroker()
+        self.broker.start_run() # Clients of a queued run wait for its messages
+        self.cancel_event = threading.Event() # Checked by the run between reports and chunks
+
+    def log(self, message):
+        """Status callback of the run: console, the job's channel and the shared channel."""
+        full_message = f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}: {message}"
+        print(f"[{self.run_id}] {full_message}")
+        self.broker.publish(full_message)
+        get_status_broker().publish(f"[{self.run_id}] {full_message}")
+
+    def to_dict(self):
+        return {
+            'run_id': self.run_id,
+            'state': self.state,
+            'outcome': self.outcome,
+            'source': self.source,
+            'config_name': self.params.get('config_name'),
+            'reports': [report.get('report_type') for report in self.params.get('reports', []) if isinstance(report, dict)],
+            'created_at': self.created_at.isoformat(timespec='seconds'),
+            'started_at': self.started_at.isoformat(timespec='seconds') if self.started_at else None,
+            'finished_at': self.finished_at.isoformat(timespec='seconds') if self.finished_at else None,
+            'stream_url': f"/stream-status/{self.run_id}",
+        }
+
+
+class JobManager:
+    """Queues download jobs and runs them on a bounded set of threads."""
+
+    def __init__(self, max_concurrent=None, history_size=None):
+        if max_concurrent is None:
+            max_concurrent = config.JOB_MAX_CONCURRENT or (config.BROWSER_POOL_SIZE if config.BROWSER_POOL_ENABLED else 1)
+        self.max_concurrent = max(1, max_concurrent)
+        self.history_size = config.JOB_HISTORY_SIZE if history_size is None else history_size
+        self._cond = threading.Condition()
+        self._jobs = OrderedDict() # run_id -> DownloadJob, oldest first
+        self._queue = deque()
+        self._threads = [] # Worker threads, at most max_concurrent
+
+    def submit(self, params, source='manual', runner=None):
+        """Queues a run of ``params``. ``runner(params, job)`` defaults to logic_download.run_download_process."""
+        job = DownloadJob(params, source, runner)
+        with self._cond:
+            self._jobs[job.run_id] = job
+            self._queue.append(job)
+            self._prune()
+            must_wait = len(self._threads) >= self.max_concurrent
+            if not must_wait:
+                thread = threading.Thread(target=self._worker, name=f"download-job-{job.run_id}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+        if must_wait:
+            job.log(f"Run queued ({source}): all {self.max_concurrent} download slot(s) are busy.")
+        return job
+
+    def _prune(self):
+        """Forgets the oldest finished jobs beyond JOB_HISTORY_SIZE."""
+        done = [run_id for run_id, job in self._jobs.items() if job.state == DONE]
+        for run_id in done[:max(0, len(done) - self.history_size)]:
+            del self._jobs[run_id]
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                if not self._queue:
+                    self._threads.remove(threading.current_thread())
+                    return
+                job = self._queue.popleft()
+                if job.state != QUEUED: # Cancelled while waiting
+                    continue
+                job.state = RUNNING
+                job.started_at = datetime.now()
+                if self.active_count() == 1:
+                    get_status_broker().start_run()
+            try:
+                runner = job.runner
+                if runner is None:
+                    from logic_download import run_download_process as runner
+                runner(job.params, job)
+            except Exception as e:
+                job.log(f"FATAL ERROR: Run crashed: {type(e).__name__} - {e}")
+                job.outcome = 'failed'
+            finally:
+                self._finish(job, job.outcome or 'failed')
+
+    def _finish(self, job, outcome):
+        with self._cond:
+            job.outcome = 'cancelled' if job.cancel_event.is_set() else outcome
+            job.state = DONE
+            job.finished_at = datetime.now()
+            job.broker.end_run()
+            if self.active_count() == 0:
+                get_status_broker().end_run()
+            self._cond.notify_all()
+
+    def cancel(self, run_id):
+        """Cancels a queued job at once, or asks a running one to stop. Returns the job (None if unknown)."""
+        with self._cond:
+            job = self._jobs.get(run_id)
+            if job is None or job.state == DONE:
+                return job
+            job.cancel_event.set()
+            if job.state == QUEUED:
+                job.outcome = 'cancelled'
+                job.state = DONE
+                job.finished_at = datetime.now()
+                job.broker.end_run()
+                return job
+            job.state = CANCELLING
+        job.log("Cancellation requested: the run stops after the current chunk.")
+        return job
+
+    def get(self, run_id):
+        with self._cond:
+            return self._jobs.get(run_id)
+
+    def free_slots(self):
+        """Download slots neither running nor promised to a queued job."""
+        with self._cond:
+            waiting = sum(1 for job in self._queue if job.state == QUEUED)
+            return self.max_concurrent - self.active_count() - waiting
+
+    def active_count(self):
+        with self._cond:
+            return sum(1 for job in self._jobs.values() if job.state in (RUNNING, CANCELLING))
+
+    def jobs(self):
+        with self._cond:
+            return [job.to_dict() for job in reversed(self._jobs.values())]
+
+    def stats(self):
+        with self._cond:
+            states = {}
+            for job in self._jobs.values():
+                states[job.state] = states.get(job.state, 0) + 1
+            return {'max_concurrent': self.max_concurrent, 'states': states, 'queued': len(self._queue)}
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """Returns the process-wide JobManager."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
@@ -1,7 +1,6 @@
 # filename: logic_download.py
 import os
 import time
-import csv
 import traceback
 import functools
 import zipfile # Needed for extract_zip_files
@@ -27,6 +26,13 @@ from selenium.common.exceptions import (
     UnexpectedAlertPresentException, NoAlertPresentException,
     StaleElementReferenceException # Added for handling stale elements
 )
+import config
+from download_watcher import wait_for_new_file
+from cdp_downloads import CdpDownloadTracker
+from report_registry import DEFAULT_EXPORT_BUTTON, REGION_EXPORT_BUTTON, SETUP_VARIANTS
+from page_waits import ARM_SETTLE_JS, PAGE_SETTLED_JS, record_wait
+from run_history import get_run_history
+from retry_policy import SESSION_LOST, OTHER, classify_error, get_circuit_breaker, get_retry_policy, record_retry
 # Use webdriver_manager only if driver_path in config is not set or invalid
 # from webdriver_manager.chrome import ChromeDriverManager # type: ignore
 
@@ -40,6 +46,7 @@ RETRY_DELAY = 10               # Default delay between retries for operations
 CLICK_RETRY_DELAY = 15         # Longer delay specifically for click retries
 MAX_RETRIES = 3                # Default number of retries for operations prone to failure
 SHORT_WAIT = 2                 # Short pause time in seconds
+SESSION_PROBE_TIMEOUT = 20     # Max time for the probe page to show a logged-in report form
 
 # --- Region Data (Keep as defined) ---
 regions_data = {
@@ -52,12 +59,13 @@ regions_data = {
     6: {"name": "MB1", "xpath": "/html/body/form/div[1]/div/div/ul/li/span[3]/div/ul/li/ul/li[7]/div/span[3]"}
 }
 # --- Download Process Function ---
-def run_download_process(params):
-    """Main download function executed in a background thread."""
-    from globals import is_running, status_messages, lock
+def run_download_process(params, job=None):
+    """Main download function, executed by the job manager (job_manager.py) on a job thread."""
+    from job_manager import DownloadJob
     import traceback
-    import config
-    import link_report
+    from download_plan import compile_plan
+    from page_waits import describe_wait_stats, merge_wait_stats
+    from retry_policy import describe_retry_stats, get_circuit_breaker, get_retry_policy, merge_retry_stats
     from logic_download import regions_data, DownloadFailedException
     from selenium.common.exceptions import WebDriverException
     from datetime import datetime
@@ -65,29 +73,17 @@ def run_download_process(params):
     # Nếu cần WebAutomation thì import ở đây
     from logic_download import WebAutomation
     
+    from session_store import SessionStore, sign_in
+    from browser_pool import get_browser_pool
+    from run_ledger import RunCheckpoint, get_ledger, ledger_scope, save_last_run
     automation = None
+    browser_lease = None
+    session_store = None
+    profile_dir = None
     process_successful = True # Assume success initially
 
-    # --- Setup within Lock ---
-    with lock:
-        if is_running: # Double check inside lock
-             print("Download process already running, exiting new thread request.")
-             # Cannot easily send status back from here, rely on API response
-             return
-        is_running = True
-        status_messages = [] # Clear logs for this run
-
-    def stream_status_update(message):
-        from datetime import datetime
-        global status_messages
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        full_message = f"{timestamp}: {message}"
-        print(full_message)
-        with lock:
-            status_messages.append(full_message)
-            MAX_LOG_MESSAGES = 500
-            if len(status_messages) > MAX_LOG_MESSAGES:
-                status_messages = status_messages[-MAX_LOG_MESSAGES:]
+    job = job or DownloadJob(params, source='direct') # Called without the job manager
+    stream_status_update = job.log # Run channel (/stream-status/<run_id>) and shared channel
 
     stream_status_update("Starting report download process...")
 
@@ -101,6 +97,23 @@ def run_download_process(params):
         if not reports_to_download:
             raise ValueError("No reports configured for download.")
 
+        # --- Chunk Ledger (resumable runs) ---
+        resume = bool(params.get('resume'))
+        scope = ledger_scope(params)
+        save_last_run(params)
+        if resume:
+            stream_status_update(f"Resuming '{scope}': chunks already downloaded (per the chunk ledger) will be skipped.")
+
+        # --- Compile Download Plan (report_registry.py, download_plan.py) ---
+        plan = compile_plan(reports_to_download, selected_regions_indices_str, scope, log_func=stream_status_update)
+        for line in plan.describe():
+            stream_status_update(line)
+        if plan.has_errors:
+            process_successful = False
+        if not plan.items:
+            stream_status_update("Nothing to download in this run.")
+            return
+
         # --- Prepare Download Folder ---
         timestamp_folder = "001" + datetime.now().strftime("%Y%m%d")
         specific_download_folder = os.path.join(config.DOWNLOAD_BASE_PATH, timestamp_folder)
@@ -110,102 +123,85 @@ def run_download_process(params):
         except OSError as e:
             raise RuntimeError(f"Failed to create download directory '{specific_download_folder}': {e}")
 
-        # --- Initialize Automation ---
-        stream_status_update("Initializing browser automation...")
-        automation = WebAutomation(config.DRIVER_PATH, specific_download_folder, status_callback=stream_status_update)
-
-        # --- Login ---
-        stream_status_update(f"Logging in with user: {email}...")
-        first_report_info = reports_to_download[0]
-        first_report_url = link_report.get_report_url(first_report_info.get('report_type'))
-        if not first_report_url:
-            raise ValueError(f"Could not find URL for initial report type '{first_report_info.get('report_type')}' needed for login.")
+        first_report_url = plan.items[0].url # Used for login initiation
         if not config.OTP_SECRET:
             raise ValueError("OTP_SECRET is not configured.")
 
-        if not automation.login(first_report_url, email, password, config.OTP_SECRET, status_callback=stream_status_update):
-            raise RuntimeError("Login failed after multiple attempts. Cannot proceed.")
+        if config.BROWSER_POOL_ENABLED:
+            # --- Lease Warm Browser (already logged in when reused) ---
+            stream_status_update(f"Leasing browser for user: {email}...")
+            browser_pool = get_browser_pool()
+            session_store = browser_pool.session_store
+            browser_lease = browser_pool.lease(
+                specific_download_folder, first_report_url, email, password, config.OTP_SECRET,
+                status_callback=stream_status_update
+            )
+            automation = browser_lease.automation
+        else:
+            # --- Initialize Automation ---
+            stream_status_update("Initializing browser automation...")
+            session_store = SessionStore()
+            profile_dir = session_store.acquire_profile(email)
+            automation = WebAutomation(config.DRIVER_PATH, specific_download_folder, status_callback=stream_status_update, profile_dir=profile_dir)
+
+            # --- Login ---
+            stream_status_update(f"Logging in with user: {email}...")
+            if not sign_in(automation, first_report_url, email, password, config.OTP_SECRET, store=session_store, status_callback=stream_status_update):
+                raise RuntimeError("Login failed after multiple attempts. Cannot proceed.")
         stream_status_update("Login successful.")
 
-        # --- Download Reports Loop ---
-        for report_info in reports_to_download:
-            report_type_key = report_info.get('report_type')
-            from_date = report_info.get('from_date')
-            to_date = report_info.get('to_date')
-            chunk_size_str = report_info.get('chunk_size', '5')
-
-            # Validate essential info for this report
-            if not all([report_type_key, from_date, to_date]):
-                 stream_status_update(f"Warning: Skipping report entry due to missing info: {report_info}")
-                 process_successful = False
-                 continue
-
-            # Validate and parse chunk_size
-            chunk_size = 5
-            try:
-                if isinstance(chunk_size_str, str) and chunk_size_str.lower() == 'month':
-                    chunk_size = 'month'
-                elif chunk_size_str:
-                    chunk_size_days = int(chunk_size_str)
-                    chunk_size = chunk_size_days if chunk_size_days > 0 else 5
-            except (ValueError, TypeError):
-                stream_status_update(f"Warning: Invalid chunk size '{chunk_size_str}' for '{report_type_key}'. Using default: 5 days.")
-                chunk_size = 5
-
-            report_url = link_report.get_report_url(report_type_key)
-            if not report_url:
-                stream_status_update(f"Error: Could not find URL for report type '{report_type_key}'. Skipping.")
-                process_successful = False
-                continue
+        # --- Optional Parallel Worker Pool ---
+        try:
+            worker_count = int(params.get('workers') or config.DOWNLOAD_WORKERS)
+        except (ValueError, TypeError):
+            worker_count = 1
+        if worker_count > 1:
+            from worker_pool import DownloadWorkerPool
+            stream_status_update(f"Parallel download enabled with {worker_count} browser workers.")
+            automation.worker_pool = DownloadWorkerPool(
+                config.DRIVER_PATH, specific_download_folder, first_report_url,
+                email, password, config.OTP_SECRET, size=worker_count,
+                status_callback=stream_status_update, session_store=session_store
+            )
 
+        automation.cancel_event = job.cancel_event # Checked between chunks (pooled browsers are reused)
+        if automation.worker_pool is not None:
+            automation.worker_pool.cancel_event = job.cancel_event
+        automation.page_stats = {'loads': 0, 'reused': 0} # Counted per run (pooled browsers are reused)
+        automation.wait_stats = {}
+        automation.retry_stats = {}
+
+        # --- Download Reports Loop (in plan order) ---
+        for item in plan.items:
+            if job.cancel_event.is_set():
+                stream_status_update("Run cancelled. Skipping the remaining reports.")
+                process_successful = False
+                break
+            report_type_key = item.report_type
             stream_status_update(f"--- Starting download for report: {report_type_key} ---")
-            stream_status_update(f"Date Range: {from_date} to {to_date}, Chunk Size/Mode: {chunk_size}")
+            stream_status_update(f"Date Range: {item.from_date} to {item.to_date}, Chunk Size/Mode: {item.chunk_size}")
+            automation.export_engine = item.engine
+            automation.checkpoint = RunCheckpoint(get_ledger(), scope, report_type_key, automation.session_id, resume=resume or item.incremental, log_func=stream_status_update)
+            automation.report_type = report_type_key
+            if automation.worker_pool is not None:
+                automation.worker_pool.report_type = report_type_key
+            if config.RETRY_POLICY_ENABLED:
+                automation.retry_policy = get_retry_policy(report_type_key) # Per-report overrides (RETRY_POLICY_BY_REPORT)
+                if automation.worker_pool is not None:
+                    automation.worker_pool.retry_policy = automation.retry_policy
 
             report_failed = False
             try:
-                if report_url in config.REGION_REQUIRED_REPORT_URLS:
-                    if not selected_regions_indices_str:
-                        stream_status_update(f"Error: Report '{report_type_key}' requires region selection, but none provided. Skipping.")
-                        report_failed = True
-                    else:
-                        try:
-                            selected_regions_indices_int = [int(idx) for idx in selected_regions_indices_str]
-                            region_names = [regions_data[i]['name'] for i in selected_regions_indices_int if i in regions_data]
-                            stream_status_update(f"Downloading '{report_type_key}' for regions: {', '.join(region_names)}")
-                            if hasattr(automation, 'download_reports_for_all_regions'):
-                                automation.download_reports_for_all_regions(
-                                    report_url, from_date, to_date, chunk_size,
-                                    region_indices=selected_regions_indices_int,
-                                    status_callback=stream_status_update
-                                )
-                            else:
-                                stream_status_update("ERROR: 'download_reports_for_all_regions' method missing.")
-                                report_failed = True
-                        except (ValueError, TypeError, KeyError) as region_err:
-                            stream_status_update(f"Error processing region indices for '{report_type_key}': {region_err}. Skipping.")
-                            report_failed = True
-                elif report_type_key == "FAF001 - Sales Report" and hasattr(automation, 'download_reports_in_chunks_1'):
-                    automation.download_reports_in_chunks_1(report_url, from_date, to_date, chunk_size, stream_status_update)
-                elif report_type_key == "FAF004N - Internal Rotation Report (Imports)" and hasattr(automation, 'download_reports_in_chunks_4n'):
-                     automation.download_reports_in_chunks_4n(report_url, from_date, to_date, chunk_size, stream_status_update)
-                elif report_type_key == "FAF004X - Internal Rotation Report (Exports)" and hasattr(automation, 'download_reports_in_chunks_4x'):
-                     automation.download_reports_in_chunks_4x(report_url, from_date, to_date, chunk_size, stream_status_update)
-                elif report_type_key == "FAF002 - Dosage Report" and hasattr(automation, 'download_reports_in_chunks_2'):
-                     automation.download_reports_in_chunks_2(report_url, from_date, to_date, chunk_size, stream_status_update)
-                elif report_type_key == "FAF003 - Report Of Other Imports And Exports" and hasattr(automation, 'download_reports_in_chunks_3'):
-                     automation.download_reports_in_chunks_3(report_url, from_date, to_date, chunk_size, stream_status_update)
-                elif report_type_key == "FAF005 - Detailed Report Of Imports" and hasattr(automation, 'download_reports_in_chunks_5'):
-                     automation.download_reports_in_chunks_5(report_url, from_date, to_date, chunk_size, stream_status_update)
-                elif report_type_key == "FAF006 - Supplier Return Report" and hasattr(automation, 'download_reports_in_chunks_6'):
-                     automation.download_reports_in_chunks_6(report_url, from_date, to_date, chunk_size, stream_status_update)
-                elif report_type_key == "FAF028 - Detailed Import - Export Transaction Report" and hasattr(automation, 'download_reports_in_chunks_28'):
-                     automation.download_reports_in_chunks_28(report_url, from_date, to_date, chunk_size, stream_status_update)
-                elif hasattr(automation, 'download_reports_in_chunks'):
-                    stream_status_update(f"Using generic chunking download logic for '{report_type_key}'.")
-                    automation.download_reports_in_chunks(report_url, from_date, to_date, chunk_size, stream_status_update)
+                if item.region_required:
+                    region_names = [regions_data[i]['name'] for i in item.region_indices if i in regions_data]
+                    stream_status_update(f"Downloading '{report_type_key}' for regions: {', '.join(region_names)}")
+                    automation.download_reports_for_all_regions(
+                        item.url, item.from_date, item.to_date, item.chunk_size,
+                        region_indices=item.region_indices,
+                        status_callback=stream_status_update
+                    )
                 else:
-                    stream_status_update(f"ERROR: No suitable download method found for report type '{report_type_key}'. Skipping.")
-                    report_failed = True
+                    automation.download_report_chunks(item.variant, item.url, item.from_date, item.to_date, item.chunk_size, stream_status_update)
             except DownloadFailedException as report_err:
                  stream_status_update(f"ERROR downloading report {report_type_key}: {report_err}")
                  report_failed = True
@@ -228,6 +224,24 @@ def run_download_process(params):
                 stream_status_update(f"--- Download COMPLETED for report: {report_type_key} ---")
         # --- End of Reports Loop ---
 
+        # --- Page-State Reuse Summary ---
+        page_stats = dict(automation.page_stats)
+        if automation.worker_pool is not None:
+            for key, value in automation.worker_pool.page_stats().items():
+                page_stats[key] += value
+        stream_status_update(f"Report page loads: {page_stats['loads']}, page loads saved by page reuse: {page_stats['reused']}.")
+        wait_stats = merge_wait_stats({}, automation.wait_stats)
+        if automation.worker_pool is not None:
+            merge_wait_stats(wait_stats, automation.worker_pool.wait_stats())
+        stream_status_update(describe_wait_stats(wait_stats))
+        retry_stats = merge_retry_stats({}, automation.retry_stats)
+        if automation.worker_pool is not None:
+            merge_retry_stats(retry_stats, automation.worker_pool.retry_stats())
+        stream_status_update(describe_retry_stats(retry_stats))
+        breaker_stats = get_circuit_breaker().stats()
+        if breaker_stats['opens']:
+            stream_status_update(f"Circuit breaker opened {breaker_stats['opens']} time(s) so far, downloads paused {breaker_stats['paused_seconds']:.0f}s in total.")
+
     except (RuntimeError, ValueError, WebDriverException) as setup_err:
         error_message = f"A critical error occurred during setup or login: {setup_err}"
         stream_status_update(f"FATAL ERROR: {error_message}")
@@ -241,22 +255,33 @@ def run_download_process(params):
 
     finally:
         if automation:
+            if automation.worker_pool is not None:
+                try:
+                    stream_status_update("Closing parallel browser workers...")
+                    automation.worker_pool.close()
+                except Exception as pool_e:
+                    stream_status_update(f"ERROR: Failed to close browser workers: {pool_e}")
             try:
-                stream_status_update("Attempting to close browser...")
-                automation.close()
+                if browser_lease is not None:
+                    # Keep the logged-in browser warm for the next manual or scheduled run
+                    browser_lease.release(healthy=automation.is_session_valid())
+                    stream_status_update("Returned browser to the warm browser pool.")
+                else:
+                    stream_status_update("Attempting to close browser...")
+                    automation.close()
             except Exception as close_e:
                 stream_status_update(f"CRITICAL ERROR: Failed to close browser session properly: {close_e}")
                 traceback.print_exc()
-        final_message = "PROCESS FINISHED: " + ("SUCCESS" if process_successful else "FAILED")
+        if session_store is not None:
+            session_store.release_profile(profile_dir)
+        job.outcome = 'cancelled' if job.cancel_event.is_set() else ('success' if process_successful else 'failed')
+        final_message = "PROCESS FINISHED: " + job.outcome.upper()
         stream_status_update(final_message)
-        with lock:
-            is_running = False
 
 
 
 # --- Global Path Definitions ---
 current_folder = os.path.dirname(os.path.abspath(__file__))
-csv_filename = os.path.join(current_folder, 'download_log.csv') # Default log name
 
 # --- Custom Exception Class ---
 # Moved definition UP so it's known before being used in decorators
@@ -281,11 +306,24 @@ def format_date_ddmmyyyy(date_str):
         print(f"Warning: Could not format date '{date_str}' to DD/MM/YYYY: {e}. Returning original.")
         return str(date_str) # Return original string representation on error
 
+def build_target_name(original_filename, from_date, to_date, suffix=""):
+    """Builds the standard '<name>_<DDMMYYYY>_<DDMMYYYY><suffix><ext>' file name for a download."""
+    if original_filename.startswith("BaoCaoFAF001"):
+        return original_filename # Already standardized
+    from_date_formatted = datetime.strptime(from_date, '%Y-%m-%d').strftime('%d%m%Y')
+    to_date_formatted = datetime.strptime(to_date, '%Y-%m-%d').strftime('%d%m%Y')
+    file_name_part, file_extension = os.path.splitext(original_filename)
+    return f"{file_name_part}_{from_date_formatted}_{to_date_formatted}{suffix}{file_extension}".replace(' ','_')
+
 def retry_on_exception(exceptions=(WebDriverException,), retries=MAX_RETRIES, delay=RETRY_DELAY, backoff=1.5):
     """
     Decorator to retry a function on specific Selenium exceptions with exponential backoff.
     Catches WebDriverException by default.
     Now `DownloadFailedException` (if included in `exceptions`) is defined before this point.
+    On a WebAutomation with a retry policy (retry_policy.py) the retries and
+    delays come from the policy of the error class instead, failures returned
+    as False with ``last_error_class`` set are retried too, and every attempt
+    waits while the circuit breaker is open.
     """
     if not isinstance(exceptions, tuple):
         exceptions = (exceptions,)
@@ -295,6 +333,8 @@ def retry_on_exception(exceptions=(WebDriverException,), retries=MAX_RETRIES, de
         def wrapper(*args, **kwargs):
             status_callback = kwargs.get('status_callback')
             instance = args[0] if args and isinstance(args[0], WebAutomation) else None
+            if instance is not None and instance.retry_policy is not None:
+                return _call_with_retry_policy(func, instance, exceptions, args, kwargs)
             attempt = 0
             current_delay = delay
             last_exception = None
@@ -346,24 +386,93 @@ def retry_on_exception(exceptions=(WebDriverException,), retries=MAX_RETRIES, de
     return decorator
 
 
+def _call_with_retry_policy(func, instance, exceptions, args, kwargs):
+    """retry_on_exception driven by ``instance.retry_policy`` and the process-wide circuit breaker."""
+    log_func = kwargs.get('status_callback') or instance._log
+    policy = instance.retry_policy
+    breaker = get_circuit_breaker()
+    class_attempts = {}
+    attempt = 0
+    while True:
+        attempt += 1
+        breaker.wait_if_open(log_func)
+        instance.last_error_class = None
+        error = None
+        try:
+            result = func(*args, **kwargs)
+        except exceptions as e:
+            error = e
+            error_class = instance._classify_failure(e)
+        except Exception as e: # Catch any other unexpected error
+            log_func(f"FATAL UNEXPECTED ERROR in {func.__name__} (attempt {attempt}): {type(e).__name__} - {e}. Stopping retries.")
+            instance.capture_screenshot(f"{func.__name__}_unexpected_fail")
+            traceback.print_exc()
+            raise # Re-raise immediately
+        else:
+            error_class = instance.last_error_class if result is False else None
+            if error_class is None:
+                breaker.record(None)
+                return result
+        breaker.record(error_class)
+
+        class_attempts[error_class] = class_attempts.get(error_class, 0) + 1
+        if class_attempts[error_class] > policy.retries(error_class) or attempt >= policy.max_attempts:
+            record_retry(instance.retry_stats, error_class, False)
+            log_func(f"ERROR: Giving up {func.__name__} after {attempt} attempt(s). Last error class: {error_class}.")
+            if error is None:
+                return result
+            instance.capture_screenshot(f"{func.__name__}_final_retry_fail")
+            raise error
+
+        wait_for = policy.delay(error_class, class_attempts[error_class])
+        record_retry(instance.retry_stats, error_class, True, wait_for)
+        detail = f"{type(error).__name__}: {str(error)[:150]}" if error is not None else "step failed"
+        log_func(f"WARNING: Attempt {attempt} of {func.__name__} failed ({error_class}, {detail}). Retrying in {wait_for:.1f}s...")
+        time.sleep(wait_for)
+
+
 class WebAutomation:
     """Handles browser automation using Selenium for downloading reports."""
 
-    def __init__(self, driver_path, download_folder, status_callback=None):
+    def __init__(self, driver_path, download_folder, status_callback=None, profile_dir=None, browser_profile=None):
         """
         Initializes the WebDriver.
         Args:
             driver_path (str): Path to ChromeDriver.
             download_folder (str): Specific folder for this run's downloads.
             status_callback (function, optional): Callback for status updates during init.
+            profile_dir (str, optional): Chrome user-data-dir to reuse (see session_store.py).
+            browser_profile (str, optional): 'standard' or 'lean' (headless, non-essential
+                resources blocked). Defaults to config.BROWSER_PROFILE.
         """
         self.driver_path = driver_path
+        self.browser_profile = (browser_profile or config.BROWSER_PROFILE).lower()
         self.download_folder = download_folder
+        self.profile_dir = profile_dir
         self.driver = None
         self.wait = None
         self.before_download = set()
         self.extracted_zips = set()  # Track extracted zip files to avoid re-extraction
         self._status_callback = status_callback # Store callback for internal use
+        self.worker_pool = None # Optional DownloadWorkerPool for parallel chunk processing
+        self.download_tracker = None # CdpDownloadTracker, started on first tracked download
+        self._download_seq = 0 # Counter for per-download target folders
+        self._cdp_tracking_failed = False # CDP tracking failed in this browser: use folder detection from then on
+        self.export_engine = 'browser' # 'browser' or 'http' (see http_export.py), set per report
+        self.http_engine = None # HttpExportEngine, created on first HTTP export
+        self.last_download_bytes = 0 # Size of the last stored download (feeds chunk_planner.py)
+        self.last_download_file = None # Path of the last stored download (recorded in the chunk ledger)
+        self.last_download_suffix = "" # File name suffix of the last download (re-applied to cached exports)
+        self.checkpoint = None # run_ledger.RunCheckpoint of the report being downloaded, set per report
+        self.report_type = None # Report being downloaded, set per report (tags the run history rows)
+        self.page_state = None # (report URL, setup variant or region) the loaded page is prepared for
+        self.page_stats = {'loads': 0, 'reused': 0} # Report page loads vs. chunks that reused the loaded page
+        self.region_tree_read = False # Region tree discovered in this session (region_tree.py)
+        self.wait_stats = {} # Time spent per wait reason (page_waits.py)
+        self.retry_policy = get_retry_policy() if config.RETRY_POLICY_ENABLED else None # Set per report by the run
+        self.retry_stats = {} # Retries per error class (retry_policy.py)
+        self.last_error_class = None # Error class of the last failed download step, read by retry_on_exception
+        self.cancel_event = None # threading.Event of the job running this browser (job_manager.py), set per run
         # Derive session identifier from download folder name
         # self.session_id = os.path.basename(self.download_folder)
         now = datetime.now()
@@ -398,6 +507,15 @@ class WebAutomation:
         chrome_options.add_argument('--enable-automation')
         chrome_options.add_argument('--dns-prefetch-disable')
         # chrome_options.add_argument('--headless=new') # Uncomment for headless operation
+        if self.browser_profile == 'lean':
+            chrome_options.add_argument('--headless=new')
+            chrome_options.add_argument(f'--window-size={config.LEAN_WINDOW_SIZE}') # Fixed viewport for headless layout
+            chrome_options.add_argument('--blink-settings=imagesEnabled=false')
+            chrome_options.add_argument('--mute-audio')
+            self._log("Using lean browser profile (headless, images/fonts/analytics blocked).")
+        if self.profile_dir:
+            chrome_options.add_argument(f'--user-data-dir={self.profile_dir}')
+            self._log(f"Using Chrome profile: {self.profile_dir}")
 
         try:
             if not os.path.exists(self.driver_path):
@@ -433,6 +551,8 @@ class WebAutomation:
             self.driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
             self.driver.implicitly_wait(5) # Reduce implicit wait, rely on explicit waits
             self.wait = WebDriverWait(self.driver, WEBDRIVER_WAIT_TIMEOUT)
+            if self.browser_profile == 'lean':
+                self._apply_lean_profile()
 
             self.update_files_before_download()
 
@@ -443,6 +563,45 @@ class WebAutomation:
                 self.service.stop()
             raise # Re-raise to stop the application
 
+    def _apply_lean_profile(self):
+        """Blocks non-essential requests via CDP and lets headless Chrome download files."""
+        patterns = list(config.LEAN_BLOCKED_URL_PATTERNS)
+        if config.LEAN_BLOCK_CSS:
+            patterns.append('*.css')
+        try:
+            self.driver.execute_cdp_cmd('Network.enable', {})
+            self.driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+            self._log(f"Blocking {len(patterns)} non-essential URL patterns.")
+        except WebDriverException as e:
+            self._log(f"Warning: Could not set blocked URLs: {str(e)[:150]}")
+        try:
+            # Headless Chrome ignores the download prefs unless downloads are allowed via CDP
+            self.driver.execute_cdp_cmd('Browser.setDownloadBehavior', {'behavior': 'allow', 'downloadPath': self.download_folder})
+        except WebDriverException as e:
+            self._log(f"Warning: Could not enable headless downloads: {str(e)[:150]}")
+
+    def measure_page_load(self, url):
+        """
+        Loads ``url`` and returns its Navigation/Resource Timing figures:
+        wall time, DOMContentLoaded, load event, resource count and bytes transferred.
+        """
+        start = time.perf_counter()
+        self.driver.get(url)
+        wall_ms = (time.perf_counter() - start) * 1000
+        timing = self.driver.execute_script("""
+            const nav = performance.getEntriesByType('navigation')[0] || {};
+            const res = performance.getEntriesByType('resource');
+            return {
+                dom_content_loaded_ms: nav.domContentLoadedEventEnd || 0,
+                load_event_ms: nav.loadEventEnd || 0,
+                document_bytes: nav.transferSize || 0,
+                resource_count: res.length,
+                resource_bytes: res.reduce((sum, r) => sum + (r.transferSize || 0), 0),
+            };
+        """) or {}
+        timing['wall_ms'] = wall_ms
+        return timing
+
     def _log(self, message):
         """Internal logging helper using the status callback if available."""
         if self._status_callback:
@@ -450,6 +609,31 @@ class WebAutomation:
         else:
             print(message) # Fallback to console if no callback
 
+    def retarget(self, download_folder, status_callback=None):
+        """
+        Prepares a warm (pooled) browser for a new run: points downloads at
+        ``download_folder``, swaps the status callback and drops per-run state.
+        """
+        self.download_folder = download_folder
+        self._status_callback = status_callback
+        self.extracted_zips = set()
+        self.worker_pool = None
+        self.export_engine = 'browser'
+        self.checkpoint = None
+        self.report_type = None
+        if self.http_engine is not None:
+            self.http_engine.close()
+            self.http_engine = None
+        self.session_id = os.path.basename(self.download_folder) + "-" + datetime.now().strftime("%H%M%S")
+        os.makedirs(self.download_folder, exist_ok=True)
+        if self.driver:
+            try:
+                # The 'download.default_directory' pref is fixed at launch, so move it via CDP
+                self.driver.execute_cdp_cmd('Browser.setDownloadBehavior', {'behavior': 'allow', 'downloadPath': self.download_folder})
+            except WebDriverException as e:
+                self._log(f"Warning: Could not change download folder of pooled browser: {str(e)[:150]}")
+        self.update_files_before_download()
+
     # --- Utility Methods ---
 
     def update_files_before_download(self):
@@ -470,91 +654,12 @@ class WebAutomation:
         log_func = status_callback or self._log
         log_func(f"Waiting for download to complete (timeout: {timeout}s)...")
 
-        start_time = time.time()
-        last_partial_file_info = {} # {filename: (size, timestamp)}
-
-        while time.time() - start_time < timeout:
-            current_files = set()
-            try:
-                if os.path.exists(self.download_folder):
-                    current_files = set(os.listdir(self.download_folder))
-                else:
-                    log_func("Warning: Download folder disappeared during wait.")
-                    time.sleep(SHORT_WAIT)
-                    continue
-            except OSError as e:
-                log_func(f"Error accessing download folder during wait: {e}")
-                time.sleep(SHORT_WAIT)
-                continue
-
-            new_files = current_files - self.before_download
-            completed_files = [f for f in new_files if not f.lower().endswith(('.tmp', '.crdownload', '.part'))]
-            partial_files = {f for f in new_files if f.lower().endswith(('.tmp', '.crdownload', '.part'))}
-
-            # 1. Check completed files
-            if completed_files:
-                try:
-                    completed_paths = [os.path.join(self.download_folder, f) for f in completed_files]
-                    valid_files = [p for p in completed_paths if os.path.isfile(p)]
-                    if valid_files:
-                        newest_file_path = max(valid_files, key=os.path.getmtime)
-                        new_file_name = os.path.basename(newest_file_path)
-                        # Check file size is > 0 (simple check for validity)
-                        if os.path.getsize(newest_file_path) > 0:
-                            log_func(f"Detected completed file: {new_file_name}")
-                            return new_file_name # Success
-                        else:
-                            log_func(f"Warning: Detected zero-byte completed file: {new_file_name}. Continuing wait.")
-                    # Handle case where completed_files list only contained directories or non-files
-                except (ValueError, OSError) as e:
-                     log_func(f"Error identifying latest completed file: {e}")
-
-            # 2. Monitor partial files for progress
-            active_partials_found = False
-            if partial_files:
-                now = time.time()
-                for partial_file in partial_files:
-                    partial_file_path = os.path.join(self.download_folder, partial_file)
-                    try:
-                        current_size = os.path.getsize(partial_file_path)
-                        last_size, last_time = last_partial_file_info.get(partial_file, (-1, 0))
-
-                        if current_size > last_size:
-                            # Log progress less frequently
-                            if now - last_time > 10: # Log approx every 10 seconds
-                                log_func(f"Download in progress ({partial_file}): {current_size} bytes...")
-                            last_partial_file_info[partial_file] = (current_size, now)
-                            active_partials_found = True
-                            # Extend timeout slightly only if progress is recent
-                            # start_time = time.time() # Risky, can lead to infinite loops
-
-                        elif current_size == last_size:
-                             # Size hasn't changed, could be stalled or done but not renamed.
-                             # Consider it active for now.
-                             active_partials_found = True
-                             # If stalled for too long, maybe log a warning?
-                             if now - last_time > 60: # E.g., stalled for 1 minute
-                                 if (now - last_time) % 60 < SHORT_WAIT: # Log warning once per minute
-                                     log_func(f"Warning: Download progress for '{partial_file}' seems stalled at {current_size} bytes.")
-
-                        # else: size decreased? Ignore or log warning
-
-                    except OSError: # File might have been renamed/deleted
-                        if partial_file in last_partial_file_info:
-                             del last_partial_file_info[partial_file]
-                        continue
-
-            # Cleanup info for partials that disappeared
-            stale_partials = set(last_partial_file_info.keys()) - partial_files
-            for stale in stale_partials:
-                 del last_partial_file_info[stale]
-
-            # If no completed files and no active partials, keep waiting but log if needed
-            if not completed_files and not active_partials_found and partial_files:
-                 # All partials seem stalled, just wait.
-                 pass
-
-            time.sleep(SHORT_WAIT)
+        downloaded = wait_for_new_file(
+            self.download_folder, self.before_download, timeout, log_func,
+            backend=config.DOWNLOAD_WATCHER, poll_interval=SHORT_WAIT
+        )
+        if downloaded:
+            return downloaded
 
         # --- Loop Timed Out ---
         log_func(f"WARNING: Download wait timed out after {timeout} seconds.")
@@ -656,8 +761,9 @@ class WebAutomation:
 
             # Wait before retrying if loop continues
             if attempt < retries - 1:
-                log_func(f"Waiting {delay}s before retrying click on '{description}'...")
-                time.sleep(delay)
+                wait_for = self._retry_delay(last_exception, attempt + 1, delay)
+                log_func(f"Waiting {wait_for:.1f}s before retrying click on '{description}'...")
+                time.sleep(wait_for)
             else: # Last attempt failed
                  log_func(f"ERROR: Failed to click '{description}' after {retries} attempts. Last error: {type(last_exception).__name__}")
                  self.capture_screenshot(f"{description.replace(' ','_')}_click_failed_final")
@@ -665,24 +771,9 @@ class WebAutomation:
         return False # Failed after all retries or breaking early
 
 
-    @staticmethod
-    def write_log_to_csv(log_data, filename=csv_filename):
-        """Writes a log entry to the specified CSV file."""
-        file_exists = os.path.isfile(filename)
-        try:
-            # Use 'a' mode to append, newline='' to prevent extra blank rows
-            with open(filename, 'a', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile)
-                if not file_exists or os.path.getsize(filename) == 0:
-                    writer.writerow(['SessionID','Timestamp','File Name','Start Date','Status','End Date','Error Message'])
-                # Reorder fields: Timestamp, File Name, Start Date, Status, End Date, Error Message
-                writer.writerow([log_data[0], log_data[1], log_data[2], log_data[3], log_data[4], log_data[5], log_data[6]])
-        except IOError as e:
-            print(f"CRITICAL ERROR: Could not write to log file {filename}: {e}")
-            print(f"LOG_DATA (CSV failed): {log_data}")
-        except Exception as e:
-             print(f"CRITICAL ERROR: Unexpected error writing to log file {filename}: {e}")
-             print(f"LOG_DATA (CSV failed): {log_data}")
+    def record_run(self, log_data):
+        """Records a chunk outcome (SessionID, Timestamp, File Name, Start Date, Status, End Date, Error Message) in the run history."""
+        get_run_history().record(log_data, report=self.report_type)
 
     def capture_screenshot(self, filename_prefix="error_screenshot"):
         """Saves a screenshot of the current browser window."""
@@ -826,15 +917,65 @@ class WebAutomation:
             raise WebDriverException(log_func) from e # Wrap for consistency
 
 
+    # --- Saved Session Reuse ---
+    def probe_session(self, probe_url, status_callback=None):
+        """Cheap login check: opens ``probe_url`` and looks for the report date input."""
+        log_func = status_callback or self._log
+        if not self.is_session_valid():
+            return False
+        try:
+            self.driver.get(probe_url)
+            WebDriverWait(self.driver, SESSION_PROBE_TIMEOUT).until(
+                EC.presence_of_element_located((By.ID, 'ctl00_MainContent_cbo_fromDate_dateInput'))
+            )
+            return True
+        except TimeoutException:
+            log_func(f"Session probe: report form not shown (current URL: {self.driver.current_url}).")
+            return False
+        except WebDriverException as e:
+            log_func(f"Session probe failed: {type(e).__name__} - {str(e)[:150]}")
+            return False
+
+    def restore_session(self, probe_url, cookies, status_callback=None):
+        """Loads saved cookies into the browser and verifies them with probe_session."""
+        log_func = status_callback or self._log
+        if not self.is_session_valid():
+            return False
+        from urllib.parse import urlsplit
+        parts = urlsplit(probe_url)
+        try:
+            # Cookies can only be added for the domain currently loaded
+            self.driver.get(f"{parts.scheme}://{parts.netloc}/favicon.ico")
+        except WebDriverException as e:
+            log_func(f"Could not open site to restore session: {str(e)[:150]}")
+            return False
+        restored = 0
+        for cookie in cookies:
+            cookie = {k: v for k, v in cookie.items() if k in ('name', 'value', 'domain', 'path', 'secure', 'httpOnly', 'expiry', 'sameSite')}
+            try:
+                self.driver.add_cookie(cookie)
+                restored += 1
+            except WebDriverException:
+                pass # Cookie for another domain (e.g. the login service)
+        if not restored:
+            return False
+        log_func(f"Restored {restored} saved cookies. Probing session...")
+        return self.probe_session(probe_url, status_callback=log_func)
+
     # --- File Handling ---
-    def extract_zip_files(self, status_callback=None):
-        """Extracts newly downloaded zip files and returns a list of extracted file paths."""
+    def extract_zip_files(self, status_callback=None, zip_names=None):
+        """
+        Extracts newly downloaded zip files and returns a list of extracted file paths.
+        When ``zip_names`` is given only those files are considered (no folder scan).
+        """
         log_func = status_callback or self._log
         log_func("Checking for new zip files to extract...")
         files_after_download = set()
         extracted_files = []
         try:
-            if os.path.exists(self.download_folder):
+            if zip_names is not None:
+                 files_after_download = {name for name in zip_names if name and os.path.isfile(os.path.join(self.download_folder, name))}
+            elif os.path.exists(self.download_folder):
                  files_after_download = set(os.listdir(self.download_folder))
             else:
                  log_func("Warning: Download folder not found for extraction.")
@@ -957,9 +1098,251 @@ class WebAutomation:
             return None # Indicate failure
 
 
+    # --- Tracked Download Targets ---
+
+    def _prepare_download_target(self, log_func):
+        """
+        Points Chrome at a fresh, empty per-download folder (CDP tracking) and
+        returns it. Returns None when tracking is disabled or unavailable, in
+        which case the legacy before/after folder diff is used.
+        """
+        if config.CDP_DOWNLOAD_TRACKING and not self._cdp_tracking_failed and self.driver:
+            self._download_seq += 1
+            target_dir = os.path.join(self.download_folder, "_inflight", f"{self.session_id}_{self._download_seq}")
+            try:
+                if self.download_tracker is None:
+                    self.download_tracker = CdpDownloadTracker(self.driver, status_callback=self._log)
+                self.download_tracker.set_target(target_dir)
+                return target_dir
+            except Exception as e:
+                log_func(f"Warning: CDP download tracking unavailable ({type(e).__name__}: {str(e)[:150]}). Using folder detection.")
+                self._cdp_tracking_failed = True # Do not retry for every chunk of this browser
+                try:
+                    # Restore the session's default download folder
+                    self.driver.execute_cdp_cmd('Browser.setDownloadBehavior', {'behavior': 'allow', 'downloadPath': self.download_folder})
+                except Exception:
+                    pass
+        self.update_files_before_download()
+        return None
+
+    def _collect_download(self, target_dir, from_date, to_date, suffix="", log_func=None):
+        """
+        Waits for the current download and stores it under its final name in
+        the download folder. Returns (original_name, final_name); both are None
+        when nothing was downloaded, final_name is None when renaming failed.
+        """
+        log_func = log_func or self._log
+        self.last_download_suffix = suffix
+        if target_dir is None:
+            downloaded_original_name = self.wait_for_download_to_finish(status_callback=log_func)
+            if not downloaded_original_name:
+                return None, None
+            final_name = self.rename_downloaded_file(downloaded_original_name, from_date, to_date, suffix, log_func)
+            if final_name and os.path.isfile(os.path.join(self.download_folder, final_name)):
+                self.last_download_file = os.path.join(self.download_folder, final_name)
+                self.last_download_bytes = os.path.getsize(self.last_download_file)
+            return downloaded_original_name, final_name
+
+        log_func(f"Waiting for tracked download in {target_dir} (timeout: {DOWNLOAD_WAIT_TIMEOUT}s)...")
+        original_name, total_bytes = self.download_tracker.wait(DOWNLOAD_WAIT_TIMEOUT, log_func)
+        if not original_name:
+            return None, None
+        source_path = os.path.join(target_dir, original_name)
+        # The completion event can arrive just before Chrome's final rename
+        for _ in range(10):
+            if os.path.isfile(source_path):
+                break
+            time.sleep(0.2)
+        if not os.path.isfile(source_path):
+            log_func(f"ERROR: Tracked download '{original_name}' not found in {target_dir}.")
+            return None, None
+        actual_size = os.path.getsize(source_path)
+        if total_bytes and actual_size != total_bytes:
+            log_func(f"Warning: '{original_name}' is {actual_size} bytes, CDP reported {total_bytes} bytes.")
+        self.last_download_bytes = actual_size
+
+        try:
+            final_name = build_target_name(original_name, from_date, to_date, suffix)
+            name_part, ext_part = os.path.splitext(final_name)
+            counter = 1
+            while os.path.exists(os.path.join(self.download_folder, final_name)):
+                final_name = f"{name_part}_{counter}{ext_part}"
+                counter += 1
+            os.replace(source_path, os.path.join(self.download_folder, final_name))
+            self.last_download_file = os.path.join(self.download_folder, final_name)
+            log_func(f"Stored download as: {final_name}")
+            self.before_download.add(final_name)
+        except Exception as e:
+            log_func(f"ERROR: Could not store tracked download '{original_name}': {e}")
+            traceback.print_exc()
+            return original_name, None
+        finally:
+            try:
+                os.rmdir(target_dir)
+            except OSError:
+                pass
+        return original_name, final_name
+
+    # --- Condition-Based Waits (page_waits.py) ---
+
+    def arm_settle_wait(self):
+        """Hooks the page so wait_until_settled notices a postback started by the next action."""
+        try:
+            self.driver.execute_script(ARM_SETTLE_JS)
+        except WebDriverException:
+            pass # Alert open or page navigating: wait_until_settled still checks readyState
+
+    def wait_until_settled(self, reason, status_callback=None, timeout=None):
+        """
+        Waits until the page is idle (document complete, no pending full or
+        UpdatePanel postback, no active jQuery request). The time spent is
+        counted under ``reason``. Returns False on timeout.
+        """
+        log_func = status_callback or self._log
+        timeout = config.SETTLE_WAIT_TIMEOUT if timeout is None else timeout
+
+        def settled(driver):
+            try:
+                return driver.execute_script(PAGE_SETTLED_JS, config.SETTLE_GRACE_MS)
+            except UnexpectedAlertPresentException:
+                return True # The alert is handled by the caller
+            except WebDriverException as e:
+                if classify_error(e) == SESSION_LOST:
+                    return True # Browser gone: nothing to wait for, the caller checks the session
+                return False # Document replaced mid-check (full postback)
+
+        started = time.time()
+        timed_out = False
+        try:
+            WebDriverWait(self.driver, timeout, poll_frequency=config.SETTLE_POLL_SECONDS).until(settled)
+        except TimeoutException:
+            timed_out = True
+            log_func(f"Warning: Page did not settle within {timeout}s ({reason}). Continuing.")
+        record_wait(self.wait_stats, reason, time.time() - started, timed_out)
+        return not timed_out
+
+    def pause(self, reason, seconds, status_callback=None):
+        """Fixed pause (e.g. configured throttling between chunks), counted under ``reason``."""
+        if seconds <= 0:
+            return
+        log_func = status_callback or self._log
+        log_func(f"Pausing {seconds}s ({reason})...")
+        time.sleep(seconds)
+        record_wait(self.wait_stats, reason, seconds)
+
+    def cancelled(self, status_callback=None):
+        """True when the job of this run was cancelled; chunk loops stop before the next chunk."""
+        if self.cancel_event is None or not self.cancel_event.is_set():
+            return False
+        (status_callback or self._log)("Run cancelled. Skipping the remaining chunks.")
+        return True
+
+    # --- Retry Policy (retry_policy.py) ---
+
+    def _classify_failure(self, error):
+        """Error class of ``error``, recognising BI server error pages from the current page."""
+        page_text = None
+        if classify_error(error) != SESSION_LOST and self.driver:
+            try:
+                page_text = self.driver.execute_script(
+                    "return document.title + ' ' + (document.body ? document.body.innerText.slice(0, 2000) : '');"
+                )
+            except WebDriverException:
+                pass
+        return classify_error(error, page_text)
+
+    def _fail_step(self, error):
+        """Records the class of a failure that is caught (and returned as False) for retry_on_exception."""
+        self.last_error_class = self._classify_failure(error)
+        return self.last_error_class
+
+    def _retry_delay(self, error, attempt, default_delay):
+        """Backoff before retry ``attempt`` after ``error``: from the retry policy, or ``default_delay`` without one."""
+        if self.retry_policy is None or error is None:
+            return default_delay
+        error_class = self._classify_failure(error)
+        wait_for = self.retry_policy.delay(error_class, attempt)
+        record_retry(self.retry_stats, error_class, True, wait_for)
+        return wait_for
+
+    # --- Page-State Reuse ---
+
+    def _reuse_report_page(self, report_url, state, ready_locator, log_func):
+        """
+        True when the browser still shows ``report_url`` prepared for ``state``
+        (setup variant or region) with a usable date input, so the next chunk
+        can be exported without navigating. An open alert or a stale/missing
+        input drops the state and the caller reloads the page.
+        """
+        if not config.PAGE_REUSE_ENABLED or self.page_state != (report_url, state):
+            return False
+        self.page_state = None
+        try:
+            alert_text = self.driver.switch_to.alert.text
+            log_func(f"Alert open on the report page ('{alert_text}'). Reloading the page.")
+            self.handle_alert(accept=True, status_callback=log_func)
+            return False
+        except NoAlertPresentException:
+            pass
+        try:
+            if self.driver.current_url.split('#')[0].lower() != report_url.lower():
+                return False # Navigated elsewhere (login, session probe, ...)
+            self.driver.find_element(*ready_locator).is_enabled()
+        except (StaleElementReferenceException, NoSuchElementException):
+            log_func("Report page state is stale. Reloading the page.")
+            return False
+        self.page_stats['reused'] += 1
+        log_func(f"Reusing the loaded report page (page loads saved: {self.page_stats['reused']}).")
+        return True
+
+    def _load_report_page(self, report_url, ready_locator, setup, log_func):
+        """Navigates to ``report_url``, waits for ``ready_locator`` and runs ``setup`` (if any)."""
+        log_func(f"Navigating to report URL: {report_url}")
+        self.page_state = None
+        self.driver.get(report_url)
+        self.page_stats['loads'] += 1
+        log_func("Waiting for date input fields...")
+        self.wait.until(EC.presence_of_element_located(ready_locator))
+        if setup:
+            setup()
+
+    def _enter_dates(self, sdate_locator, edate_locator, from_date, to_date, log_func):
+        """Clears and fills the 'To Date' and 'From Date' inputs."""
+        log_func(f"Setting 'To Date': {to_date}")
+        edate_input = self.wait.until(EC.element_to_be_clickable(edate_locator))
+        edate_input.clear()
+        edate_input.send_keys(format_date_ddmmyyyy(to_date))
+        # edate_input.send_keys(Keys.TAB) # Tab might trigger unwanted actions
+
+        log_func(f"Setting 'From Date': {from_date}")
+        sdate_input = self.wait.until(EC.element_to_be_clickable(sdate_locator))
+        sdate_input.clear()
+        sdate_input.send_keys(format_date_ddmmyyyy(from_date))
+        # sdate_input.send_keys(Keys.TAB) # Tab might trigger unwanted actions
+
+    def _prepare_report_page(self, report_url, state, sdate_locator, edate_locator, from_date, to_date, setup, log_func):
+        """
+        Brings the report page to the point of exporting ``from_date``..``to_date``:
+        reuses the loaded page when possible (see _reuse_report_page), otherwise
+        loads it and runs ``setup``. A page that goes stale while the dates are
+        entered is reloaded once.
+        """
+        reused = self._reuse_report_page(report_url, state, sdate_locator, log_func)
+        if not reused:
+            self._load_report_page(report_url, sdate_locator, setup, log_func)
+        try:
+            self._enter_dates(sdate_locator, edate_locator, from_date, to_date, log_func)
+        except StaleElementReferenceException:
+            if not reused:
+                raise
+            self.page_stats['reused'] -= 1
+            log_func("Reused report page went stale. Reloading the page.")
+            self._load_report_page(report_url, sdate_locator, setup, log_func)
+            self._enter_dates(sdate_locator, edate_locator, from_date, to_date, log_func)
+
     # --- Core Download Logic ---
 
-    def _perform_download_steps(self, report_url, from_date, to_date, report_specific_setup=None, file_suffix="", status_callback=None):
+    def _perform_download_steps(self, report_url, from_date, to_date, report_specific_setup=None, file_suffix="", status_callback=None, setup_key=None):
         """Internal helper for common download steps."""
         log_func = status_callback or self._log
         if not self.driver or not self.wait:
@@ -970,41 +1353,23 @@ class WebAutomation:
         log_error = ""
         downloaded_original_name = None
 
+        page_state = (report_url, setup_key)
         try:
-            log_func(f"Navigating to report URL: {report_url}")
-            self.driver.get(report_url)
-
             # !!! VERIFY THESE LOCATORS AGAINST THE ACTUAL REPORT PAGE !!!
             sdate_locator = (By.ID, 'ctl00_MainContent_cbo_fromDate_dateInput')
             edate_locator = (By.ID, 'ctl00_MainContent_cbo_toDate_dateInput')
             # !!! THIS IS THE MOST LIKELY LOCATOR TO BE WRONG OR NEED VERIFICATION !!!
-            download_button_locator = (By.ID, 'ctl00_MainContent_btnExportCSVDemo_input')
-
-            log_func("Waiting for date input fields...")
-            self.wait.until(EC.presence_of_element_located(sdate_locator))
-
-            # Optional specific setup (like clicking radio buttons)
-            if report_specific_setup:
-                report_specific_setup()
-
-            # Enter dates - Use safe_send_keys or similar robust approach if needed
-            log_func(f"Setting 'To Date': {to_date}")
-            edate_input = self.wait.until(EC.element_to_be_clickable(edate_locator))
-            edate_input.clear()
-            edate_input.send_keys(format_date_ddmmyyyy(to_date))
-            # edate_input.send_keys(Keys.TAB) # Tab might trigger unwanted actions
+            download_button_locator = (By.ID, DEFAULT_EXPORT_BUTTON)
 
-            log_func(f"Setting 'From Date': {from_date}")
-            sdate_input = self.wait.until(EC.element_to_be_clickable(sdate_locator))
-            sdate_input.clear()
-            sdate_input.send_keys(format_date_ddmmyyyy(from_date))
-            # sdate_input.send_keys(Keys.TAB) # Tab might trigger unwanted actions
+            # Load the page (plus optional specific setup like radio buttons) or reuse it, then enter dates
+            self._prepare_report_page(report_url, setup_key, sdate_locator, edate_locator, from_date, to_date, report_specific_setup, log_func)
 
             # Handle potential alerts before clicking download
-            self.handle_alert(accept=True, status_callback=log_func)
+            if self.handle_alert(accept=True, status_callback=log_func):
+                page_state = None
 
-            # Update file list *just before* clicking download
-            self.update_files_before_download()
+            # Route the download to its own target folder *just before* clicking
+            target_dir = self._prepare_download_target(log_func)
 
             log_func("Locating and clicking download button...")
             print(f"[DEBUG] Attempting robust click on locator: {download_button_locator}") # Console debug
@@ -1020,26 +1385,26 @@ class WebAutomation:
 
             log_func("Download click initiated (or attempted). Checking for alerts...")
             # Handle potential alerts *after* clicking download
-            self.handle_alert(accept=True, status_callback=log_func)
+            if self.handle_alert(accept=True, status_callback=log_func):
+                page_state = None
 
-            # Wait for download to complete
-            downloaded_original_name = self.wait_for_download_to_finish(status_callback=log_func)
+            # Wait for download to complete and store it under its final name
+            downloaded_original_name, renamed_file = self._collect_download(target_dir, from_date, to_date, file_suffix, log_func)
 
             if downloaded_original_name:
                 log_func(f"Download detected: {downloaded_original_name}")
-                # Process (rename, extract)
-                renamed_file = self.rename_downloaded_file(downloaded_original_name, from_date, to_date, file_suffix, log_func)
                 log_file_name = renamed_file if renamed_file else downloaded_original_name
 
                 # Extract if it was a zip file
                 if downloaded_original_name.lower().endswith('.zip'):
-                    extracted_files = self.extract_zip_files(status_callback=log_func)
+                    extracted_files = self.extract_zip_files(status_callback=log_func, zip_names=[log_file_name])
                     # Rename all extracted files after extraction
                     for extracted_path in extracted_files:
                         self.rename_extract_file(extracted_path, from_date, to_date, file_suffix, log_func)
 
                 log_status = "Success" if renamed_file else "Success (Rename Failed)"
                 log_func(f"Download and processing complete. Final state: {log_file_name}")
+                self.page_state = page_state # Next chunk of this report can reuse the page
             else:
                 log_error = "Download wait timed out or failed to detect completed file."
                 log_status = "Failed (Download Wait)"
@@ -1052,6 +1417,7 @@ class WebAutomation:
              log_status = log_status if log_status != "Failed (Initial)" else "Failed (Download Step)"
              log_error = str(df_err)
              log_func(f"DownloadFailedException caught: {log_error}")
+             self._fail_step(df_err)
              # Screenshot likely already taken by the failing function
              # No need to re-raise here, let finally block log
 
@@ -1068,6 +1434,7 @@ class WebAutomation:
                 log_func(f"ERROR: {log_error}")
                 self.capture_screenshot("download_webdriver_error")
                 traceback.print_exc()
+                self._fail_step(e)
                 # Consider re-raising non-session errors depending on desired behavior
         except Exception as e:
             log_status = "Failed (Unexpected Error)"
@@ -1075,6 +1442,7 @@ class WebAutomation:
             log_func(f"FATAL ERROR: {log_error}")
             self.capture_screenshot("download_unexpected_error")
             traceback.print_exc()
+            self.last_error_class = OTHER
             # Do not re-raise, let finally log and the calling function decide
 
         finally:
@@ -1084,7 +1452,7 @@ class WebAutomation:
                 datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                 log_file_name, from_date, log_status, to_date, log_error
             ]
-            self.write_log_to_csv(log_data)
+            self.record_run(log_data)
             log_func(f"Logged download status '{log_status}' for {from_date}-{to_date}.")
 
         # Return True on success, False on failure for the calling function
@@ -1182,13 +1550,14 @@ class WebAutomation:
         log_func = status_callback or self._log
         log_func("Executing specific setup for FAF001...")
         def setup_001():
-             # !!! VERIFY THIS RADIO BUTTON LOCATOR !!!
-             radio_locator = (By.ID, 'ctl00_MainContent_rblType_1')
+             # !!! VERIFY THIS RADIO BUTTON LOCATOR (report_registry.SETUP_VARIANTS) !!!
+             radio_locator = (By.ID, SETUP_VARIANTS['download_report_001']['radio'])
+             self.arm_settle_wait()
              if not self.safe_click(radio_locator, "FAF001 Report Type Radio", retries=2, status_callback=log_func):
                  raise DownloadFailedException("Failed to click FAF001 report type radio button.")
              log_func("Clicked FAF001 specific radio button.")
-             time.sleep(SHORT_WAIT) # Pause after click if needed
-        return self._perform_download_steps(report_url, from_date, to_date, report_specific_setup=setup_001, file_suffix="", status_callback=log_func)
+             self.wait_until_settled('after_radio_click', log_func) # Radio may post back
+        return self._perform_download_steps(report_url, from_date, to_date, report_specific_setup=setup_001, file_suffix="", status_callback=log_func, setup_key='download_report_001')
 
     @retry_on_exception()
     def download_report_004N(self, report_url, from_date, to_date, status_callback=None):
@@ -1196,13 +1565,14 @@ class WebAutomation:
         log_func = status_callback or self._log
         log_func("Executing specific setup for FAF004N (Imports)...")
         def setup_004N():
-             # !!! VERIFY THIS RADIO BUTTON LOCATOR !!!
-             radio_locator = (By.ID, 'ctl00_MainContent_rblType_1') # Assume Imports type is index 1
+             # !!! VERIFY THIS RADIO BUTTON LOCATOR (report_registry.SETUP_VARIANTS) !!!
+             radio_locator = (By.ID, SETUP_VARIANTS['download_report_004N']['radio']) # Assume Imports type is index 1
+             self.arm_settle_wait()
              if not self.safe_click(radio_locator, "FAF004N Report Type Radio (Imports)", retries=2, status_callback=log_func):
                  raise DownloadFailedException("Failed to click FAF004N report type radio button (Imports).")
              log_func("Clicked FAF004N (Imports) specific radio button.")
-             time.sleep(SHORT_WAIT)
-        return self._perform_download_steps(report_url, from_date, to_date, report_specific_setup=setup_004N, file_suffix="N", status_callback=log_func)
+             self.wait_until_settled('after_radio_click', log_func)
+        return self._perform_download_steps(report_url, from_date, to_date, report_specific_setup=setup_004N, file_suffix="N", status_callback=log_func, setup_key='download_report_004N')
 
     @retry_on_exception()
     def download_report_004X(self, report_url, from_date, to_date, status_callback=None):
@@ -1210,13 +1580,14 @@ class WebAutomation:
         log_func = status_callback or self._log
         log_func("Executing specific setup for FAF004X (Exports)...")
         def setup_004X():
-            # !!! VERIFY THIS RADIO BUTTON LOCATOR !!!
-             radio_locator = (By.ID, 'ctl00_MainContent_rblType_0') # Assume Exports type is index 0
+            # !!! VERIFY THIS RADIO BUTTON LOCATOR (report_registry.SETUP_VARIANTS) !!!
+             radio_locator = (By.ID, SETUP_VARIANTS['download_report_004X']['radio']) # Assume Exports type is index 0
+             self.arm_settle_wait()
              if not self.safe_click(radio_locator, "FAF004X Report Type Radio (Exports)", retries=2, status_callback=log_func):
                  raise DownloadFailedException("Failed to click FAF004X report type radio button (Exports).")
              log_func("Clicked FAF004X (Exports) specific radio button.")
-             time.sleep(SHORT_WAIT)
-        return self._perform_download_steps(report_url, from_date, to_date, report_specific_setup=setup_004X, file_suffix="X", status_callback=log_func)
+             self.wait_until_settled('after_radio_click', log_func)
+        return self._perform_download_steps(report_url, from_date, to_date, report_specific_setup=setup_004X, file_suffix="X", status_callback=log_func, setup_key='download_report_004X')
 
     @retry_on_exception()
     def download_generic_report(self, report_url, from_date, to_date, status_callback=None):
@@ -1224,7 +1595,28 @@ class WebAutomation:
          log_func = status_callback or self._log
          log_func("Executing generic download logic...")
          # Pass None for setup, empty suffix
-         return self._perform_download_steps(report_url, from_date, to_date, report_specific_setup=None, file_suffix="", status_callback=log_func)
+         return self._perform_download_steps(report_url, from_date, to_date, report_specific_setup=None, file_suffix="", status_callback=log_func, setup_key='download_generic_report')
+
+    def _http_download(self, method_name, report_url, from_date, to_date, status_callback=None):
+        """Downloads one chunk with the browserless HTTP export engine."""
+        log_func = status_callback or self._log
+        from http_export import HttpExportEngine, HTTP_EXPORT_VARIANTS
+        if self.http_engine is None:
+            self.http_engine = HttpExportEngine.from_automation(self, status_callback=log_func)
+        self.http_engine.report_type = self.report_type
+        stored_name = self.http_engine.download(
+            method_name, report_url, from_date, to_date,
+            status_callback=log_func, refresh_cookies=self.driver.get_cookies
+        )
+        if stored_name and os.path.isfile(os.path.join(self.download_folder, stored_name)):
+            self.last_download_file = os.path.join(self.download_folder, stored_name)
+            self.last_download_bytes = os.path.getsize(self.last_download_file)
+        self.last_download_suffix = HTTP_EXPORT_VARIANTS[method_name]['suffix']
+        if stored_name and stored_name.lower().endswith('.zip'):
+            suffix = self.last_download_suffix
+            for extracted_path in self.extract_zip_files(status_callback=log_func, zip_names=[stored_name]):
+                self.rename_extract_file(extracted_path, from_date, to_date, suffix, log_func)
+        return bool(stored_name)
 
     # --- Region Selection Logic ---
     def select_region(self, region_index, status_callback=None):
@@ -1235,14 +1627,18 @@ class WebAutomation:
                 region = regions_data[region_index]
                 xpath = region["xpath"]
                 region_name = region["name"]
+                if not xpath:
+                    log_func(f"ERROR: Region '{region_name}' has no XPath and was not found in the region tree.")
+                    return False
                 locator = (By.XPATH, xpath)
 
                 log_func(f"Selecting region '{region_name}' (Index: {region_index}) using XPath: {xpath}")
+                self.arm_settle_wait()
                 if not self.safe_click(locator, f"Region '{region_name}' Checkbox", status_callback=log_func):
                     log_func(f"ERROR: Failed to click region '{region_name}'.")
                     self.capture_screenshot(f"region_{region_name}_select_fail")
                     return False
-                time.sleep(SHORT_WAIT) # Pause after selecting region
+                self.wait_until_settled('after_region_click', log_func)
                 log_func(f"Successfully clicked region '{region_name}'.")
                 return True
             else:
@@ -1254,20 +1650,79 @@ class WebAutomation:
             traceback.print_exc()
             return False
 
+    def _ensure_region_tree(self, log_func):
+        """Reads the region tree of the loaded page once per session, unless the on-disk cache is fresh."""
+        from region_tree import DISCOVER_TREE_JS, get_region_tree
+        tree = get_region_tree()
+        if self.region_tree_read or tree.is_fresh():
+            return
+        self.region_tree_read = True
+        try:
+            nodes = self.driver.execute_script(DISCOVER_TREE_JS, config.REGION_TREE_SELECTOR)
+        except WebDriverException as e:
+            log_func(f"Warning: Could not read the region tree: {type(e).__name__} - {str(e)[:150]}")
+            return
+        found = tree.update(nodes)
+        if found:
+            log_func(f"Discovered {found} regions in the region tree.")
+        else:
+            log_func(f"Warning: No regions found in the region tree ({config.REGION_TREE_SELECTOR}). Using XPath selection.")
+
+    def select_regions(self, region_indices, status_callback=None):
+        """
+        Ticks the regions at ``region_indices`` in one script execution using the
+        discovered node paths, falling back to per-region XPath clicks
+        (select_region) when a region has no known node.
+        """
+        log_func = status_callback or self._log
+        if config.REGION_TREE_DISCOVERY:
+            from region_tree import SELECT_NODES_JS, get_region_tree
+            tree = get_region_tree()
+            self._ensure_region_tree(log_func)
+            paths = [regions_data[idx].get('node') for idx in region_indices]
+            if all(paths):
+                names = ", ".join(regions_data[idx]['name'] for idx in region_indices)
+                try:
+                    self.arm_settle_wait()
+                    missing = self.driver.execute_script(SELECT_NODES_JS, config.REGION_TREE_SELECTOR, paths)
+                except WebDriverException as e:
+                    log_func(f"ERROR: Region selection script failed: {type(e).__name__} - {str(e)[:150]}")
+                    return False
+                self.wait_until_settled('after_region_click', log_func)
+                if not missing:
+                    tree.count('scripted_selections')
+                    log_func(f"Selected regions {names} via the region tree.")
+                    return True
+                # Some nodes were already toggled: let the caller reload the page, then re-read the tree
+                log_func(f"ERROR: Region tree nodes {missing} not found on the page. The cached tree is outdated.")
+                tree.invalidate()
+                self.region_tree_read = False
+                return False
+            tree.count('xpath_fallbacks')
+        for idx in region_indices:
+            if not self.select_region(idx, status_callback=log_func):
+                return False
+        return True
+
     # --- Region Report Download Method (FAF030 example) ---
     # Use retry decorator for the whole operation
     # Now uses DownloadFailedException correctly as it's defined above
     @retry_on_exception(exceptions=(WebDriverException, DownloadFailedException), retries=2, delay=15)
     def download_report_for_region(self, report_url, from_date, to_date, region_index, status_callback=None):
-        """Downloads a report requiring region selection (e.g., FAF030)."""
+        """
+        Downloads a report requiring region selection (e.g., FAF030). A tuple of
+        region indices ticks all of them for one combined export (see
+        download_regions_combined).
+        """
         log_func = status_callback or self._log
-        if region_index not in regions_data:
+        region_indices = tuple(region_index) if isinstance(region_index, (list, tuple)) else (region_index,)
+        if not region_indices or any(idx not in regions_data for idx in region_indices):
              log_func(f"ERROR: Invalid region index {region_index} passed.")
              # Log this error clearly
-             self.write_log_to_csv([self.session_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), from_date, f"Failed (Invalid Region Index: {region_index})", to_date, "Invalid index provided"], csv_filename)
+             self.record_run([self.session_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "", from_date, f"Failed (Invalid Region Index: {region_index})", to_date, "Invalid index provided"])
              return False # Fail this specific region download attempt
 
-        region_name = regions_data[region_index]["name"]
+        region_name = "+".join(regions_data[idx]["name"] for idx in region_indices)
         log_func(f"--- Starting download for Region: {region_name} ({from_date} to {to_date}) ---")
 
         log_file_name = ""
@@ -1275,10 +1730,8 @@ class WebAutomation:
         log_error = ""
         downloaded_original_name = None
 
+        page_state = (report_url, region_indices)
         try:
-            log_func(f"Navigating to report URL: {report_url}")
-            self.driver.get(report_url)
-
             # !!! VERIFY ALL LOCATORS FOR REGION REPORT PAGE !!!
             sdate_locator = (By.ID, 'ctl00_MainContent_cbo_fromDate_dateInput')
             edate_locator = (By.ID, 'ctl00_MainContent_cbo_toDate_dateInput')
@@ -1288,66 +1741,58 @@ class WebAutomation:
             # Click outside element (verify XPath)
             close_dropdown_locator = (By.XPATH, "//div[contains(@class,'RadWindow')]//span[contains(text(), 'Báo Cáo Nhập Xuất Tồn FAF')]") # Example, needs verification
             # !!! THIS IS THE DOWNLOAD BUTTON LOCATOR FOR REGION REPORTS - VERIFY !!!
-            download_button_locator_region = (By.ID, 'ctl00_MainContent_btnExportExcel_input')
-
-            log_func("Waiting for date inputs...")
-            self.wait.until(EC.presence_of_element_located(sdate_locator))
-
-            # --- Enter Dates ---
-            log_func(f"Setting 'To Date': {to_date}")
-            edate_input = self.wait.until(EC.element_to_be_clickable(edate_locator))
-            edate_input.clear()
-            edate_input.send_keys(format_date_ddmmyyyy(to_date))
-
-            log_func(f"Setting 'From Date': {from_date}")
-            sdate_input = self.wait.until(EC.element_to_be_clickable(sdate_locator))
-            sdate_input.clear()
-            sdate_input.send_keys(format_date_ddmmyyyy(from_date))
-
-            # --- Open Region Tree and Select ---
-            log_func("Opening region selection tree...")
-            if not self.safe_click(tree_arrow_locator, "Region Tree Arrow", status_callback=log_func):
-                 raise DownloadFailedException("Failed to click open region selection tree arrow.")
-
-            # Select the specific region using its XPath
-            if not self.select_region(region_index, status_callback=log_func):
-                 # select_region already logged the error and took screenshot
-                 raise DownloadFailedException(f"Failed to select region '{region_name}'.")
-
-            # Click outside to close the tree (optional, but can help)
-            log_func("Attempting to close region dropdown...")
-            # Use safe_click, but failure might not be critical
-            self.safe_click(close_dropdown_locator, "Report Title (to close dropdown)", retries=1, status_callback=log_func)
-            time.sleep(SHORT_WAIT) # Wait after closing dropdown
+            download_button_locator_region = (By.ID, REGION_EXPORT_BUTTON)
+
+            def select_region_setup():
+                # --- Open Region Tree and Select ---
+                log_func("Opening region selection tree...")
+                if not self.safe_click(tree_arrow_locator, "Region Tree Arrow", status_callback=log_func):
+                     raise DownloadFailedException("Failed to click open region selection tree arrow.")
+
+                # Select the specific region(s) via the region tree (or their XPath)
+                if not self.select_regions(region_indices, status_callback=log_func):
+                     self.capture_screenshot(f"region_{region_name}_select_fail")
+                     raise DownloadFailedException(f"Failed to select region(s) '{region_name}'.")
+
+                # Click outside to close the tree (optional, but can help)
+                log_func("Attempting to close region dropdown...")
+                # Use safe_click, but failure might not be critical
+                self.arm_settle_wait()
+                self.safe_click(close_dropdown_locator, "Report Title (to close dropdown)", retries=1, status_callback=log_func)
+                self.wait_until_settled('after_dropdown_close', log_func) # Closing the tree may post the selection back
+
+            # --- Load Page and Select Region (or reuse the page of this region), Enter Dates ---
+            self._prepare_report_page(report_url, region_indices, sdate_locator, edate_locator, from_date, to_date, select_region_setup, log_func)
 
             # --- Click Region Download Button ---
             log_func(f"Locating and clicking region download button (Locator: {download_button_locator_region})...")
-            self.handle_alert(accept=True, status_callback=log_func)
-            self.update_files_before_download()
+            if self.handle_alert(accept=True, status_callback=log_func):
+                page_state = None
+            target_dir = self._prepare_download_target(log_func)
 
             # Use robust click for the region download button as well
             if self.robust_click_download_button(download_button_locator_region, description=f"Region {region_name} Download Button", status_callback=log_func):
                 log_func(f"Region {region_name} download click initiated. Checking alerts...")
-                self.handle_alert(accept=True, status_callback=log_func)
+                if self.handle_alert(accept=True, status_callback=log_func):
+                    page_state = None
 
                 # --- Wait for Download ---
-                downloaded_original_name = self.wait_for_download_to_finish(status_callback=log_func)
+                # Rename using region name as suffix
+                downloaded_original_name, renamed_file = self._collect_download(target_dir, from_date, to_date, f"_{region_name}", log_func)
 
                 if downloaded_original_name:
                     log_func(f"Download detected for region {region_name}: {downloaded_original_name}")
-                    # --- Process File ---
-                    # Rename using region name as suffix
-                    renamed_file = self.rename_downloaded_file(downloaded_original_name, from_date, to_date, f"_{region_name}", log_func)
                     log_file_name = renamed_file if renamed_file else downloaded_original_name
 
                     if downloaded_original_name.lower().endswith('.zip'):
-                        extracted_files = self.extract_zip_files(status_callback=log_func)
+                        extracted_files = self.extract_zip_files(status_callback=log_func, zip_names=[log_file_name])
                         # Rename all extracted files after extraction
                         for extracted_path in extracted_files:
                             self.rename_extract_file(extracted_path, from_date, to_date, f"_{region_name}", log_func)
 
                     log_status = "Success" if renamed_file else "Success (Rename Failed)"
                     log_func(f"Region {region_name} download and processing complete. File: {log_file_name}")
+                    self.page_state = page_state # Next chunk of this region can reuse the page
                 else: # wait_for_download_to_finish failed
                     log_error = f"Download wait timed out or failed for region {region_name}."
                     log_status = "Failed (Download Wait)"
@@ -1366,6 +1811,7 @@ class WebAutomation:
              log_status = log_status if log_status != "Failed (Region Initial)" else "Failed (Region Setup/Select/Click)"
              log_error = str(df_err)
              log_func(f"DownloadFailedException caught for region {region_name}: {log_error}")
+             self._fail_step(df_err)
              # Allow finally block to log
         except WebDriverException as e: # Catch WebDriver errors specifically
              log_status = "Failed (WebDriver Error)"
@@ -1380,6 +1826,7 @@ class WebAutomation:
                  log_func(f"ERROR: {log_error}")
                  self.capture_screenshot(f"region_{region_name}_webdriver_error")
                  traceback.print_exc()
+                 self._fail_step(e)
                  # Let finally block log
         except Exception as e:
              log_status = "Failed (Unexpected Error)"
@@ -1387,6 +1834,7 @@ class WebAutomation:
              log_func(f"FATAL ERROR: {log_error}")
              self.capture_screenshot(f"region_{region_name}_unexpected_error")
              traceback.print_exc()
+             self.last_error_class = OTHER
              # Let finally block log
 
         finally:
@@ -1396,19 +1844,199 @@ class WebAutomation:
                 datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                 log_file_name, from_date, log_status, to_date, log_error
             ]
-            self.write_log_to_csv(log_data)
-            log_func(f"Logged region download status '{log_status}' for {from_date}-{to_date}, Region: {region_name}.")
+            if len(region_indices) > 1 and log_status.startswith("Success"):
+                pass # A combined export is only an intermediate file: download_regions_combined records one row per region
+            else:
+                self.record_run(log_data)
+                log_func(f"Logged region download status '{log_status}' for {from_date}-{to_date}, Region: {region_name}.")
             log_func(f"--- Finished processing Region: {region_name} ---")
 
 
         # Return True/False based on success status
         return log_status.startswith("Success")
 
+    def download_regions_combined(self, report_url, from_date, to_date, region_indices, status_callback=None):
+        """
+        Exports ``region_indices`` in one combined region export and splits the
+        file locally into the per-region files (region_split.py). Each region
+        file is logged, cached and recorded in the chunk ledger like a
+        per-region download. Returns False when the export or the split fails.
+        """
+        log_func = status_callback or self._log
+        from chunk_planner import cost_key, get_cost_model, span_days
+        from region_split import RegionSplitError, split_export_by_region
+        region_names = [regions_data[idx]['name'] for idx in region_indices]
+        self.last_download_bytes = 0
+        self.last_download_file = None
+        started = time.time()
+        if not self.download_report_for_region(report_url, from_date, to_date, tuple(region_indices), status_callback=log_func) or not self.last_download_file:
+            return False
+        combined_file = self.last_download_file
+        elapsed = time.time() - started
+        try:
+            outputs = split_export_by_region(combined_file, region_names, from_date, to_date, log_func=log_func)
+        except RegionSplitError as e:
+            log_func(f"ERROR: Could not split combined export {os.path.basename(combined_file)}: {e}")
+            self.record_run([self.session_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), os.path.basename(combined_file), from_date, "Failed (Region Split)", to_date, str(e)])
+            return False
+
+        # Cost is recorded per region-day so plan estimates stay comparable with per-region exports
+        get_cost_model().record(cost_key(report_url, 'download_report_for_region'), span_days(from_date, to_date) * len(region_names), elapsed, self.last_download_bytes)
+        for region_name, path in outputs.items():
+            self.last_download_file = path
+            self.last_download_suffix = f"_{region_name}"
+            self._store_cached_chunk(report_url, 'download_report_for_region', region_name, from_date, to_date)
+            if self.checkpoint is not None:
+                self.checkpoint.record(from_date, to_date, True, path, region_name)
+            self.record_run([self.session_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), os.path.basename(path), from_date, "Success (Split)", to_date, ""])
+        if not config.REGION_SPLIT_KEEP_COMBINED:
+            try:
+                os.remove(combined_file)
+            except OSError as e:
+                log_func(f"Warning: Could not remove combined export {os.path.basename(combined_file)}: {e}")
+        return True
+
+    def _download_regions_combined_chunks(self, report_url, date_ranges, region_indices, log_func):
+        """
+        Runs one combined export per chunk for the regions of that chunk not yet
+        in the chunk ledger or the export cache. Returns the (from, to) chunks
+        that still need per-region exports (failed exports or splits, or a
+        single region left) and the (from, to, region_idx) pairs of those
+        chunks already served from the cache, which the per-region pass skips.
+        """
+        leftover = []
+        combined = []
+        served = set()
+        for from_date_chunk, to_date_chunk in date_ranges:
+            pending = []
+            for region_idx in region_indices:
+                region_name = regions_data[region_idx]['name']
+                if self.checkpoint is not None and self.checkpoint.is_complete(from_date_chunk, to_date_chunk, region_name):
+                    continue
+                if self._fetch_cached_chunk(report_url, 'download_report_for_region', region_name, from_date_chunk, to_date_chunk, log_func):
+                    served.add((from_date_chunk, to_date_chunk, region_idx))
+                    if self.checkpoint is not None:
+                        self.checkpoint.record(from_date_chunk, to_date_chunk, True, self.last_download_file, region_name)
+                    continue
+                pending.append(region_idx)
+            if len(pending) > 1:
+                combined.append((from_date_chunk, to_date_chunk, pending))
+            elif pending:
+                leftover.append((from_date_chunk, to_date_chunk))
+
+        exports_saved = 0
+        for chunk_num, (from_date_chunk, to_date_chunk, pending) in enumerate(combined, start=1):
+            if self.cancelled(log_func):
+                break
+            log_func(f"--- Combined Region Chunk {chunk_num}/{len(combined)}: {from_date_chunk} to {to_date_chunk} ({len(pending)} regions in one export) ---")
+            try:
+                chunk_ok = self.download_regions_combined(report_url, from_date_chunk, to_date_chunk, pending, status_callback=log_func)
+            except WebDriverException as e:
+                if "invalid session id" in str(e).lower():
+                    raise
+                log_func(f"ERROR: Combined region export failed: {type(e).__name__} - {str(e)[:150]}...")
+                chunk_ok = False
+            if chunk_ok:
+                exports_saved += len(pending) - 1
+            else:
+                leftover.append((from_date_chunk, to_date_chunk))
+        if combined:
+            log_func(f"Combined region export: {len(combined)} export(s) instead of {len(combined) + exports_saved}, {len(leftover)} chunk(s) left for per-region exports.")
+        leftover_set = set(leftover)
+        return sorted(leftover), {pair for pair in served if pair[:2] in leftover_set}
+
 
     # --- Chunking Methods ---
 
-    def split_date_range(self, start_date_str, end_date_str, chunk_size):
-        """Splits a date range into smaller chunks."""
+    # --- Export Result Cache (export_cache.py) ---
+
+    def _fetch_cached_chunk(self, report_url, variant, region, from_date, to_date, log_func):
+        """
+        Serves an immutable chunk from the export cache: places the cached file in
+        the download folder and extracts/renames it like a fresh download.
+        Returns True on a cache hit.
+        """
+        if not config.EXPORT_CACHE_ENABLED:
+            return False
+        from export_cache import get_export_cache
+        cache = get_export_cache()
+        if not cache.is_immutable(to_date):
+            return False
+        path, entry = cache.materialise(cache.key(report_url, variant, region, from_date, to_date), self.download_folder)
+        if not path:
+            return False
+        stored_name = self._adopt_export_file(path, entry.get('suffix', ""), from_date, to_date, log_func)
+        region_note = f" (region {region})" if region else ""
+        log_func(f"Export cache hit: {from_date} to {to_date}{region_note} served from cache as {stored_name}.")
+        self.record_run([self.session_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), stored_name, from_date, "Success (Cached)", to_date, ""])
+        return True
+
+    def _adopt_export_file(self, path, suffix, from_date, to_date, log_func):
+        """
+        Treats an export file placed in the download folder (from the cache or
+        another run) like a fresh download: extracts and renames zip contents.
+        Returns the stored file name.
+        """
+        stored_name = os.path.basename(path)
+        self.before_download.add(stored_name)
+        self.last_download_file = path
+        self.last_download_bytes = os.path.getsize(path)
+        self.last_download_suffix = suffix or ""
+        if stored_name.lower().endswith('.zip'):
+            for extracted_path in self.extract_zip_files(status_callback=log_func, zip_names=[stored_name]):
+                self.rename_extract_file(extracted_path, from_date, to_date, self.last_download_suffix, log_func)
+        return stored_name
+
+    def _store_cached_chunk(self, report_url, variant, region, from_date, to_date):
+        """Adds the last successful download to the export cache when its range is immutable."""
+        if not config.EXPORT_CACHE_ENABLED or not self.last_download_file:
+            return
+        from export_cache import get_export_cache
+        cache = get_export_cache()
+        if cache.is_immutable(to_date):
+            cache.store(cache.key(report_url, variant, region, from_date, to_date), self.last_download_file,
+                        report_url=report_url, variant=variant, region=region or '', from_date=from_date,
+                        to_date=to_date, suffix=self.last_download_suffix)
+
+    # --- Request Coalescing (coalesce.py) ---
+
+    def _claim_chunk(self, report_url, variant, region, from_date, to_date, log_func, allow_partial=True):
+        """
+        Coalesces a chunk with the exports of other runs. Returns (flight, adopted, gaps):
+        the Flight this run now leads (pass it to _finish_chunk_flight) or None,
+        the (from, to, path) exports taken over from other runs, and the
+        (from, to) ranges this run still has to export itself.
+        """
+        if not config.COALESCE_ENABLED:
+            return None, [], [(from_date, to_date)]
+        from coalesce import get_coalescer
+        from export_cache import place_in_folder
+        flight, borrowed, gaps = get_coalescer().claim((report_url, variant, region or ''), from_date, to_date, self.session_id, allow_partial)
+        region_note = f" (region {region})" if region else ""
+        adopted = []
+        for other in borrowed:
+            try:
+                path = place_in_folder(other.file_path, self.download_folder, os.path.basename(other.file_path), config.EXPORT_CACHE_LINK_MODE)
+            except OSError as e:
+                log_func(f"Warning: Could not take over {os.path.basename(other.file_path)} from run {other.owner}: {e}")
+                gaps.append((other.from_date, other.to_date))
+                continue
+            stored_name = self._adopt_export_file(path, other.suffix, other.from_date, other.to_date, log_func)
+            log_func(f"Coalesced: {other.from_date} to {other.to_date}{region_note} was exported by run {other.owner}; using {stored_name}.")
+            self.record_run([self.session_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), stored_name, other.from_date, "Success (Coalesced)", other.to_date, ""])
+            adopted.append((other.from_date, other.to_date, path))
+        return flight, adopted, sorted(gaps)
+
+    def _finish_chunk_flight(self, flight, ok, file_path=None):
+        """Hands the outcome of a led chunk export to runs waiting for the same days."""
+        from coalesce import get_coalescer
+        get_coalescer().finish(flight, ok, (file_path or self.last_download_file) if ok else None, self.last_download_suffix)
+
+    def split_date_range(self, start_date_str, end_date_str, chunk_size, planner=None):
+        """
+        Splits a date range into smaller chunks. chunk_size is a number of days,
+        'month', or 'auto' (lengths chosen by ``planner``, an AdaptiveChunkPlanner).
+        """
         log_func = self._log # Use internal logger
         try:
             start = datetime.strptime(start_date_str, '%Y-%m-%d')
@@ -1421,6 +2049,12 @@ class WebAutomation:
             log_func(f"Warning: Start date {start_date_str} is after end date {end_date_str}. No chunks generated.")
             return []
 
+        if chunk_size == 'auto':
+            if planner is None:
+                chunk_size = config.CHUNK_AUTO_DEFAULT_DAYS
+            else:
+                return planner.split(start_date_str, end_date_str)
+
         date_ranges = []
         current_start = start
 
@@ -1451,24 +2085,84 @@ class WebAutomation:
     def _download_chunks_base(self, download_method, report_url, start_date, end_date, chunk_size, status_callback=None, **kwargs):
         """Base function to handle downloading in chunks."""
         log_func = status_callback or self._log
+        from chunk_planner import AdaptiveChunkPlanner, bisect_range, cost_key, get_cost_model, span_days
+        method_name = download_method.__name__
+        chunk_cost_key = cost_key(report_url, method_name, kwargs.get('region_index'), self.export_engine)
+        planner = None
+        if chunk_size == 'auto':
+            planner = AdaptiveChunkPlanner(chunk_cost_key, log_func=log_func)
+            log_func(f"Adaptive chunking: {planner.describe()}.")
         log_func(f"Splitting date range {start_date} to {end_date} with chunk size/mode: {chunk_size}.")
-        date_ranges = self.split_date_range(start_date, end_date, chunk_size)
+        date_ranges = self.split_date_range(start_date, end_date, chunk_size, planner=planner)
+        checkpoint = self.checkpoint
+        ledger_region = regions_data[kwargs['region_index']]['name'] if kwargs.get('region_index') in regions_data else None
+        if checkpoint is not None and checkpoint.resume and date_ranges:
+            # Only download the days the chunk ledger has no successful chunk for
+            gaps = checkpoint.missing_ranges(start_date, end_date, ledger_region)
+            if not gaps:
+                log_func(f"Resume: {start_date} to {end_date} was already downloaded completely. Skipping report.")
+                return
+            date_ranges = [r for gap_from, gap_to in gaps for r in self.split_date_range(gap_from, gap_to, chunk_size, planner=planner)]
+            log_func(f"Resume: {len(gaps)} missing range(s): {', '.join(f'{a} to {b}' for a, b in gaps)}.")
         total_chunks = len(date_ranges)
         success_count = 0
         fail_count = 0
+        bisected_count = 0
+        cached_count = 0
+        coalesced_count = 0
+        parent_chunks = {} # (from, to) of a bisected half -> (from, to) of the failed chunk
 
         if not date_ranges:
              message = f"Could not split date range {start_date} to {end_date} or range is invalid. No download performed."
              log_func(f"WARNING: {message}")
              # Log failure for the whole range?
-             self.write_log_to_csv([self.session_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "", start_date, "Failed (Date Split)", end_date, message], csv_filename)
+             self.record_run([self.session_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "", start_date, "Failed (Date Split)", end_date, message])
              return # Cannot proceed
 
         log_func(f"Total chunks to process: {total_chunks}")
 
-        for i, (from_date_chunk, to_date_chunk) in enumerate(date_ranges):
+        # Replay the export over HTTP instead of driving the browser when selected
+        if self.export_engine == 'http':
+            from http_export import HTTP_EXPORT_VARIANTS
+            if download_method.__name__ in HTTP_EXPORT_VARIANTS:
+                log_func("Using HTTP export engine (browser is only used for login).")
+                download_method = functools.partial(self._http_download, download_method.__name__)
+            else:
+                log_func(f"Warning: HTTP export engine does not support '{download_method.__name__}'. Using the browser.")
+
+        # Hand the chunks to the parallel worker pool when one is attached
+        if self.worker_pool is not None and total_chunks > 1 and not isinstance(download_method, functools.partial):
+            cached_count = 0
+            uncached_ranges = []
+            for from_date_chunk, to_date_chunk in date_ranges:
+                if self._fetch_cached_chunk(report_url, method_name, ledger_region, from_date_chunk, to_date_chunk, log_func):
+                    cached_count += 1
+                    if checkpoint is not None:
+                        checkpoint.record(from_date_chunk, to_date_chunk, True, self.last_download_file, ledger_region)
+                else:
+                    uncached_ranges.append((from_date_chunk, to_date_chunk))
+            if uncached_ranges:
+                success_count, fail_count = self.worker_pool.run_chunks(
+                    method_name, report_url, uncached_ranges, status_callback=log_func, cost_key=chunk_cost_key,
+                    bisect=config.CHUNK_BISECT_ON_FAILURE, checkpoint=checkpoint, cache_variant=method_name,
+                    cache_region=ledger_region, **kwargs
+                )
+            success_count += cached_count
+            cache_note = f", From cache: {cached_count}" if cached_count else ""
+            log_func(f"Finished processing all {total_chunks} chunks. Success: {success_count}, Failed: {fail_count}{cache_note}.")
+            return
+
+        i = 0
+        while i < len(date_ranges):
+            from_date_chunk, to_date_chunk = date_ranges[i]
             chunk_num = i + 1
-            log_func(f"--- Starting Chunk {chunk_num}/{total_chunks}: {from_date_chunk} to {to_date_chunk} ---")
+            total_chunks = len(date_ranges) # Can change when adaptive chunking re-plans or a chunk is bisected
+            parent = parent_chunks.get((from_date_chunk, to_date_chunk))
+            sub_chunk_note = f" (half of failed chunk {parent[0]} to {parent[1]})" if parent else ""
+            if self.cancelled(log_func):
+                fail_count += (total_chunks - i)
+                break
+            log_func(f"--- Starting Chunk {chunk_num}/{total_chunks}: {from_date_chunk} to {to_date_chunk}{sub_chunk_note} ---")
 
             # Introduce a flag to check if the browser session is still valid
             if not self.is_session_valid():
@@ -1476,18 +2170,46 @@ class WebAutomation:
                 fail_count += (total_chunks - i) # Mark remaining chunks as failed
                 break
 
+            chunk_ok = False
+            stop_chunks = False
+            from_cache = False
+            flight = None
+            adopted = []
+            self.last_download_bytes = 0
+            self.last_download_file = None
+            chunk_started = time.time()
             try:
-                # Call the specific download method passed as argument
-                # Pass kwargs which might include region_index for region downloads
-                if download_method(report_url=report_url, from_date=from_date_chunk, to_date=to_date_chunk, status_callback=log_func, **kwargs):
+                # Immutable ranges exported before (by any config) are served from the export cache
+                if self._fetch_cached_chunk(report_url, method_name, ledger_region, from_date_chunk, to_date_chunk, log_func):
                      success_count += 1
-                     log_func(f"--- Completed Chunk {chunk_num}/{total_chunks} Successfully ---")
+                     chunk_ok = True
+                     from_cache = True
+                     cached_count += 1
+                     log_func(f"--- Completed Chunk {chunk_num}/{total_chunks}{sub_chunk_note} from the export cache ---")
                 else:
-                     # Method returned False, indicating failure was logged internally
-                     fail_count += 1
-                     log_func(f"--- Completed Chunk {chunk_num}/{total_chunks} with FAILURE (Check Logs) ---")
-                     # Optional: Add a longer pause after a failure
-                     # time.sleep(RETRY_DELAY)
+                    # Share exports with other runs asking for the same report and days
+                    flight, adopted, gaps = self._claim_chunk(report_url, method_name, ledger_region, from_date_chunk, to_date_chunk, log_func)
+                    if adopted:
+                         success_count += 1
+                         chunk_ok = True
+                         coalesced_count += 1
+                         if gaps:
+                             date_ranges[i + 1:i + 1] = gaps
+                             log_func(f"Remaining part of this chunk still to export: {', '.join(f'{a} to {b}' for a, b in gaps)}.")
+                         log_func(f"--- Completed Chunk {chunk_num}/{total_chunks}{sub_chunk_note} with exports of another run ---")
+                    # Call the specific download method passed as argument
+                    # Pass kwargs which might include region_index for region downloads
+                    elif download_method(report_url=report_url, from_date=from_date_chunk, to_date=to_date_chunk, status_callback=log_func, **kwargs):
+                         success_count += 1
+                         chunk_ok = True
+                         self._store_cached_chunk(report_url, method_name, ledger_region, from_date_chunk, to_date_chunk)
+                         log_func(f"--- Completed Chunk {chunk_num}/{total_chunks}{sub_chunk_note} Successfully ---")
+                    else:
+                         # Method returned False, indicating failure was logged internally
+                         fail_count += 1
+                         log_func(f"--- Completed Chunk {chunk_num}/{total_chunks}{sub_chunk_note} with FAILURE (Check Logs) ---")
+                         # Optional: Add a longer pause after a failure
+                         # time.sleep(RETRY_DELAY)
 
             # Catch exceptions that might occur *outside* the decorated download_method
             # (e.g., if download_method itself raises something unexpected or if session becomes invalid between chunks)
@@ -1496,10 +2218,11 @@ class WebAutomation:
                  error_msg = f"WebDriver ERROR in Chunk {chunk_num}/{total_chunks} ({from_date_chunk} to {to_date_chunk}): {type(wd_e).__name__} - {str(wd_e)[:150]}..."
                  log_func(error_msg)
                  traceback.print_exc()
-                 self.write_log_to_csv([self.session_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "", from_date_chunk, f"Failed in Chunk (WebDriver)", to_date_chunk, error_msg], csv_filename)
-                 if "invalid session id" in str(wd_e).lower():
+                 self.record_run([self.session_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "", from_date_chunk, f"Failed in Chunk (WebDriver)", to_date_chunk, error_msg])
+                 if classify_error(wd_e) == SESSION_LOST:
                      log_func("FATAL: Session became invalid. Stopping further chunks.")
                      fail_count += (total_chunks - (i + 1)) # Mark remaining as failed
+                     stop_chunks = True
                      break # Stop processing chunks
 
             except Exception as e:
@@ -1507,14 +2230,47 @@ class WebAutomation:
                 error_msg = f"UNEXPECTED ERROR in Chunk {chunk_num}/{total_chunks} ({from_date_chunk} to {to_date_chunk}): {type(e).__name__} - {e}"
                 log_func(error_msg)
                 traceback.print_exc()
-                self.write_log_to_csv([self.session_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "", from_date_chunk, f"Failed in Chunk (Unexpected)", to_date_chunk, error_msg], csv_filename)
+                self.record_run([self.session_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "", from_date_chunk, f"Failed in Chunk (Unexpected)", to_date_chunk, error_msg])
                 # Consider stopping if errors are critical
 
             finally:
-                # Pause between chunks
-                if chunk_num < total_chunks:
-                    log_func(f"Pausing {SHORT_WAIT * 2}s before next chunk...")
-                    time.sleep(SHORT_WAIT * 2)
+                if flight is not None:
+                    self._finish_chunk_flight(flight, chunk_ok)
+                # Learn the export cost; in 'auto' mode also re-size the remaining chunks
+                chunk_seconds = time.time() - chunk_started
+                if from_cache or adopted:
+                    pass # No export happened, so there is no cost to learn
+                elif planner is not None:
+                    if planner.observe(from_date_chunk, to_date_chunk, chunk_seconds, self.last_download_bytes, chunk_ok) and chunk_num < len(date_ranges):
+                        next_start = (datetime.strptime(to_date_chunk, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+                        remaining = checkpoint.missing_ranges(next_start, end_date, ledger_region) if checkpoint is not None else [(next_start, end_date)]
+                        date_ranges[i + 1:] = [r for gap_from, gap_to in remaining for r in planner.split(gap_from, gap_to)]
+                        log_func(f"Re-planned remaining range {next_start} to {end_date} into {len(date_ranges) - chunk_num} chunks.")
+                elif chunk_ok:
+                    get_cost_model().record(chunk_cost_key, span_days(from_date_chunk, to_date_chunk), chunk_seconds, self.last_download_bytes)
+                if checkpoint is not None and adopted:
+                    for adopted_from, adopted_to, adopted_path in adopted:
+                        checkpoint.record(adopted_from, adopted_to, True, adopted_path, ledger_region)
+                elif checkpoint is not None:
+                    checkpoint.record(from_date_chunk, to_date_chunk, chunk_ok, self.last_download_file if chunk_ok else None, ledger_region)
+                # Retry a failed chunk as two halves (recursively, down to CHUNK_BISECT_MIN_DAYS)
+                if not chunk_ok and not stop_chunks and config.CHUNK_BISECT_ON_FAILURE:
+                    halves = bisect_range(from_date_chunk, to_date_chunk, config.CHUNK_BISECT_MIN_DAYS)
+                    if halves:
+                        fail_count -= 1 # Only chunks that cannot be split further count as failed
+                        bisected_count += 1
+                        date_ranges[i + 1:i + 1] = halves
+                        for half in halves:
+                            parent_chunks[half] = (from_date_chunk, to_date_chunk)
+                        log_func(f"Bisecting failed chunk {from_date_chunk} to {to_date_chunk} into "
+                                 f"{halves[0][0]}..{halves[0][1]} and {halves[1][0]}..{halves[1][1]}; retrying both.")
+                    else:
+                        log_func(f"Chunk {from_date_chunk} to {to_date_chunk} cannot be split further. Giving up on this range.")
+                i += 1
+                # Pause between chunks (not needed after a cache hit: the server was not used)
+                if chunk_num < len(date_ranges) and not from_cache and not adopted and not stop_chunks:
+                    self.wait_until_settled('between_chunks', log_func)
+                    self.pause('chunk_throttle', config.INTER_CHUNK_PAUSE_SECONDS, log_func)
                     # Avoid refresh unless absolutely necessary, it can cause state loss
                     # try:
                     #     log_func("Refreshing page...")
@@ -1527,11 +2283,18 @@ class WebAutomation:
                     #         log_func("ERROR: Session invalid after refresh attempt. Stopping.")
                     #         break # Stop if refresh failed critically
 
-        log_func(f"Finished processing all {total_chunks} chunks. Success: {success_count}, Failed: {fail_count}.")
+        bisect_note = f", Bisected: {bisected_count}" if bisected_count else ""
+        cache_note = f", From cache: {cached_count}" if cached_count else ""
+        cache_note += f", Coalesced: {coalesced_count}" if coalesced_count else ""
+        log_func(f"Finished processing all {len(date_ranges)} chunks. Success: {success_count}, Failed: {fail_count}{bisect_note}{cache_note}.")
 
 
     # --- Public Chunking Wrappers (Called by app.py) ---
 
+    def download_report_chunks(self, variant, report_url, start_date, end_date, chunk_size, status_callback=None):
+        """Downloads a report in chunks with the setup variant named in report_registry.py."""
+        self._download_chunks_base(getattr(self, variant), report_url, start_date, end_date, chunk_size, status_callback)
+
     def download_reports_in_chunks(self, report_url, start_date, end_date, chunk_size, status_callback=None):
         """Downloads generic reports in chunks."""
         self._download_chunks_base(self.download_generic_report, report_url, start_date, end_date, chunk_size, status_callback)
@@ -1576,20 +2339,66 @@ class WebAutomation:
             return
 
         # Chunking happens *outside* the region loop. Each chunk iterates through regions.
+        from chunk_planner import AdaptiveChunkPlanner, cost_key, get_cost_model, span_days
+        region_cost_key = cost_key(report_url, 'download_report_for_region')
+        planner = None
+        if chunk_size == 'auto':
+            # One plan for all regions (chunks are shared), sized from the combined history
+            planner = AdaptiveChunkPlanner(region_cost_key, log_func=log_func)
+            log_func(f"Adaptive chunking: {planner.describe()}.")
         log_func(f"Splitting date range {start_date} to {end_date} for region download.")
-        date_ranges = self.split_date_range(start_date, end_date, chunk_size)
+        date_ranges = self.split_date_range(start_date, end_date, chunk_size, planner=planner)
         total_chunks = len(date_ranges)
 
         if not date_ranges:
              message = f"Could not split date range {start_date} to {end_date} for region download. No download performed."
              log_func(f"WARNING: {message}")
-             self.write_log_to_csv([self.session_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "", start_date, "Failed (Region Date Split)", end_date, message], csv_filename)
+             self.record_run([self.session_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "", start_date, "Failed (Region Date Split)", end_date, message])
              return
 
+        served_pairs = set() # (from, to, region_idx) already served by the combined pass
+        if config.REGION_COMBINED_EXPORT and len(regions_to_process) > 1:
+            # One export for all regions per chunk, split locally (region_split.py)
+            date_ranges, served_pairs = self._download_regions_combined_chunks(report_url, date_ranges, regions_to_process, log_func)
+            if not date_ranges:
+                log_func("Finished processing all chunks for selected regions.")
+                return
+            total_chunks = len(date_ranges)
+            log_func(f"Falling back to per-region exports for {total_chunks} chunk(s).")
+
         log_func(f"Total chunks: {total_chunks}, Regions per chunk: {len(regions_to_process)}")
+        failed_region_chunks = [] # (from, to, region_idx) retried by bisection after the main pass
+
+        # Fan region x chunk pairs out across the parallel worker pool when one is attached
+        if self.worker_pool is not None and total_chunks * len(regions_to_process) > 1:
+            region_names = {idx: regions_data[idx]['name'] for idx in regions_to_process}
+            cached_pairs = set()
+            for from_date_chunk, to_date_chunk in date_ranges:
+                for region_idx in regions_to_process:
+                    region_name = region_names[region_idx]
+                    if self.checkpoint is not None and self.checkpoint.is_complete(from_date_chunk, to_date_chunk, region_name):
+                        continue
+                    if (from_date_chunk, to_date_chunk, region_idx) in served_pairs:
+                        continue
+                    if self._fetch_cached_chunk(report_url, 'download_report_for_region', region_name, from_date_chunk, to_date_chunk, log_func):
+                        cached_pairs.add((from_date_chunk, to_date_chunk, region_idx))
+                        if self.checkpoint is not None:
+                            self.checkpoint.record(from_date_chunk, to_date_chunk, True, self.last_download_file, region_name)
+            success_count, fail_count = self.worker_pool.run_region_chunks(
+                report_url, date_ranges, regions_to_process, region_names,
+                max_per_region=config.REGION_MAX_CONCURRENCY, status_callback=log_func,
+                cost_key=region_cost_key, bisect=config.CHUNK_BISECT_ON_FAILURE, checkpoint=self.checkpoint,
+                skip=cached_pairs | served_pairs
+            )
+            success_count += len(cached_pairs)
+            cache_note = f", From cache: {len(cached_pairs)}" if cached_pairs else ""
+            log_func(f"Finished processing all chunks for selected regions. Success: {success_count}, Failed: {fail_count}{cache_note}.")
+            return
 
         for i, (from_date_chunk, to_date_chunk) in enumerate(date_ranges):
             chunk_num = i + 1
+            if self.cancelled(log_func):
+                break
             log_func(f"--- Starting Region Chunk {chunk_num}/{total_chunks}: {from_date_chunk} to {to_date_chunk} ---")
 
             chunk_success_count = 0
@@ -1604,15 +2413,46 @@ class WebAutomation:
 
             for region_idx in regions_to_process:
                  region_name = regions_data[region_idx]['name']
+                 if self.checkpoint is not None and self.checkpoint.is_complete(from_date_chunk, to_date_chunk, region_name):
+                     log_func(f"Resume: Region {region_name} {from_date_chunk} to {to_date_chunk} already downloaded. Skipping.")
+                     chunk_success_count += 1
+                     continue
+                 if (from_date_chunk, to_date_chunk, region_idx) in served_pairs:
+                     chunk_success_count += 1 # Served from the export cache by the combined pass
+                     continue
+                 if self._fetch_cached_chunk(report_url, 'download_report_for_region', region_name, from_date_chunk, to_date_chunk, log_func):
+                     chunk_success_count += 1
+                     if self.checkpoint is not None:
+                         self.checkpoint.record(from_date_chunk, to_date_chunk, True, self.last_download_file, region_name)
+                     continue
+                 # Take over the same region chunk when another run is exporting (or just exported) it
+                 flight, adopted, _ = self._claim_chunk(report_url, 'download_report_for_region', region_name, from_date_chunk, to_date_chunk, log_func, allow_partial=False)
+                 if adopted:
+                     chunk_success_count += 1
+                     if self.checkpoint is not None:
+                         self.checkpoint.record(from_date_chunk, to_date_chunk, True, adopted[0][2], region_name)
+                     continue
                  log_func(f"--- Processing Region: {region_name} (Index: {region_idx}) for Chunk {chunk_num} ---")
 
                  # Call the single region download method (which includes retries)
+                 region_ok = False
                  try:
                      # Pass the single index, not the list
+                     self.last_download_bytes = 0
+                     self.last_download_file = None
+                     region_started = time.time()
                      if self.download_report_for_region(report_url, from_date_chunk, to_date_chunk, region_idx, status_callback=log_func):
+                          region_ok = True
                           chunk_success_count += 1
+                          get_cost_model().record(region_cost_key, span_days(from_date_chunk, to_date_chunk), time.time() - region_started, self.last_download_bytes)
+                          self._store_cached_chunk(report_url, 'download_report_for_region', region_name, from_date_chunk, to_date_chunk)
+                          if self.checkpoint is not None:
+                              self.checkpoint.record(from_date_chunk, to_date_chunk, True, self.last_download_file, region_name)
                      else:
                           chunk_fail_count += 1
+                          if self.checkpoint is not None:
+                              self.checkpoint.record(from_date_chunk, to_date_chunk, False, region=region_name)
+                          failed_region_chunks.append((from_date_chunk, to_date_chunk, region_idx))
                           # Failure logged by download_report_for_region
                  except WebDriverException as wd_region_e:
                      # Catch session errors during the region loop
@@ -1621,7 +2461,7 @@ class WebAutomation:
                      log_func(error_msg)
                      traceback.print_exc()
                      # Log specific failure for this region/chunk
-                     self.write_log_to_csv([self.session_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "", from_date_chunk, f"Failed (Region: {region_name}, WebDriver Error)", to_date_chunk, error_msg], csv_filename)
+                     self.record_run([self.session_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "", from_date_chunk, f"Failed (Region: {region_name}, WebDriver Error)", to_date_chunk, error_msg])
                      if "invalid session id" in str(wd_region_e).lower():
                          log_func("FATAL: Session became invalid during region processing. Stopping all.")
                          # Need a way to break out of outer loops or signal failure
@@ -1632,23 +2472,72 @@ class WebAutomation:
                      error_msg = f"UNEXPECTED ERROR processing Region {region_name} in Chunk {chunk_num}: {type(e_region).__name__} - {e_region}"
                      log_func(error_msg)
                      traceback.print_exc()
-                     self.write_log_to_csv([self.session_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "", from_date_chunk, f"Failed (Region: {region_name}, Unexpected)", to_date_chunk, error_msg], csv_filename)
+                     self.record_run([self.session_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "", from_date_chunk, f"Failed (Region: {region_name}, Unexpected)", to_date_chunk, error_msg])
+                     failed_region_chunks.append((from_date_chunk, to_date_chunk, region_idx))
                      # Consider if unexpected errors should stop the whole process
 
                  finally:
+                      if flight is not None:
+                          self._finish_chunk_flight(flight, region_ok)
                       # Pause briefly between regions within a chunk if needed
                       if len(regions_to_process) > 1:
-                           log_func(f"Pausing {SHORT_WAIT}s before next region...")
-                           time.sleep(SHORT_WAIT)
-                           # Check session validity between regions too?
+                           # Check the session first: settling a dead browser would wait for the full timeout
                            if not self.is_session_valid():
                                log_func(f"ERROR: WebDriver session invalid after processing region {region_name}. Stopping chunk.")
                                break # Stop processing regions for this chunk
+                           self.wait_until_settled('between_regions', log_func)
+                           self.pause('region_throttle', config.INTER_CHUNK_PAUSE_SECONDS, log_func)
 
             log_func(f"--- Completed Region Chunk {chunk_num}/{total_chunks}. Success: {chunk_success_count}, Failed: {chunk_fail_count} regions ---")
 
+        if failed_region_chunks and config.CHUNK_BISECT_ON_FAILURE:
+            self._bisect_failed_region_chunks(report_url, failed_region_chunks, region_cost_key, log_func)
         log_func("Finished processing all chunks for selected regions.")
 
+    def _bisect_failed_region_chunks(self, report_url, failed_chunks, region_cost_key, log_func):
+        """
+        Retries failed (from, to, region_idx) region chunks as two halves each,
+        recursively down to CHUNK_BISECT_MIN_DAYS, logging every sub-chunk.
+        """
+        from chunk_planner import bisect_range, get_cost_model, span_days
+        queue = list(failed_chunks)
+        recovered = given_up = 0
+        log_func(f"Retrying {len(queue)} failed region chunks by bisection...")
+        while queue:
+            from_date, to_date, region_idx = queue.pop(0)
+            region_name = regions_data[region_idx]['name']
+            halves = bisect_range(from_date, to_date, config.CHUNK_BISECT_MIN_DAYS)
+            if not halves:
+                given_up += 1
+                log_func(f"Region {region_name} {from_date} to {to_date} cannot be split further. Giving up on this range.")
+                continue
+            for half_from, half_to in halves:
+                if not self.is_session_valid():
+                    log_func("ERROR: WebDriver session invalid during bisection retries. Stopping.")
+                    return
+                log_func(f"--- Region {region_name} half {half_from} to {half_to} (of failed {from_date} to {to_date}) ---")
+                self.last_download_bytes = 0
+                self.last_download_file = None
+                half_started = time.time()
+                try:
+                    half_ok = self.download_report_for_region(report_url, half_from, half_to, region_idx, status_callback=log_func)
+                except WebDriverException as e:
+                    if "invalid session id" in str(e).lower():
+                        raise
+                    log_func(f"WebDriver ERROR for region {region_name} {half_from} to {half_to}: {type(e).__name__} - {str(e)[:150]}...")
+                    half_ok = False
+                if self.checkpoint is not None:
+                    self.checkpoint.record(half_from, half_to, half_ok, self.last_download_file if half_ok else None, region_name)
+                if half_ok:
+                    recovered += 1
+                    get_cost_model().record(region_cost_key, span_days(half_from, half_to), time.time() - half_started, self.last_download_bytes)
+                    self._store_cached_chunk(report_url, 'download_report_for_region', region_name, half_from, half_to)
+                    log_func(f"--- Region {region_name} half {half_from} to {half_to} succeeded ---")
+                else:
+                    log_func(f"--- Region {region_name} half {half_from} to {half_to} FAILED; will bisect again ---")
+                    queue.append((half_from, half_to, region_idx))
+        log_func(f"Bisection finished. Recovered sub-chunks: {recovered}, unrecoverable ranges: {given_up}.")
+
 
     # --- Session Check & Cleanup ---
     def is_session_valid(self):
@@ -1677,6 +2566,12 @@ class WebAutomation:
 
     def close(self):
         """Quits the WebDriver session gracefully."""
+        if self.http_engine is not None:
+            self.http_engine.close()
+            self.http_engine = None
+        if self.download_tracker is not None:
+            self.download_tracker.close()
+            self.download_tracker = None
         if self.driver:
             try:
                 self._log("Closing WebDriver session...")
@@ -0,0 +1,74 @@
+# filename: page_waits.py
+"""
+Condition-based waits for the report pages.
+
+The download loop used to sleep SHORT_WAIT after radio clicks and region
+clicks and between chunks and regions. WebAutomation now arms the page before
+such an action (ARM_SETTLE_JS hooks __doPostBack and the ASP.NET AJAX
+PageRequestManager) and afterwards polls PAGE_SETTLED_JS until the page is
+idle: the document is complete, no full or partial (UpdatePanel) postback is
+pending and no jQuery request is active. A full postback replaces the
+document, which drops the hooks, so the new page counts as settled once it is
+complete.
+
+Time spent per wait reason is counted in a wait stats dict
+({reason: {'count', 'seconds', 'timeouts'}}) kept per WebAutomation.
+"""
+
+# Hooks the page so a postback started by the next action is noticed
+ARM_SETTLE_JS = """
+window.__biPostback = false;
+window.__biArmedAt = Date.now();
+if (window.__doPostBack && !window.__doPostBack.__biWrapped) {
+    var original = window.__doPostBack;
+    window.__doPostBack = function () { window.__biPostback = true; return original.apply(this, arguments); };
+    window.__doPostBack.__biWrapped = true;
+}
+if (window.Sys && Sys.WebForms && Sys.WebForms.PageRequestManager && !window.__biPrmHooked) {
+    var prm = Sys.WebForms.PageRequestManager.getInstance();
+    prm.add_beginRequest(function () { window.__biPostback = true; });
+    prm.add_endRequest(function () { window.__biPostback = false; });
+    window.__biPrmHooked = true;
+}
+"""
+
+# True when the page is idle; arguments[0] = grace period (ms) for a postback scheduled by setTimeout
+PAGE_SETTLED_JS = """
+if (document.readyState !== 'complete') { return false; }
+if (window.__biArmedAt && Date.now() - window.__biArmedAt < arguments[0]) { return false; }
+if (window.__biPostback) { return false; }
+if (window.Sys && Sys.WebForms && Sys.WebForms.PageRequestManager &&
+    Sys.WebForms.PageRequestManager.getInstance().get_isInAsyncPostBack()) { return false; }
+if (window.jQuery && window.jQuery.active) { return false; }
+return true;
+"""
+
+
+def record_wait(stats, reason, seconds, timed_out=False):
+    """Adds one wait of ``seconds`` under ``reason`` to a wait stats dict."""
+    entry = stats.setdefault(reason, {'count': 0, 'seconds': 0.0, 'timeouts': 0})
+    entry['count'] += 1
+    entry['seconds'] += seconds
+    if timed_out:
+        entry['timeouts'] += 1
+
+
+def merge_wait_stats(target, source):
+    """Adds every reason of ``source`` to ``target`` (in place) and returns it."""
+    for reason, entry in source.items():
+        merged = target.setdefault(reason, {'count': 0, 'seconds': 0.0, 'timeouts': 0})
+        for key in merged:
+            merged[key] += entry.get(key, 0)
+    return target
+
+
+def describe_wait_stats(stats):
+    """One line per run: total wait time and the reasons sorted by time spent."""
+    if not stats:
+        return "Wait time: none."
+    total = sum(entry['seconds'] for entry in stats.values())
+    parts = []
+    for reason, entry in sorted(stats.items(), key=lambda item: -item[1]['seconds']):
+        timeouts = f", {entry['timeouts']} timed out" if entry['timeouts'] else ""
+        parts.append(f"{reason} {entry['seconds']:.1f}s/{entry['count']}x{timeouts}")
+    return f"Wait time: {total:.1f}s ({'; '.join(parts)})."
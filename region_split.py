@@ -0,0 +1,126 @@
+# filename: region_split.py
+"""
+Splits a combined multi-region export into per-region files.
+
+Region reports (FAF030) used to be exported once per region. With
+REGION_COMBINED_EXPORT all selected regions are ticked in a single export and
+the resulting file is split locally: the region column is normalised once,
+mapped to the region names of ``regions_data`` and grouped with a pandas
+groupby. Each group is written next to the combined file under the name the
+per-region export would have had ('<name>_<DDMMYYYY>_<DDMMYYYY>_<region><ext>').
+"""
+import csv
+import json
+import os
+import unicodedata
+
+import pandas as pd # type: ignore
+
+import config
+
+HEADER_SCAN_ROWS = 30 # BI exports may carry title rows above the column header
+
+
+class RegionSplitError(Exception):
+    """The combined export cannot be split (unsupported file, no region column, ...)."""
+    pass
+
+
+def normalize_label(value):
+    """Lower-case, accent-free, whitespace-free form of a region label."""
+    text = unicodedata.normalize('NFKD', str(value)).encode('ascii', 'ignore').decode('ascii')
+    return ''.join(text.lower().split())
+
+
+def region_aliases(region_names):
+    """Normalised label -> region name, including REGION_SPLIT_ALIASES (JSON: {"Ho Chi Minh": "HCM"})."""
+    aliases = {normalize_label(name): name for name in region_names}
+    try:
+        extra = json.loads(config.REGION_SPLIT_ALIASES or '{}')
+    except ValueError:
+        print(f"Warning: REGION_SPLIT_ALIASES is not valid JSON: {config.REGION_SPLIT_ALIASES}")
+        extra = {}
+    for label, name in extra.items():
+        if name in region_names:
+            aliases[normalize_label(label)] = name
+    return aliases
+
+
+def _read_export(file_path):
+    """Reads the export without a header and returns (frame, extension)."""
+    extension = os.path.splitext(file_path)[1].lower()
+    try:
+        if extension == '.csv':
+            # Title rows above the header have fewer fields than the data rows
+            with open(file_path, 'r', newline='', encoding='utf-8-sig') as f:
+                frame = pd.DataFrame(list(csv.reader(f))).fillna('')
+        elif extension in ('.xlsx', '.xls'):
+            frame = pd.read_excel(file_path, header=None, dtype=str, keep_default_na=False)
+        else:
+            raise RegionSplitError(f"Unsupported export type '{extension}' for region split.")
+    except RegionSplitError:
+        raise
+    except Exception as e:
+        raise RegionSplitError(f"Could not read '{os.path.basename(file_path)}': {type(e).__name__} - {e}")
+    return frame, extension
+
+
+def _locate_header(frame, column):
+    """Index of the first row containing ``column`` and the position of that cell."""
+    wanted = normalize_label(column)
+    head = frame.head(HEADER_SCAN_ROWS).apply(lambda col: col.map(normalize_label))
+    hits = (head == wanted)
+    if not hits.values.any():
+        raise RegionSplitError(f"Region column '{column}' not found in the first {HEADER_SCAN_ROWS} rows of the export.")
+    row = hits.any(axis=1).idxmax()
+    return row, int(hits.loc[row].values.argmax())
+
+
+def split_export_by_region(file_path, region_names, from_date, to_date, column=None, log_func=None):
+    """
+    Splits the combined export ``file_path`` into one file per name in
+    ``region_names``. Returns {region_name: path}. Regions without rows get a
+    header-only file, so every selected region still has its output.
+    """
+    from logic_download import build_target_name
+    log = log_func or print
+    column = column or config.REGION_SPLIT_COLUMN
+    frame, extension = _read_export(file_path)
+    header_row, region_pos = _locate_header(frame, column)
+    header = frame.iloc[header_row].tolist()
+    data = frame.iloc[header_row + 1:]
+    data = data[(data != '').any(axis=1)] # Drop blank trailing rows
+
+    aliases = region_aliases(region_names)
+    regions = data.iloc[:, region_pos].map(normalize_label).map(aliases)
+    unmatched = int(regions.isna().sum())
+    if unmatched:
+        samples = data.iloc[:, region_pos][regions.isna()].unique()[:5]
+        log(f"Warning: {unmatched} row(s) of the combined export match no selected region (e.g. {', '.join(map(str, samples))}). They are left out.")
+
+    # Per-region files follow the per-region export naming; .xls is rewritten as .xlsx
+    source_name = os.path.basename(file_path)
+    base_name = os.path.splitext(source_name)[0]
+    combined_suffix = "_" + "+".join(region_names)
+    if base_name.endswith(combined_suffix):
+        base_name = base_name[:-len(combined_suffix)]
+    base_name = base_name.rsplit('_', 2)[0] # Drop the _<from>_<to> dates added by build_target_name
+    out_extension = '.csv' if extension == '.csv' else '.xlsx'
+
+    folder = os.path.dirname(file_path)
+    groups = dict(tuple(data.groupby(regions, sort=False)))
+    outputs = {}
+    for name in region_names:
+        part = groups.get(name, data.iloc[0:0])
+        target = os.path.join(folder, build_target_name(base_name + out_extension, from_date, to_date, f"_{name}"))
+        part = pd.DataFrame(part.values, columns=header)
+        try:
+            if out_extension == '.csv':
+                part.to_csv(target, index=False, encoding='utf-8-sig')
+            else:
+                part.to_excel(target, index=False)
+        except Exception as e:
+            raise RegionSplitError(f"Could not write '{os.path.basename(target)}': {type(e).__name__} - {e}")
+        outputs[name] = target
+        log(f"Split region {name}: {len(part)} row(s) -> {os.path.basename(target)}")
+    return outputs
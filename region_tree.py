@@ -0,0 +1,185 @@
+# filename: region_tree.py
+"""
+Region (department) tree discovery for region reports.
+
+Instead of one hard-coded absolute XPath per region, WebAutomation reads the
+RadTreeView of the region report page once per session with a single script
+(DISCOVER_TREE_JS). Region name -> node path ('0.3' = 4th child of the 1st
+root node) is kept in a process-wide RegionTree, persisted to
+REGION_TREE_CACHE_PATH and trusted for REGION_TREE_TTL_HOURS. Several regions
+are then ticked in one script execution (SELECT_NODES_JS).
+
+Discovered regions are merged into ``logic_download.regions_data``: known
+names keep their index (saved configs refer to regions by index), new names
+get the next free index, so a region added to the tree is offered by
+/download/api/get-reports-regions without a code change. The name -> index
+map is persisted in the cache file and never shrinks, so an assigned index
+keeps pointing to the same region when the cache is rebuilt, the tree order
+changes or a region disappears and comes back.
+"""
+import json
+import os
+import threading
+import time
+
+import config
+
+# Returns [{name, path, depth}] for every node of the first tree matching arguments[0]
+DISCOVER_TREE_JS = """
+var tree = document.querySelector(arguments[0]);
+if (!tree) { return null; }
+var nodes = [];
+var items = tree.querySelectorAll('li.rtLI');
+for (var i = 0; i < items.length; i++) {
+    var li = items[i];
+    var label = li.querySelector(':scope > div .rtIn');
+    if (!label) { continue; }
+    var path = [];
+    for (var el = li; el && el !== tree; el = el.parentElement) {
+        if (el.tagName === 'LI') { path.unshift(Array.prototype.indexOf.call(el.parentElement.children, el)); }
+    }
+    nodes.push({name: label.textContent.trim(), path: path.join('.'), depth: path.length - 1});
+}
+return nodes;
+"""
+
+# Ticks the nodes at the paths in arguments[1]; returns the paths that were not found
+SELECT_NODES_JS = """
+var tree = document.querySelector(arguments[0]);
+if (!tree) { return arguments[1]; }
+var rootList = tree.querySelector('ul.rtUL');
+var missing = [];
+arguments[1].forEach(function (path) {
+    var list = rootList, li = null;
+    var parts = path.split('.');
+    for (var i = 0; i < parts.length && list; i++) {
+        li = list.children[parseInt(parts[i], 10)] || null;
+        list = li && i < parts.length - 1 ? li.querySelector(':scope > ul.rtUL') : null;
+    }
+    var target = li && (li.querySelector(':scope > div .rtChk') || li.querySelector(':scope > div .rtIn'));
+    if (target) { target.click(); } else { missing.push(path); }
+});
+return missing;
+"""
+
+
+class RegionTree:
+    """Region name -> tree node path, persisted with a TTL."""
+
+    def __init__(self, path=None, ttl_hours=None):
+        self.path = path or config.REGION_TREE_CACHE_PATH
+        self.ttl_seconds = (config.REGION_TREE_TTL_HOURS if ttl_hours is None else ttl_hours) * 3600
+        self._lock = threading.Lock()
+        self._nodes = {}
+        self._indices = {} # Region name -> regions_data index ever assigned to it
+        self.discovered_at = 0
+        self.counters = {'discoveries': 0, 'scripted_selections': 0, 'xpath_fallbacks': 0}
+        self._load()
+
+    # --- Persistence ---
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._nodes = dict(data.get('nodes', {}))
+            self._indices = {name: int(idx) for name, idx in data.get('indices', {}).items()}
+            self.discovered_at = float(data.get('discovered_at', 0))
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read region tree cache {self.path}: {e}")
+            return
+        with self._lock:
+            if self._merge_into_regions(self._nodes):
+                self._save()
+
+    def _save(self):
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'discovered_at': self.discovered_at, 'nodes': self._nodes, 'indices': self._indices}, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Warning: Could not save region tree cache {self.path}: {e}")
+
+    # --- Discovery Results ---
+
+    def is_fresh(self):
+        return bool(self._nodes) and time.time() - self.discovered_at < self.ttl_seconds
+
+    def update(self, discovered_nodes):
+        """Stores the region level of a DISCOVER_TREE_JS result. Returns the number of regions."""
+        nodes = {
+            node['name']: node['path'] for node in discovered_nodes or []
+            if node.get('name') and node.get('depth') == config.REGION_TREE_DEPTH
+        }
+        if not nodes:
+            return 0
+        with self._lock:
+            self._nodes = nodes
+            self.discovered_at = time.time()
+            self.counters['discoveries'] += 1
+            self._merge_into_regions(nodes)
+            self._save()
+        return len(nodes)
+
+    def invalidate(self):
+        """Forces a new discovery (e.g. a cached node path no longer matched the page)."""
+        with self._lock:
+            self.discovered_at = 0
+
+    def count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def node_path(self, region_name):
+        with self._lock:
+            return self._nodes.get(region_name)
+
+    def _merge_into_regions(self, nodes):
+        """
+        Adds discovered regions to regions_data (in place) and records node
+        paths. New names get their persisted index, else the next index never
+        used before. Returns True when an index was assigned (the caller saves).
+        """
+        from logic_download import regions_data
+        assigned = False
+        with _regions_lock:
+            by_name = {data['name']: idx for idx, data in regions_data.items()}
+            for name, idx in by_name.items():
+                if name not in nodes:
+                    regions_data[idx].pop('node', None) # No longer in the tree: XPath only
+                if self._indices.get(name) != idx:
+                    self._indices[name] = idx
+                    assigned = True
+            for name, node_path in nodes.items():
+                if name in by_name:
+                    regions_data[by_name[name]]['node'] = node_path
+                    continue
+                idx = self._indices.get(name)
+                if idx is None or idx in regions_data:
+                    idx = max(list(regions_data) + list(self._indices.values()), default=-1) + 1
+                    self._indices[name] = idx
+                    assigned = True
+                regions_data[idx] = {'name': name, 'xpath': None, 'node': node_path}
+        return assigned
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, regions=len(self._nodes), discovered_at=self.discovered_at,
+                        fresh=self.is_fresh(), ttl_hours=self.ttl_seconds / 3600)
+
+
+_tree = None
+_tree_lock = threading.Lock()
+_regions_lock = threading.Lock() # Serialises changes to logic_download.regions_data
+
+
+def get_region_tree():
+    """Returns the process-wide RegionTree (loading the on-disk cache on first use)."""
+    global _tree
+    with _tree_lock:
+        if _tree is None:
+            _tree = RegionTree()
+        return _tree
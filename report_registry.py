@@ -0,0 +1,61 @@
+# filename: report_registry.py
+"""
+Declarative registry of the downloadable BI reports.
+
+Each report names its setup variant (the WebAutomation download method that
+prepares the page, e.g. the FAF004 Imports/Exports radio button), whether it
+needs a region selection and the locator of its export button. Report URLs
+stay in link_report.py. download_plan.py compiles a run's configuration into
+an ordered execution plan from these entries, replacing the per-report
+dispatch chain.
+"""
+import config
+import link_report
+
+DEFAULT_EXPORT_BUTTON = 'ctl00_MainContent_btnExportCSVDemo_input'
+REGION_EXPORT_BUTTON = 'ctl00_MainContent_btnExportExcel_input'
+REPORT_TYPE_RADIO_PREFIX = 'ctl00_MainContent_rblType_'
+
+# Page setup per download method: report type radio to click (None = leave the
+# page default) and the suffix appended to stored file names.
+SETUP_VARIANTS = {
+    'download_report_001': {'radio': REPORT_TYPE_RADIO_PREFIX + '1', 'suffix': ""},
+    'download_report_004N': {'radio': REPORT_TYPE_RADIO_PREFIX + '1', 'suffix': "N"}, # Imports
+    'download_report_004X': {'radio': REPORT_TYPE_RADIO_PREFIX + '0', 'suffix': "X"}, # Exports
+    'download_generic_report': {'radio': None, 'suffix': ""},
+    'download_report_for_region': {'radio': None, 'suffix': "_<region>"},
+}
+
+GENERIC_REPORT = {'variant': 'download_generic_report', 'region_required': False, 'export_button': DEFAULT_EXPORT_BUTTON}
+
+REPORT_REGISTRY = {
+    "FAF001 - Sales Report": {'variant': 'download_report_001', 'region_required': False, 'export_button': DEFAULT_EXPORT_BUTTON},
+    "FAF002 - Dosage Report": GENERIC_REPORT,
+    "FAF003 - Report Of Other Imports And Exports": GENERIC_REPORT,
+    "FAF004N - Internal Rotation Report (Imports)": {'variant': 'download_report_004N', 'region_required': False, 'export_button': DEFAULT_EXPORT_BUTTON},
+    "FAF004X - Internal Rotation Report (Exports)": {'variant': 'download_report_004X', 'region_required': False, 'export_button': DEFAULT_EXPORT_BUTTON},
+    "FAF005 - Detailed Report Of Imports": GENERIC_REPORT,
+    "FAF006 - Supplier Return Report": GENERIC_REPORT,
+    "FAF028 - Detailed Import - Export Transaction Report": GENERIC_REPORT,
+    "FAF030 - FAF Inventory Report": {'variant': 'download_report_for_region', 'region_required': True, 'export_button': REGION_EXPORT_BUTTON},
+}
+
+
+def get_report_spec(report_type):
+    """
+    Returns the registry entry of ``report_type`` with its 'name' and 'url',
+    or None when the report has no URL. Reports missing from the registry
+    use the generic setup.
+    """
+    url = link_report.get_report_url(report_type)
+    if not url:
+        return None
+    normalized = report_type.strip().lower()
+    name, spec = next(((name, spec) for name, spec in REPORT_REGISTRY.items() if name.lower() == normalized),
+                      (report_type.strip(), GENERIC_REPORT))
+    spec = dict(spec, name=name, url=url)
+    # Pages listed in config.REGION_REQUIRED_REPORT_URLS always need a region
+    spec['region_required'] = spec['region_required'] or url in config.REGION_REQUIRED_REPORT_URLS
+    if spec['region_required']:
+        spec['variant'] = 'download_report_for_region'
+    return spec
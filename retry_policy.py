@@ -0,0 +1,259 @@
+# filename: retry_policy.py
+"""
+Error-class-aware retry policy and a process-wide circuit breaker.
+
+Failures are classified (``classify_error``) into session loss, stale
+elements, intercepted clicks, BI server error pages, timeouts, wrong
+locators, failed downloads and other errors. Each class has its own retry
+budget and exponential backoff with jitter (``RetryPolicy``): a stale element
+is retried within a second, a wrong locator is not retried at all, and a
+server error backs off for minutes. Defaults can be overridden globally
+(RETRY_POLICY) and per report (RETRY_POLICY_BY_REPORT).
+
+Server errors and timeouts also feed the ``CircuitBreaker``. When
+CIRCUIT_FAILURE_THRESHOLD of them happen within CIRCUIT_WINDOW_SECONDS the
+breaker opens and every download attempt (main browser and workers) pauses
+for the cooldown; afterwards a single attempt probes the site, closing the
+breaker on success or reopening it with a doubled cooldown.
+
+Retry outcomes are counted in a retry stats dict
+({error_class: {'errors', 'retries', 'gave_up', 'backoff_seconds'}}) kept per
+WebAutomation and logged at the end of each run.
+"""
+import json
+import random
+import threading
+import time
+from collections import deque
+
+from selenium.common.exceptions import ( # type: ignore
+    ElementClickInterceptedException, ElementNotInteractableException, InvalidSelectorException,
+    NoSuchElementException, NoSuchWindowException, StaleElementReferenceException, TimeoutException
+)
+
+import config
+
+SESSION_LOST = 'session_lost'
+STALE_ELEMENT = 'stale_element'
+CLICK_INTERCEPTED = 'click_intercepted'
+SERVER_ERROR = 'server_error'
+TIMEOUT = 'timeout'
+LOCATOR = 'locator'
+DOWNLOAD = 'download'
+OTHER = 'other'
+
+# retries: extra attempts for this class; delays in seconds (doubled per attempt, capped)
+DEFAULT_POLICY = {
+    SESSION_LOST: {'retries': 0, 'base_delay': 5, 'max_delay': 30}, # The run (or worker pool) restarts the browser
+    STALE_ELEMENT: {'retries': 3, 'base_delay': 0.5, 'max_delay': 4},
+    CLICK_INTERCEPTED: {'retries': 3, 'base_delay': 1, 'max_delay': 8},
+    SERVER_ERROR: {'retries': 3, 'base_delay': 15, 'max_delay': 120},
+    TIMEOUT: {'retries': 2, 'base_delay': 10, 'max_delay': 90},
+    LOCATOR: {'retries': 0, 'base_delay': 0, 'max_delay': 0}, # Deterministic: retrying does not help
+    DOWNLOAD: {'retries': 0, 'base_delay': 10, 'max_delay': 60}, # Chunk bisection takes over
+    OTHER: {'retries': 1, 'base_delay': 5, 'max_delay': 30},
+}
+
+# Classes that point at the BI site being down rather than at one page
+SITE_DOWN_CLASSES = (SERVER_ERROR, TIMEOUT)
+
+SERVER_ERROR_MARKERS = (
+    'server error in', 'runtime error', 'service unavailable', 'bad gateway', 'gateway timeout',
+    'http error 500', 'http error 502', 'http error 503', 'http error 504', 'this site can’t be reached',
+    'err_connection', 'err_name_not_resolved',
+)
+
+
+def classify_error(error, page_text=None):
+    """Error class of an exception (``page_text``: title and text of the current page, if known)."""
+    message = str(error).lower()
+    if isinstance(error, NoSuchWindowException) or any(
+            marker in message for marker in ('invalid session id', 'session deleted', 'unable to connect to renderer')):
+        return SESSION_LOST
+    if page_text and any(marker in page_text.lower() for marker in SERVER_ERROR_MARKERS):
+        return SERVER_ERROR
+    if isinstance(error, StaleElementReferenceException):
+        return STALE_ELEMENT
+    if isinstance(error, (ElementClickInterceptedException, ElementNotInteractableException)):
+        return CLICK_INTERCEPTED
+    if isinstance(error, (NoSuchElementException, InvalidSelectorException)):
+        return LOCATOR
+    if isinstance(error, TimeoutException) or 'timed out' in message or 'connection refused' in message:
+        return TIMEOUT
+    if type(error).__name__ == 'DownloadFailedException':
+        return DOWNLOAD
+    return OTHER
+
+
+def _json_setting(value, name):
+    try:
+        return json.loads(value) if value else {}
+    except ValueError:
+        print(f"Warning: {name} is not valid JSON: {value}")
+        return {}
+
+
+class RetryPolicy:
+    """Retry budget and backoff per error class."""
+
+    def __init__(self, overrides=None, name='default', max_attempts=None, jitter=None):
+        self.name = name
+        self.max_attempts = config.RETRY_MAX_ATTEMPTS if max_attempts is None else max_attempts
+        self.jitter = config.RETRY_JITTER if jitter is None else jitter
+        self.rules = {error_class: dict(rule) for error_class, rule in DEFAULT_POLICY.items()}
+        for error_class, rule in (overrides or {}).items():
+            self.rules.setdefault(error_class, dict(DEFAULT_POLICY[OTHER])).update(rule)
+
+    def retries(self, error_class):
+        return int(self.rules.get(error_class, self.rules[OTHER]).get('retries', 0))
+
+    def delay(self, error_class, attempt):
+        """Backoff before retry number ``attempt`` (1-based) of ``error_class``, with jitter."""
+        rule = self.rules.get(error_class, self.rules[OTHER])
+        capped = min(float(rule.get('max_delay', 0)), float(rule.get('base_delay', 0)) * 2 ** (attempt - 1))
+        return capped * (1 - self.jitter * random.random())
+
+    def to_dict(self):
+        return {'name': self.name, 'max_attempts': self.max_attempts, 'jitter': self.jitter, 'rules': self.rules}
+
+
+def get_retry_policy(report_type=None):
+    """RetryPolicy with RETRY_POLICY overrides, plus RETRY_POLICY_BY_REPORT[report_type] when set."""
+    overrides = {}
+    for error_class, rule in _json_setting(config.RETRY_POLICY, 'RETRY_POLICY').items():
+        overrides.setdefault(error_class, {}).update(rule)
+    by_report = _json_setting(config.RETRY_POLICY_BY_REPORT, 'RETRY_POLICY_BY_REPORT')
+    report_rules = by_report.get(report_type) if report_type else None
+    for error_class, rule in (report_rules or {}).items():
+        overrides.setdefault(error_class, {}).update(rule)
+    return RetryPolicy(overrides, name=report_type if report_rules else 'default')
+
+
+# --- Retry Stats ---
+
+def record_retry(stats, error_class, retried, backoff_seconds=0.0):
+    """Counts one failure of ``error_class`` (retried or given up) in a retry stats dict."""
+    entry = stats.setdefault(error_class, {'errors': 0, 'retries': 0, 'gave_up': 0, 'backoff_seconds': 0.0})
+    entry['errors'] += 1
+    entry['retries' if retried else 'gave_up'] += 1
+    entry['backoff_seconds'] += backoff_seconds
+
+
+def merge_retry_stats(target, source):
+    """Adds every class of ``source`` to ``target`` (in place) and returns it."""
+    for error_class, entry in source.items():
+        merged = target.setdefault(error_class, {'errors': 0, 'retries': 0, 'gave_up': 0, 'backoff_seconds': 0.0})
+        for key in merged:
+            merged[key] += entry.get(key, 0)
+    return target
+
+
+def describe_retry_stats(stats):
+    if not stats:
+        return "Retries: no errors."
+    parts = [
+        f"{error_class} {entry['errors']} error(s), {entry['retries']} retried, {entry['gave_up']} given up, {entry['backoff_seconds']:.1f}s backoff"
+        for error_class, entry in sorted(stats.items(), key=lambda item: -item[1]['errors'])
+    ]
+    return f"Retries: {'; '.join(parts)}."
+
+
+# --- Circuit Breaker ---
+
+class CircuitBreaker:
+    """Pauses every download attempt while the BI site looks down."""
+
+    def __init__(self, threshold=None, window_seconds=None, cooldown_seconds=None, max_cooldown_seconds=None):
+        self.threshold = config.CIRCUIT_FAILURE_THRESHOLD if threshold is None else threshold
+        self.window_seconds = config.CIRCUIT_WINDOW_SECONDS if window_seconds is None else window_seconds
+        self.base_cooldown = config.CIRCUIT_COOLDOWN_SECONDS if cooldown_seconds is None else cooldown_seconds
+        self.max_cooldown = config.CIRCUIT_MAX_COOLDOWN_SECONDS if max_cooldown_seconds is None else max_cooldown_seconds
+        self._cond = threading.Condition()
+        self._failures = deque()
+        self.state = 'closed' # 'closed', 'open' or 'half_open'
+        self.cooldown = self.base_cooldown
+        self.opened_until = 0.0
+        self._probe_started = None
+        self.counters = {'opens': 0, 'site_failures': 0, 'paused_seconds': 0.0}
+
+    def _open(self, now):
+        self.state = 'open'
+        self.opened_until = now + self.cooldown
+        self._probe_started = None
+        self.counters['opens'] += 1
+        self._cond.notify_all()
+
+    def record(self, error_class):
+        """Reports the outcome of an attempt: None on success, else its error class."""
+        if self.threshold <= 0:
+            return
+        now = time.time()
+        with self._cond:
+            if error_class not in SITE_DOWN_CLASSES:
+                # The site answered (even a wrong locator means the page was served)
+                if self.state != 'closed' or self._failures:
+                    self.state = 'closed'
+                    self._failures.clear()
+                    self.cooldown = self.base_cooldown
+                    self._probe_started = None
+                    self._cond.notify_all()
+                return
+            self.counters['site_failures'] += 1
+            if self.state == 'half_open':
+                self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+                self._open(now)
+                return
+            self._failures.append(now)
+            while self._failures and now - self._failures[0] > self.window_seconds:
+                self._failures.popleft()
+            if self.state == 'closed' and len(self._failures) >= self.threshold:
+                self._open(now)
+
+    def wait_if_open(self, log_func=None):
+        """Blocks while the breaker is open (or another attempt is probing). Returns the seconds paused."""
+        log = log_func or print
+        started = time.time()
+        announced = False
+        with self._cond:
+            while True:
+                now = time.time()
+                if self.state == 'closed':
+                    break
+                if self.state == 'open':
+                    if now >= self.opened_until:
+                        self.state = 'half_open' # This attempt probes the site
+                        self._probe_started = now
+                        log("Circuit breaker half-open: probing the BI site with one attempt.")
+                        break
+                    if not announced:
+                        log(f"Circuit breaker OPEN: the BI site looks down. Pausing downloads for {self.opened_until - now:.0f}s.")
+                        announced = True
+                    self._cond.wait(self.opened_until - now)
+                    continue
+                # half_open: wait for the probe, or take over when it never reported back
+                if self._probe_started is None or now - self._probe_started > self.cooldown:
+                    self._probe_started = now
+                    break
+                self._cond.wait(1.0)
+            paused = time.time() - started
+            self.counters['paused_seconds'] += paused
+        return paused
+
+    def stats(self):
+        with self._cond:
+            return dict(self.counters, state=self.state, cooldown_seconds=self.cooldown,
+                        recent_failures=len(self._failures), threshold=self.threshold,
+                        window_seconds=self.window_seconds)
+
+
+_breaker = None
+_breaker_lock = threading.Lock()
+
+
+def get_circuit_breaker():
+    """Returns the process-wide CircuitBreaker."""
+    global _breaker
+    with _breaker_lock:
+        if _breaker is None:
+            _breaker = CircuitBreaker()
+        return _breaker
@@ -0,0 +1,273 @@
+# filename: run_history.py
+"""
+Download run history in SQLite.
+
+Chunk outcomes used to be appended to download_log.csv, opening and closing
+the file for every event, and multi-line Selenium messages (with their
+"Stacktrace:" frames) made the file unreadable for line-based tools.
+RunHistoryStore keeps the same rows (SessionID, Timestamp, File Name, Start
+Date, Status, End Date, Error Message, plus the report) in RUN_HISTORY_DB_PATH:
+
+- WAL mode, indexes on session, timestamp, report and status, so /get-logs
+  filters and pages without reading the whole history.
+- ``record`` only queues the row; a single writer thread commits queued rows
+  in batches (RUN_HISTORY_BATCH_SIZE, at least every RUN_HISTORY_FLUSH_SECONDS).
+- Error messages are stored on one line, without the Selenium stack trace.
+- The CSV logs in RUN_HISTORY_IMPORT_CSV are imported once (``import_csv``),
+  and ``export_csv`` writes the old CSV layout for tools that still read it.
+"""
+import atexit
+import csv
+import os
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+
+import config
+
+COLUMNS = ['SessionID', 'Timestamp', 'File Name', 'Start Date', 'Status', 'End Date', 'Error Message']
+FIELDS = ['session_id', 'timestamp', 'file_name', 'start_date', 'status', 'end_date', 'error_message'] # Same order as COLUMNS
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS run_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL DEFAULT '',
+    timestamp TEXT NOT NULL DEFAULT '',
+    report TEXT NOT NULL DEFAULT '',
+    file_name TEXT NOT NULL DEFAULT '',
+    start_date TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL DEFAULT '',
+    end_date TEXT NOT NULL DEFAULT '',
+    error_message TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS ix_run_history_session ON run_history (session_id);
+CREATE INDEX IF NOT EXISTS ix_run_history_timestamp ON run_history (timestamp);
+CREATE INDEX IF NOT EXISTS ix_run_history_report ON run_history (report, timestamp);
+CREATE INDEX IF NOT EXISTS ix_run_history_status ON run_history (status, timestamp);
+CREATE TABLE IF NOT EXISTS run_history_meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+INSERT = f"INSERT INTO run_history (report, {', '.join(FIELDS)}) VALUES ({', '.join('?' * (len(FIELDS) + 1))})"
+
+
+def clean_error_message(message):
+    """One-line error message without the Selenium stack trace."""
+    message = str(message or '').split('Stacktrace:', 1)[0]
+    return ' '.join(line.strip() for line in message.splitlines() if line.strip())
+
+
+def _normalise_timestamp(value):
+    value = (value or '').strip()
+    for fmt in (TIMESTAMP_FORMAT, '%Y-%m-%d %H:%M', '%d/%m/%Y %H:%M:%S', '%Y-%m-%dT%H:%M:%S'):
+        try:
+            return datetime.strptime(value, fmt).strftime(TIMESTAMP_FORMAT)
+        except ValueError:
+            continue
+    return value # Kept as is; such rows sort by their text
+
+
+def _row(log_data, report=''):
+    """(report, *FIELDS) insert values from a log_data list in COLUMNS order."""
+    values = [str(value) if value is not None else '' for value in list(log_data)[:len(FIELDS)]]
+    values += [''] * (len(FIELDS) - len(values))
+    values[1] = _normalise_timestamp(values[1])
+    values[6] = clean_error_message(values[6])
+    return [report or ''] + values
+
+
+class RunHistoryStore:
+    """Run history rows in SQLite, written by one buffered writer thread."""
+
+    def __init__(self, path=None, batch_size=None, flush_seconds=None):
+        self.path = path or config.RUN_HISTORY_DB_PATH
+        self.batch_size = max(1, batch_size or config.RUN_HISTORY_BATCH_SIZE)
+        self.flush_seconds = config.RUN_HISTORY_FLUSH_SECONDS if flush_seconds is None else flush_seconds
+        self._queue = queue.Queue()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self._read_conn = self._connect()
+        self._read_conn.executescript(SCHEMA)
+        self.counters = {'written': 0, 'batches': 0, 'write_errors': 0}
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL") # Durable across app crashes; WAL keeps the file consistent
+        return conn
+
+    # --- Writing ---
+
+    def record(self, log_data, report=''):
+        """Queues one row (``log_data`` in COLUMNS order); it is written by the writer thread."""
+        self._queue.put(_row(log_data, report))
+        if self._writer is None:
+            with self._writer_lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name='run-history-writer', daemon=True)
+                    self._writer.start()
+
+    def flush(self, timeout=10):
+        """Waits until the rows queued so far are written. Returns False on timeout."""
+        if self._writer is None:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            item = self._queue.get()
+            batch, waiters = [], []
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=self.flush_seconds) if not waiters else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._write_batch(conn, batch)
+            for done in waiters:
+                done.set()
+
+    def _write_batch(self, conn, batch):
+        try:
+            with conn: # One transaction per batch
+                conn.execute("BEGIN")
+                conn.executemany(INSERT, batch)
+            self.counters['written'] += len(batch)
+            self.counters['batches'] += 1
+        except sqlite3.Error as e:
+            self.counters['write_errors'] += 1
+            print(f"CRITICAL ERROR: Could not write {len(batch)} run history row(s) to {self.path}: {e}")
+            for row in batch:
+                print(f"LOG_DATA (history failed): {row}")
+
+    # --- Reading ---
+
+    @staticmethod
+    def _where(session_id=None, report=None, status=None, since=None, until=None):
+        clauses, params = [], []
+        if session_id:
+            clauses.append("session_id = ?")
+            params.append(session_id)
+        if report:
+            clauses.append("report = ?")
+            params.append(report)
+        if status:
+            # Prefix match ('Failed' matches 'Failed (WebDriver Error)'); GLOB can use the status index
+            clauses.append("status GLOB ?")
+            params.append(''.join(f"[{ch}]" if ch in '*?[' else ch for ch in status) + '*')
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            clauses.append("timestamp <= ?")
+            params.append(until)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def _select(self, sql, params):
+        with self._read_lock:
+            return self._read_conn.execute(sql, params).fetchall()
+
+    def query(self, limit=None, offset=0, **filters):
+        """Rows newest first as dicts keyed by COLUMNS (plus 'Report'). Filters: see ``_where``."""
+        where, params = self._where(**filters)
+        sql = f"SELECT report, {', '.join(FIELDS)} FROM run_history{where} ORDER BY timestamp DESC, id DESC"
+        if limit:
+            sql += " LIMIT ? OFFSET ?"
+            params += [int(limit), int(offset or 0)]
+        return [dict(zip(COLUMNS, row[1:]), Report=row[0]) for row in self._select(sql, params)]
+
+    def count(self, **filters):
+        where, params = self._where(**filters)
+        return self._select(f"SELECT COUNT(*) FROM run_history{where}", params)[0][0]
+
+    def export_csv(self, f, **filters):
+        """Writes the rows (oldest first) to the text file ``f`` in the old download_log.csv layout, plus Report."""
+        where, params = self._where(**filters)
+        with self._read_lock:
+            cursor = self._read_conn.execute(
+                f"SELECT {', '.join(FIELDS)}, report FROM run_history{where} ORDER BY timestamp, id", params
+            )
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS + ['Report'])
+            while True:
+                rows = cursor.fetchmany(1000)
+                if not rows:
+                    break
+                writer.writerows(rows)
+
+    # --- Migration ---
+
+    def import_csv(self, csv_path):
+        """
+        Imports an old CSV download log once (remembered by path). Rows
+        without a timestamp, such as the "Stacktrace:" lines split off by
+        line-based tools, are skipped. Returns (imported, skipped) or None if
+        the file is missing or was already imported.
+        """
+        csv_path = os.path.abspath(csv_path)
+        if not os.path.isfile(csv_path):
+            return None
+        meta_key = f"imported_csv:{csv_path}"
+        if self._select("SELECT 1 FROM run_history_meta WHERE key = ?", [meta_key]):
+            return None
+        rows, skipped = [], 0
+        with open(csv_path, 'r', newline='', encoding='utf-8', errors='replace') as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header is None:
+                index = list(range(len(COLUMNS)))
+            elif 'Timestamp' in header:
+                # Header names decide the order (an older header had End Date before Status)
+                index = [header.index(column) if column in header else None for column in COLUMNS]
+            else:
+                index = list(range(len(COLUMNS)))
+                reader = [header] + list(reader) # No header row: the first line is data
+            for record in reader:
+                values = [record[i] if i is not None and i < len(record) else '' for i in index]
+                timestamp = _normalise_timestamp(values[1])
+                if not timestamp or not timestamp[:4].isdigit():
+                    skipped += 1
+                    continue
+                rows.append(_row(values))
+        with self._read_lock:
+            with self._read_conn:
+                self._read_conn.execute("BEGIN")
+                self._read_conn.executemany(INSERT, rows)
+                self._read_conn.execute(
+                    "INSERT INTO run_history_meta (key, value) VALUES (?, ?)",
+                    [meta_key, f"{len(rows)} rows, {datetime.now().strftime(TIMESTAMP_FORMAT)}"]
+                )
+        print(f"Run history: imported {len(rows)} row(s) from {csv_path} ({skipped} malformed line(s) skipped).")
+        return len(rows), skipped
+
+    def stats(self):
+        return dict(self.counters, pending=self._queue.qsize(), rows=self.count())
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_run_history():
+    """Returns the process-wide RunHistoryStore, importing the old CSV logs on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = RunHistoryStore()
+            atexit.register(_store.flush) # Write buffered rows before the interpreter exits
+            for csv_path in config.RUN_HISTORY_IMPORT_CSV:
+                try:
+                    _store.import_csv(csv_path)
+                except (OSError, csv.Error, sqlite3.Error) as e:
+                    print(f"Warning: Could not import run history from {csv_path}: {e}")
+        return _store
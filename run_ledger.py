@@ -0,0 +1,291 @@
+# filename: run_ledger.py
+"""
+Durable chunk checkpoint ledger for resumable runs.
+
+Every finished chunk is appended to CHUNK_LEDGER_PATH (one JSON object per
+line) keyed by (scope, report_type, region, from_date, to_date) with its
+status, stored file name, SHA-256 and run id. The scope is the saved config
+name, or 'manual:<email>' for ad-hoc runs.
+
+A run started with ``resume`` consults the ledger through ``RunCheckpoint``
+and only downloads the days not yet covered by a successful chunk, so a
+re-run of a failed back-fill costs just the missing chunks. The parameters
+of the last run (without the password) are kept in LAST_RUN_PATH for the
+"Resume last run" action.
+
+Report entries may also use relative dates that are resolved at run time:
+``from_date`` 'since_last_success' starts the day after the last day covered
+by a successful chunk in the ledger, and 'today', 'yesterday' or 'today-N'
+work for either bound, so a daily scheduled config only fetches new days.
+"""
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+import config
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def ledger_scope(params):
+    """Ledger scope of a run: its saved config name, else the account."""
+    return params.get('config_name') or f"manual:{params.get('email', '').strip().lower()}"
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _days(from_date, to_date):
+    day = datetime.strptime(from_date, '%Y-%m-%d')
+    end = datetime.strptime(to_date, '%Y-%m-%d')
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+
+class ChunkLedger:
+    """Append-only JSON-lines ledger of chunk outcomes, indexed in memory."""
+
+    def __init__(self, path=None):
+        self.path = path or config.CHUNK_LEDGER_PATH
+        self._lock = threading.Lock()
+        self._entries = {} # (scope, report_type, region) -> {(from, to): entry}
+        self._load()
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    self._index(json.loads(line))
+                except (ValueError, KeyError) as e:
+                    # A crash can leave a truncated last line; skip it
+                    print(f"Warning: Skipping unreadable ledger line {line_no} in {self.path}: {e}")
+
+    def _index(self, entry):
+        group = self._entries.setdefault((entry['scope'], entry['report_type'], entry.get('region') or ''), {})
+        group[(entry['from_date'], entry['to_date'])] = entry # Latest outcome of a range wins
+
+    def record(self, scope, report_type, region, from_date, to_date, status, file_name="", sha256="", run_id=""):
+        """Appends one chunk outcome and makes it durable (fsync) before returning."""
+        entry = {
+            'scope': scope, 'report_type': report_type, 'region': region or '',
+            'from_date': from_date, 'to_date': to_date, 'status': status,
+            'file': file_name or '', 'sha256': sha256 or '', 'run_id': run_id or '',
+            'recorded_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._index(entry)
+        return entry
+
+    def covered_days(self, scope, report_type, region, from_date, to_date):
+        """Days in [from_date, to_date] covered by successful chunks."""
+        lo = datetime.strptime(from_date, '%Y-%m-%d')
+        hi = datetime.strptime(to_date, '%Y-%m-%d')
+        covered = set()
+        with self._lock:
+            entries = list(self._entries.get((scope, report_type, region or ''), {}).values())
+        for entry in entries:
+            if entry['status'] != 'success' or entry['to_date'] < from_date or entry['from_date'] > to_date:
+                continue
+            covered.update(day for day in _days(entry['from_date'], entry['to_date']) if lo <= day <= hi)
+        return covered
+
+    def last_success_date(self, scope, report_type, region=None):
+        """Last day covered by a successful chunk ('YYYY-MM-DD'), or None without history."""
+        with self._lock:
+            entries = list(self._entries.get((scope, report_type, region or ''), {}).values())
+        return max((entry['to_date'] for entry in entries if entry['status'] == 'success'), default=None)
+
+    def first_missing_date(self, scope, report_type, region=None):
+        """
+        First day ('YYYY-MM-DD') not covered by a successful chunk, looking from
+        the earliest recorded chunk (failed ones included) up to the last
+        successful day; the day after that when there is no gap. None without
+        a successful chunk.
+        """
+        last_day = self.last_success_date(scope, report_type, region)
+        if last_day is None:
+            return None
+        with self._lock:
+            entries = list(self._entries.get((scope, report_type, region or ''), {}).values())
+        first_day = min(entry['from_date'] for entry in entries)
+        covered = self.covered_days(scope, report_type, region, first_day, last_day)
+        for day in _days(first_day, last_day):
+            if day not in covered:
+                return day.strftime('%Y-%m-%d')
+        return (datetime.strptime(last_day, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+class RunCheckpoint:
+    """Ledger view for one report of one run (what to skip, what to record)."""
+
+    def __init__(self, ledger, scope, report_type, run_id, resume=False, log_func=None):
+        self.ledger = ledger
+        self.scope = scope
+        self.report_type = report_type
+        self.run_id = run_id
+        self.resume = resume
+        self._log = log_func or print
+
+    def missing_ranges(self, from_date, to_date, region=None):
+        """Contiguous (from, to) gaps not yet covered by a successful chunk."""
+        if not self.resume:
+            return [(from_date, to_date)]
+        covered = self.ledger.covered_days(self.scope, self.report_type, region, from_date, to_date)
+        gaps, gap_start, previous = [], None, None
+        for day in _days(from_date, to_date):
+            if day in covered:
+                if gap_start is not None:
+                    gaps.append((gap_start.strftime('%Y-%m-%d'), previous.strftime('%Y-%m-%d')))
+                    gap_start = None
+            elif gap_start is None:
+                gap_start = day
+            previous = day
+        if gap_start is not None:
+            gaps.append((gap_start.strftime('%Y-%m-%d'), previous.strftime('%Y-%m-%d')))
+        return gaps
+
+    def is_complete(self, from_date, to_date, region=None):
+        return self.resume and not self.missing_ranges(from_date, to_date, region)
+
+    def record(self, from_date, to_date, ok, file_path=None, region=None):
+        """Records a chunk outcome; hashes the stored file of successful chunks."""
+        file_name, sha256 = "", ""
+        if file_path and os.path.isfile(file_path):
+            file_name = os.path.basename(file_path)
+            if ok:
+                try:
+                    sha256 = file_sha256(file_path)
+                except OSError as e:
+                    self._log(f"Warning: Could not hash {file_name} for the ledger: {e}")
+        try:
+            self.ledger.record(self.scope, self.report_type, region, from_date, to_date,
+                               'success' if ok else 'failed', file_name, sha256, self.run_id)
+        except OSError as e:
+            self._log(f"Warning: Could not write chunk ledger {self.ledger.path}: {e}")
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger():
+    """Returns the process-wide ChunkLedger."""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = ChunkLedger()
+        return _ledger
+
+
+# --- Relative / Incremental Dates ---
+
+SINCE_LAST_SUCCESS = 'since_last_success'
+
+
+def _relative_date(value, today):
+    """Resolves 'today', 'yesterday' and 'today-N'; returns None for anything else."""
+    token = str(value).strip().lower().replace(' ', '')
+    if token == 'today':
+        return today
+    if token == 'yesterday':
+        return today - timedelta(days=1)
+    if token.startswith('today-') and token[len('today-'):].isdigit():
+        return today - timedelta(days=int(token[len('today-'):]))
+    return None
+
+
+def _resolve_date(value, today, field):
+    relative = _relative_date(value, today)
+    if relative is not None:
+        return relative.strftime('%Y-%m-%d')
+    try:
+        return datetime.strptime(str(value).strip(), '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f"Invalid {field} '{value}'. Use YYYY-MM-DD, today, yesterday, today-N"
+                         f"{' or ' + SINCE_LAST_SUCCESS if field == 'from_date' else ''}.")
+
+
+def is_incremental(report_info):
+    """True for report entries whose from_date is 'since_last_success'."""
+    return str(report_info.get('from_date')).strip().lower() == SINCE_LAST_SUCCESS
+
+
+def resolve_report_dates(report_info, ledger, scope, regions=None, log_func=None, today=None):
+    """
+    Turns the from_date/to_date of a report entry into concrete dates.
+
+    'since_last_success' starts at the first day of this report in ``scope``
+    that no successful chunk covers (an earlier failed chunk included), else
+    the day after the last successful chunk; for region reports the region
+    that is furthest behind. Such runs skip the days already covered (see
+    RunCheckpoint), so only the gaps are fetched. Without history it starts
+    at the entry's ``initial_from_date``, or INCREMENTAL_FIRST_RUN_DAYS days
+    before to_date.
+    Returns (from_date, to_date); from_date > to_date means nothing is new.
+    """
+    log = log_func or print
+    today = today or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    report_type = report_info.get('report_type')
+    to_date = _resolve_date(report_info.get('to_date'), today, 'to_date')
+    from_value = report_info.get('from_date')
+    if not is_incremental(report_info):
+        return _resolve_date(from_value, today, 'from_date'), to_date
+
+    first_days = [ledger.first_missing_date(scope, report_type, region) for region in (regions or [None])]
+    if first_days and all(first_days):
+        from_date = min(first_days)
+        if from_date > to_date:
+            log(f"Incremental: '{report_type}' is up to date (covered up to {to_date}).")
+        else:
+            log(f"Incremental: first day of '{report_type}' not yet downloaded is {from_date}; fetching the missing days up to {to_date}.")
+        return from_date, to_date
+
+    if report_info.get('initial_from_date'):
+        from_date = _resolve_date(report_info['initial_from_date'], today, 'initial_from_date')
+    else:
+        first_run_days = max(1, config.INCREMENTAL_FIRST_RUN_DAYS)
+        from_date = (datetime.strptime(to_date, '%Y-%m-%d') - timedelta(days=first_run_days - 1)).strftime('%Y-%m-%d')
+    log(f"Incremental: no successful download of '{report_type}' in '{scope}' yet; starting at {from_date}.")
+    return from_date, to_date
+
+
+# --- Last Run (for "Resume last run") ---
+
+def save_last_run(params):
+    """Stores the parameters of the current run, without the password."""
+    stored = {k: v for k, v in params.items() if k not in ('password', 'resume')}
+    stored['saved_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    try:
+        with open(config.LAST_RUN_PATH, 'w', encoding='utf-8') as f:
+            json.dump(stored, f, indent=4, ensure_ascii=False)
+    except OSError as e:
+        print(f"Warning: Could not save last run parameters: {e}")
+
+
+def load_last_run():
+    """Returns the stored parameters of the last run, or None."""
+    if not os.path.isfile(config.LAST_RUN_PATH):
+        return None
+    try:
+        with open(config.LAST_RUN_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read last run parameters: {e}")
+        return None
@@ -0,0 +1,189 @@
+# filename: schedule_queue.py
+"""
+Persistent priority queue between the scheduler and the job manager.
+
+Scheduler triggers enqueue their config instead of starting a run. A
+dispatcher thread hands the best entry (highest priority, then oldest) to the
+job manager whenever a download slot is free, so a scheduled run is delayed
+behind manual runs rather than dropped. The queue is stored in
+SCHEDULE_QUEUE_PATH, so pending (and interrupted) scheduled runs survive a
+restart of the app.
+
+- Deduplication: a config that is already waiting is not queued twice; the
+  new trigger is coalesced into the waiting entry (keeping its place and
+  raising its priority if needed).
+- Deadline: an entry still waiting SCHEDULE_QUEUE_DEADLINE_MINUTES after its
+  first trigger is dropped as expired (0 = wait forever).
+- Metrics: queue depth, dispatched/coalesced/expired counts and wait time
+  from trigger to dispatch (``stats``).
+"""
+import json
+import os
+import threading
+import time
+
+import config
+
+PENDING = 'pending'
+DISPATCHED = 'dispatched'
+
+
+class ScheduleQueue:
+    """Scheduled configs waiting for a download slot."""
+
+    def __init__(self, path=None, deadline_minutes=None):
+        self.path = path or config.SCHEDULE_QUEUE_PATH
+        self.deadline_seconds = (config.SCHEDULE_QUEUE_DEADLINE_MINUTES if deadline_minutes is None else deadline_minutes) * 60
+        self._cond = threading.Condition()
+        self._entries = {} # key (config name, made unique while a run of it is dispatched) -> entry dict
+        self._dispatch = None
+        self._thread = None
+        self.counters = {'enqueued': 0, 'coalesced': 0, 'dispatched': 0, 'expired': 0, 'invalid': 0,
+                         'wait_seconds_total': 0.0, 'wait_seconds_max': 0.0}
+        self._load()
+
+    # --- Persistence ---
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f).get('entries', [])
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read schedule queue {self.path}: {e}")
+            return
+        for entry in entries:
+            entry['state'] = PENDING # Runs interrupted by a restart are dispatched again
+            entry['run_id'] = None
+            self._entries[entry['key']] = entry
+
+    def _save(self):
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'entries': list(self._entries.values())}, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Warning: Could not save schedule queue {self.path}: {e}")
+
+    # --- Queue ---
+
+    def enqueue(self, config_name, priority=0, source='schedule'):
+        """Queues ``config_name`` (or coalesces into its waiting entry). Returns the entry."""
+        now = time.time()
+        with self._cond:
+            entry = next((entry for entry in self._entries.values()
+                          if entry['config_name'] == config_name and entry['state'] == PENDING), None)
+            if entry is not None:
+                entry['triggers'] += 1
+                entry['priority'] = max(entry['priority'], priority)
+                self.counters['coalesced'] += 1
+                print(f"Schedule queue: '{config_name}' is already waiting. Trigger coalesced ({entry['triggers']} triggers).")
+            else:
+                # A run of this config in progress does not absorb the trigger: it may have started before the data was due
+                key = config_name if config_name not in self._entries else f"{config_name}#{int(now * 1000)}"
+                entry = {
+                    'config_name': config_name, 'key': key, 'priority': priority, 'source': source,
+                    'enqueued_at': now, 'deadline': now + self.deadline_seconds if self.deadline_seconds else None,
+                    'triggers': 1, 'state': PENDING, 'run_id': None,
+                }
+                self._entries[key] = entry
+                self.counters['enqueued'] += 1
+                print(f"Schedule queue: queued '{config_name}' (priority {priority}, depth {self._depth()}).")
+            self._save()
+            self._cond.notify_all()
+            return dict(entry)
+
+    def _depth(self):
+        return sum(1 for entry in self._entries.values() if entry['state'] == PENDING)
+
+    def _next_entry(self):
+        pending = [entry for entry in self._entries.values() if entry['state'] == PENDING]
+        return min(pending, key=lambda entry: (-entry['priority'], entry['enqueued_at']), default=None)
+
+    # --- Dispatcher ---
+
+    def start(self, dispatch):
+        """
+        Starts the dispatcher thread. ``dispatch(config_name)`` submits the run
+        and returns its DownloadJob, or None when the config cannot run.
+        """
+        with self._cond:
+            self._dispatch = dispatch
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._dispatch_loop, name='schedule-queue', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def _dispatch_loop(self):
+        from job_manager import DONE, get_job_manager
+        manager = get_job_manager()
+        while True:
+            with self._cond:
+                self._cond.wait(config.SCHEDULE_QUEUE_POLL_SECONDS)
+                changed = False
+                now = time.time()
+                for key, entry in list(self._entries.items()):
+                    if entry['state'] == DISPATCHED:
+                        job = manager.get(entry['run_id'])
+                        if job is None or job.state == DONE:
+                            del self._entries[key] # Finished (its outcome is in the run history)
+                            changed = True
+                    elif entry['deadline'] and now > entry['deadline']:
+                        del self._entries[key]
+                        self.counters['expired'] += 1
+                        changed = True
+                        print(f"Schedule queue: '{entry['config_name']}' expired after waiting {(now - entry['enqueued_at']) / 60:.0f} min. Dropped.")
+                entry = self._next_entry() if manager.free_slots() > 0 else None
+                if entry is not None:
+                    entry['state'] = DISPATCHED
+                    wait_seconds = now - entry['enqueued_at']
+                    self.counters['wait_seconds_total'] += wait_seconds
+                    self.counters['wait_seconds_max'] = max(self.counters['wait_seconds_max'], wait_seconds)
+                    changed = True
+                if changed:
+                    self._save()
+            if entry is None:
+                continue
+            try:
+                job = self._dispatch(entry['config_name'])
+            except Exception as e:
+                print(f"Schedule queue: dispatching '{entry['config_name']}' failed: {type(e).__name__} - {e}")
+                job = None
+            with self._cond:
+                if job is None:
+                    self._entries.pop(entry['key'], None)
+                    self.counters['invalid'] += 1
+                else:
+                    entry['run_id'] = job.run_id
+                    self.counters['dispatched'] += 1
+                    print(f"Schedule queue: started run {job.run_id} for '{entry['config_name']}' after waiting {wait_seconds:.0f}s.")
+                self._save()
+
+    def entries(self):
+        with self._cond:
+            ordered = sorted(self._entries.values(), key=lambda entry: (entry['state'] != DISPATCHED, -entry['priority'], entry['enqueued_at']))
+            return [dict(entry) for entry in ordered]
+
+    def stats(self):
+        with self._cond:
+            dispatched = self.counters['dispatched']
+            oldest = min((entry['enqueued_at'] for entry in self._entries.values() if entry['state'] == PENDING), default=None)
+            return dict(self.counters, depth=self._depth(),
+                        wait_seconds_avg=self.counters['wait_seconds_total'] / dispatched if dispatched else 0.0,
+                        oldest_wait_seconds=time.time() - oldest if oldest else 0.0,
+                        deadline_minutes=self.deadline_seconds / 60)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_schedule_queue():
+    """Returns the process-wide ScheduleQueue (loading the persisted entries on first use)."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = ScheduleQueue()
+        return _queue
@@ -0,0 +1,205 @@
+# filename: scheduler_store.py
+"""
+Persistent APScheduler setup.
+
+Schedules used to live in a MemoryJobStore and were lost on every restart.
+SQLiteJobStore keeps them in a local SQLite file (SCHEDULER_DB_PATH) using
+only the standard library sqlite3 module (APScheduler's own SQLAlchemyJobStore
+would add SQLAlchemy as a dependency). Next run times are indexed for the
+scheduler's due-job queries, and each job's name, trigger and arguments are
+stored next to the pickled job state, so the schedule listing (``list_jobs``)
+is a single query that does not unpickle hundreds of jobs.
+
+Missed runs (app down or busy) are coalesced into one catch-up run within
+SCHEDULE_MISFIRE_GRACE_SECONDS; older misfires are skipped. Triggers only
+enqueue into the schedule queue (schedule_queue.py), which deduplicates a
+config that is still waiting, so a long back-fill does not pile up runs.
+"""
+import json
+import pickle
+import sqlite3
+import threading
+
+from apscheduler.executors.pool import ThreadPoolExecutor # type: ignore
+from apscheduler.job import Job # type: ignore
+from apscheduler.jobstores.base import BaseJobStore, ConflictingIdError, JobLookupError # type: ignore
+from apscheduler.schedulers.background import BackgroundScheduler # type: ignore
+from apscheduler.util import datetime_to_utc_timestamp, utc_timestamp_to_datetime # type: ignore
+
+import config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scheduled_jobs (
+    id TEXT PRIMARY KEY,
+    next_run_time REAL,
+    name TEXT,
+    trigger TEXT,
+    args TEXT,
+    job_state BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_scheduled_jobs_next_run_time ON scheduled_jobs (next_run_time);
+"""
+
+
+class SQLiteJobStore(BaseJobStore):
+    """APScheduler job store in a SQLite file."""
+
+    def __init__(self, path=None, pickle_protocol=pickle.HIGHEST_PROTOCOL):
+        super().__init__()
+        self.path = path or config.SCHEDULER_DB_PATH
+        self.pickle_protocol = pickle_protocol
+        self._lock = threading.Lock()
+        self._db = None
+        self._conn.executescript(SCHEMA)
+
+    @property
+    def _conn(self):
+        """Connection, (re)opened on demand: the scheduler thread may poll once more after shutdown."""
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+        return self._db
+
+    # --- Serialisation ---
+
+    def _row_values(self, job):
+        return (
+            datetime_to_utc_timestamp(job.next_run_time), job.name, str(job.trigger),
+            json.dumps(list(job.args), default=str, ensure_ascii=False),
+            pickle.dumps(job.__getstate__(), self.pickle_protocol),
+        )
+
+    def _reconstitute_job(self, job_state):
+        job_state = pickle.loads(job_state)
+        job_state['jobstore'] = self
+        job = Job.__new__(Job)
+        job.__setstate__(job_state)
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+
+    def _get_jobs(self, where="", params=()):
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, job_state FROM scheduled_jobs {where} ORDER BY next_run_time", params
+            ).fetchall()
+        jobs = []
+        failed_ids = []
+        for job_id, job_state in rows:
+            try:
+                jobs.append(self._reconstitute_job(job_state))
+            except Exception:
+                self._logger.exception('Unable to restore job "%s" -- removing it', job_id)
+                failed_ids.append(job_id)
+        if failed_ids:
+            with self._lock:
+                self._conn.executemany("DELETE FROM scheduled_jobs WHERE id = ?", [(job_id,) for job_id in failed_ids])
+        return jobs
+
+    # --- BaseJobStore ---
+
+    def lookup_job(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT job_state FROM scheduled_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._reconstitute_job(row[0]) if row else None
+
+    def get_due_jobs(self, now):
+        return self._get_jobs("WHERE next_run_time <= ?", (datetime_to_utc_timestamp(now),))
+
+    def get_next_run_time(self):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT next_run_time FROM scheduled_jobs WHERE next_run_time IS NOT NULL ORDER BY next_run_time LIMIT 1"
+            ).fetchone()
+        return utc_timestamp_to_datetime(row[0]) if row else None
+
+    def get_all_jobs(self):
+        jobs = self._get_jobs()
+        self._fix_paused_jobs_sorting(jobs)
+        return jobs
+
+    def add_job(self, job):
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT INTO scheduled_jobs (next_run_time, name, trigger, args, job_state, id) VALUES (?, ?, ?, ?, ?, ?)",
+                    self._row_values(job) + (job.id,)
+                )
+        except sqlite3.IntegrityError:
+            raise ConflictingIdError(job.id)
+
+    def update_job(self, job):
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE scheduled_jobs SET next_run_time = ?, name = ?, trigger = ?, args = ?, job_state = ? WHERE id = ?",
+                self._row_values(job) + (job.id,)
+            )
+        if cursor.rowcount == 0:
+            raise JobLookupError(job.id)
+
+    def remove_job(self, job_id):
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM scheduled_jobs WHERE id = ?", (job_id,))
+        if cursor.rowcount == 0:
+            raise JobLookupError(job_id)
+
+    def remove_all_jobs(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM scheduled_jobs")
+
+    def shutdown(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    # --- Listing ---
+
+    def list_jobs(self):
+        """Schedules for the UI, soonest first (paused last), without unpickling the jobs."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, name, next_run_time, trigger, args FROM scheduled_jobs "
+                "ORDER BY next_run_time IS NULL, next_run_time"
+            ).fetchall()
+        return [
+            {
+                'id': job_id, 'name': name,
+                'next_run_time': utc_timestamp_to_datetime(next_run_time).isoformat() if next_run_time is not None else None,
+                'trigger': trigger, 'args': json.loads(args or '[]'),
+            }
+            for job_id, name, next_run_time, trigger, args in rows
+        ]
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} (path={self.path})>"
+
+
+_scheduler = None
+_job_store = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Returns the process-wide BackgroundScheduler backed by the SQLite job store (not started)."""
+    global _scheduler, _job_store
+    with _scheduler_lock:
+        if _scheduler is None:
+            _job_store = SQLiteJobStore()
+            _scheduler = BackgroundScheduler(
+                jobstores={'default': _job_store},
+                executors={'default': ThreadPoolExecutor(2)}, # Triggers only enqueue (schedule_queue.py)
+                job_defaults={
+                    'coalesce': True, # Several missed runs of a job become one catch-up run
+                    'max_instances': 1,
+                    'misfire_grace_time': config.SCHEDULE_MISFIRE_GRACE_SECONDS,
+                },
+                timezone=config.SCHEDULE_TIMEZONE or None, # None = server time zone
+            )
+        return _scheduler
+
+
+def get_job_store():
+    """Returns the SQLiteJobStore of the process-wide scheduler."""
+    get_scheduler()
+    return _job_store
@@ -0,0 +1,180 @@
+# filename: session_store.py
+"""
+Persistent, encrypted authenticated-session cache keyed by account.
+
+For every account the store keeps:
+  * an encrypted cookie file (Fernet, key derived from SESSION_STORE_KEY and
+    a random salt kept in the store directory),
+  * a Chrome user-data-dir profile that the primary browser of a run reuses.
+
+``sign_in`` restores the saved cookies into a browser and checks them with a
+cheap probe of a report page; only if that fails does it fall back to the full
+email + password + TOTP login, after which the fresh cookies are saved.
+"""
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken # type: ignore
+except ImportError: # Optional dependency: without it cookies are not persisted
+    Fernet = None
+    InvalidToken = Exception
+
+import config
+
+_KDF_ITERATIONS = 200_000
+_SALT_FILE = 'kdf.salt'
+_SALT_BYTES = 16
+_salt_lock = threading.Lock() # Two stores must not create different salts
+
+
+class SessionStore:
+    """Encrypted on-disk cookie cache plus per-account Chrome profiles."""
+
+    _profiles_in_use = set() # Chrome cannot share a user-data-dir between browsers
+    _profiles_lock = threading.Lock()
+
+    def __init__(self, base_dir=None, secret=None, max_age_hours=None):
+        self.base_dir = base_dir or config.SESSION_STORE_PATH
+        self.max_age_seconds = (max_age_hours if max_age_hours is not None else config.SESSION_MAX_AGE_HOURS) * 3600
+        secret = secret if secret is not None else config.SESSION_STORE_KEY
+        self._fernet = None
+        os.makedirs(self.base_dir, exist_ok=True)
+        if Fernet is None:
+            print("WARNING: 'cryptography' is not installed (pip install cryptography). Saved login sessions are disabled.")
+        elif not secret or secret == config.EXAMPLE_OTP_SECRET:
+            print("WARNING: SESSION_STORE_KEY is not set (or is the example OTP secret). Saved login sessions are disabled.")
+        else:
+            salt = self._load_salt()
+            if salt:
+                key = hashlib.pbkdf2_hmac('sha256', secret.encode('utf-8'), salt, _KDF_ITERATIONS)
+                self._fernet = Fernet(base64.urlsafe_b64encode(key))
+
+    def _load_salt(self):
+        """Random per-store KDF salt, created on first use. Returns None if it cannot be read or written."""
+        path = os.path.join(self.base_dir, _SALT_FILE)
+        with _salt_lock:
+            return self._read_or_create_salt(path)
+
+    @staticmethod
+    def _read_or_create_salt(path):
+        try:
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    salt = f.read()
+                if len(salt) == _SALT_BYTES:
+                    return salt
+                print(f"Warning: Invalid session store salt {path}; creating a new one (saved sessions are discarded).")
+            salt = os.urandom(_SALT_BYTES)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(salt)
+            os.replace(tmp_path, path)
+            return salt
+        except OSError as e:
+            print(f"WARNING: Could not read or create session store salt {path}: {e}. Saved login sessions are disabled.")
+            return None
+
+    @staticmethod
+    def _account_key(account):
+        return hashlib.sha256(account.strip().lower().encode('utf-8')).hexdigest()[:16]
+
+    def _cookie_path(self, account):
+        return os.path.join(self.base_dir, f"{self._account_key(account)}.session")
+
+    # --- Cookies ---
+
+    def load_cookies(self, account):
+        """Returns the saved cookies for ``account`` or None if missing, expired or unreadable."""
+        path = self._cookie_path(account)
+        if self._fernet is None or not os.path.isfile(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                payload = json.loads(self._fernet.decrypt(f.read()).decode('utf-8'))
+        except (InvalidToken, ValueError, OSError) as e:
+            print(f"Warning: Discarding unreadable saved session for '{account}': {type(e).__name__}")
+            self.invalidate(account)
+            return None
+        if time.time() - payload.get('saved_at', 0) > self.max_age_seconds:
+            return None
+        now = time.time()
+        return [c for c in payload.get('cookies', []) if not c.get('expiry') or c['expiry'] > now]
+
+    def save_cookies(self, account, cookies):
+        """Encrypts and stores ``cookies`` (Selenium cookie dicts) for ``account``."""
+        if self._fernet is None:
+            return False
+        payload = json.dumps({'saved_at': time.time(), 'cookies': cookies}).encode('utf-8')
+        path = self._cookie_path(account)
+        tmp_path = path + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(self._fernet.encrypt(payload))
+            os.replace(tmp_path, path)
+            return True
+        except OSError as e:
+            print(f"Warning: Could not save session for '{account}': {e}")
+            return False
+
+    def invalidate(self, account):
+        """Forgets the saved cookies of ``account``."""
+        try:
+            os.remove(self._cookie_path(account))
+        except OSError:
+            pass
+
+    # --- Chrome Profiles ---
+
+    def acquire_profile(self, account):
+        """
+        Reserves the Chrome user-data-dir of ``account`` for one browser.
+        Returns the directory, or None if profiles are disabled or it is in use.
+        """
+        if not config.SESSION_PROFILE_ENABLED:
+            return None
+        profile_dir = os.path.join(self.base_dir, 'profiles', self._account_key(account))
+        with self._profiles_lock:
+            if profile_dir in self._profiles_in_use:
+                return None
+            self._profiles_in_use.add(profile_dir)
+        os.makedirs(profile_dir, exist_ok=True)
+        return profile_dir
+
+    def release_profile(self, profile_dir):
+        if profile_dir:
+            with self._profiles_lock:
+                self._profiles_in_use.discard(profile_dir)
+
+
+def sign_in(automation, login_url, email, password, otp_secret, store=None, status_callback=None):
+    """
+    Authenticates ``automation`` for ``email``: restores saved cookies when they
+    still work, otherwise runs the full login and saves the new cookies.
+    Returns True when the browser is logged in.
+    """
+    log_func = status_callback or automation._log
+    store = store or SessionStore()
+    cookies = store.load_cookies(email)
+    if cookies:
+        log_func("Found saved login session. Verifying...")
+        if automation.restore_session(login_url, cookies, status_callback=log_func):
+            log_func("Reused saved login session (skipped login + OTP).")
+            return True
+        log_func("Saved login session has expired. Performing full login...")
+        store.invalidate(email)
+    elif automation.profile_dir and automation.probe_session(login_url, status_callback=log_func):
+        # The Chrome profile itself still holds a valid session
+        log_func("Browser profile is still logged in (skipped login + OTP).")
+        store.save_cookies(email, automation.driver.get_cookies())
+        return True
+
+    if not automation.login(login_url, email, password, otp_secret, status_callback=log_func):
+        return False
+    if store.save_cookies(email, automation.driver.get_cookies()):
+        log_func("Saved login session for reuse by later runs.")
+    return True
@@ -3,7 +3,7 @@ import sys
 
 # Dependencies are automatically detected, but it might need fine tuning.
 build_exe_options = {
-    "packages": ["os", "flask", "selenium", "pyotp", "schedule", "pandas", "numpy"],
+    "packages": ["os", "flask", "selenium", "pyotp", "schedule", "pandas", "numpy", "requests", "cryptography"],
     "include_files": [("templates", "templates"), ("static", "static"), ("config.py", "config.py")],
 }
 
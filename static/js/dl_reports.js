@@ -41,6 +41,23 @@ document.addEventListener('DOMContentLoaded', function() {
                 return;
             }
 
+            // 3. Preview the compiled plan (order and estimated duration)
+            try {
+                const planResponse = await fetch('/download/api/plan', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify(formData)
+                });
+                const plan = await planResponse.json();
+                if (planResponse.ok && plan.status === 'ok') {
+                    const minutes = Math.round(plan.estimated_seconds / 60);
+                    addStatusMessage(statusMessagesDiv, `Plan: ${plan.items.length} report(s) on ${plan.pages} page(s), ${plan.chunks} chunk(s). Estimated duration: ~${minutes} min.`, 'info');
+                    plan.skipped.forEach(s => addStatusMessage(statusMessagesDiv, `Skipped ${s.report_type}: ${s.reason}`, s.error ? 'error' : 'info'));
+                }
+            } catch (error) {
+                console.warn('Could not preview download plan:', error);
+            }
+
             addStatusMessage(statusMessagesDiv, 'Sending download request...', 'info');
             try {
                 const response = await fetch('/download/api/start-download', {
@@ -71,6 +88,37 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    // --- Resume Last Run ---
+    const resumeButton = document.getElementById('resume-button');
+    if (resumeButton) {
+        resumeButton.addEventListener('click', async function() {
+            clearStatusMessages(statusMessagesDiv);
+            addStatusMessage(statusMessagesDiv, 'Resuming last run (only missing chunks)...', 'info');
+            resumeButton.disabled = true;
+            try {
+                const response = await fetch('/download/api/resume-last-run', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ password: document.getElementById('password')?.value || '' })
+                });
+                const result = await response.json();
+                if (response.ok && result.status === 'started') {
+                    addStatusMessage(statusMessagesDiv, result.message, 'success');
+                    showNotification(result.message, 'success');
+                } else {
+                    const errorMsg = result.message || `Failed to resume (Status: ${response.status})`;
+                    addStatusMessage(statusMessagesDiv, errorMsg, 'error');
+                    showNotification(errorMsg, 'error');
+                }
+            } catch (error) {
+                addStatusMessage(statusMessagesDiv, 'Network or Server Error: ' + error.message, 'error');
+                showNotification('Network or Server Error: ' + error.message, 'error');
+            } finally {
+                resumeButton.disabled = false;
+            }
+        });
+    }
+
     // --- Form Data Gathering ---
     function getCurrentFormData() {
         const data = {
@@ -214,10 +262,10 @@ document.addEventListener('DOMContentLoaded', function() {
             try {
                 const response = await fetch('/download/api/start-download', { method: 'POST' });
                 const result = await response.json();
-                if (result.status === 'success') {
-                    addStatusMessage(statusMessagesDiv, 'Download started.', 'success');
+                if (result.status === 'started') {
+                    addStatusMessage(statusMessagesDiv, result.message || 'Download started.', 'success');
                     showNotification('Download started.', 'success');
-                    listenToStatusStream();
+                    listenToStatusStream(result.stream_url);
                 } else {
                     addStatusMessage(statusMessagesDiv, result.message || 'Failed to start download.', 'error');
                     showNotification(result.message || 'Failed to start download.', 'error');
@@ -230,14 +278,19 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     // --- Status Stream (SSE) ---
-    function listenToStatusStream() {
+    function listenToStatusStream(streamUrl) {
         if (window.eventSource) window.eventSource.close();
-        window.eventSource = new EventSource('/stream-status');
+        window.eventSource = new EventSource(streamUrl || '/stream-status'); // Per-run channel when the run ID is known
         window.eventSource.onmessage = function(event) {
+            if (event.data === 'FINISHED') {
+                window.eventSource.close(); // Otherwise the browser reconnects and resumes via Last-Event-ID
+                return;
+            }
             addStatusMessage(statusMessagesDiv, event.data, 'log');
         };
         window.eventSource.onerror = function() {
-            window.eventSource.close();
+            // The browser reconnects on its own (sending Last-Event-ID); give up only once it has closed the stream
+            if (window.eventSource.readyState === EventSource.CLOSED) window.eventSource.close();
         };
     }
 
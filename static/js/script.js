@@ -430,7 +430,7 @@ document.addEventListener('DOMContentLoaded', () => {
                         <td><select name="report_type[]" class="report-type-select" required></select></td>
                         <td><input type="date" name="from_date[]" required></td>
                         <td><input type="date" name="to_date[]" required></td>
-                        <td><input type="text" name="chunk_size[]" value="5" placeholder="E.g.: 5 or month"></td>
+                        <td><input type="text" name="chunk_size[]" value="5" placeholder="E.g.: 5, month or auto"></td>
                         <td><button type="button" class="remove-row-button" title="Remove this report row"><i class="fas fa-trash-alt"></i></button></td>
                     `;
                     reportTableBody.appendChild(row);
@@ -655,7 +655,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
             if (result && result.status === 'started') {
                 addStatusMessage(statusMessagesDiv, "Request accepted. Waiting for status updates...", 'info');
-                setupEventSource(sessionId);
+                setupEventSource(sessionId, result.stream_url);
             } else {
                 downloadButton.disabled = false;
                 loadingIndicator.style.display = 'none';
@@ -682,10 +682,11 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
-    function setupEventSource(sessionId) {
+    function setupEventSource(sessionId, streamUrl) {
         if (eventSource) eventSource.close();
-        console.log("Setting up SSE connection to /stream-status");
-        eventSource = new EventSource('/stream-status');
+        streamUrl = streamUrl || '/stream-status'; // Per-run channel when the run ID is known
+        console.log("Setting up SSE connection to " + streamUrl);
+        eventSource = new EventSource(streamUrl);
 
         eventSource.onopen = function() {
             console.log("SSE connection opened.");
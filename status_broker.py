@@ -0,0 +1,87 @@
+# filename: status_broker.py
+"""
+Push-based status stream for the /stream-status SSE endpoint.
+
+Status messages of the download run are published into a fixed-size ring
+buffer (STATUS_BUFFER_SIZE) under monotonically increasing sequence numbers.
+SSE clients block on a condition variable until a message newer than the
+last one they received is published, so idle dashboards cost a parked thread
+and no polling. The sequence number is sent as the SSE ``id:`` so a
+reconnecting browser resumes after its ``Last-Event-ID``; messages that have
+already left the ring buffer are reported as a gap.
+"""
+import threading
+
+import config
+
+
+class StatusBroker:
+    """Ring buffer of status messages with blocking reads by sequence number."""
+
+    def __init__(self, capacity=None):
+        self.capacity = max(1, config.STATUS_BUFFER_SIZE if capacity is None else capacity)
+        self._buffer = [None] * self.capacity
+        self._cond = threading.Condition()
+        self.last_seq = 0 # Sequence number of the newest message (0 = none yet)
+        self.run_start_seq = 0 # Messages after this belong to the current (or last) run
+        self.running = False
+
+    def _oldest_seq(self):
+        return max(1, self.last_seq - self.capacity + 1)
+
+    # --- Publishing ---
+
+    def publish(self, message):
+        """Appends ``message`` and wakes every waiting reader. Returns its sequence number."""
+        with self._cond:
+            self.last_seq += 1
+            self._buffer[self.last_seq % self.capacity] = message
+            self._cond.notify_all()
+            return self.last_seq
+
+    def start_run(self):
+        """Marks the start of a run: new subscribers without a Last-Event-ID start here."""
+        with self._cond:
+            self.running = True
+            self.run_start_seq = self.last_seq
+            self._cond.notify_all()
+
+    def end_run(self):
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+
+    # --- Reading ---
+
+    def start_seq(self, last_event_id=None):
+        """Sequence number a new subscriber has already seen (its Last-Event-ID, else the run start)."""
+        with self._cond:
+            if last_event_id is None:
+                return self.run_start_seq
+            return min(max(0, last_event_id), self.last_seq)
+
+    def read_since(self, seen_seq, timeout=None):
+        """
+        Blocks while a run is active until a message newer than ``seen_seq``
+        is published, the run ends or ``timeout`` passes. Returns (messages,
+        skipped, running), where messages are (seq, message) pairs and
+        ``skipped`` counts messages lost from the ring buffer.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self.last_seq > seen_seq or not self.running, timeout)
+            first = max(seen_seq + 1, self._oldest_seq())
+            messages = [(seq, self._buffer[seq % self.capacity]) for seq in range(first, self.last_seq + 1)]
+            return messages, first - seen_seq - 1, self.running
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_status_broker():
+    """Returns the process-wide StatusBroker."""
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = StatusBroker()
+        return _broker
@@ -0,0 +1,139 @@
+# filename: tools/stub_pharfaf_server.py
+"""
+Local stub of the PHARFAF ASP.NET WebForms report pages.
+
+Used to exercise the HTTP export engine (http_export.py) without the real BI
+site. It mimics the parts the engine depends on:
+  * GET  /MIS/PHAR/PHARFAF<nnn>.aspx  -> form with __VIEWSTATE, __EVENTVALIDATION,
+    Telerik date pickers and the rblType radio list
+  * POST /MIS/PHAR/PHARFAF<nnn>.aspx  -> validates the postback and returns a CSV
+    attachment named like the real export
+  * report codes HTML_ERROR_CODE and EMPTY_EXPORT_CODE answer the export
+    postback with an HTML error page and an empty attachment, respectively
+  * requests without the session cookie are redirected to the login page
+
+Usage:
+    python tools/stub_pharfaf_server.py [--port 8765]
+    # cookie to use: ASP.NET_SessionId=stub-session
+"""
+import argparse
+import re
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+SESSION_COOKIE = 'ASP.NET_SessionId'
+SESSION_VALUE = 'stub-session'
+VIEWSTATE = 'dDwtMTU0NzY3NjQ2NTs7Pg=='
+EVENTVALIDATION = '/wEdAAUAAAD/////AQAAAAAAAAA='
+EXPORT_TARGET = 'ctl00$MainContent$btnExportCSVDemo'
+HTML_ERROR_CODE = '998' # Export postback answers with an HTML error page
+EMPTY_EXPORT_CODE = '999' # Export postback answers with an empty attachment
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html><head><title>PHARFAF{code}</title></head>
+<body>
+<form method="post" action="./PHARFAF{code}.aspx" id="form1">
+<input type="hidden" name="__EVENTTARGET" id="__EVENTTARGET" value="" />
+<input type="hidden" name="__EVENTARGUMENT" id="__EVENTARGUMENT" value="" />
+<input type="hidden" name="__VIEWSTATE" id="__VIEWSTATE" value="{viewstate}" />
+<input type="hidden" name="__EVENTVALIDATION" id="__EVENTVALIDATION" value="{eventvalidation}" />
+<input id="ctl00_MainContent_cbo_fromDate" name="ctl00$MainContent$cbo_fromDate" type="text" value="" />
+<input id="ctl00_MainContent_cbo_fromDate_dateInput" name="ctl00$MainContent$cbo_fromDate$dateInput" type="text" value="" />
+<input id="ctl00_MainContent_cbo_fromDate_dateInput_ClientState" name="ctl00_MainContent_cbo_fromDate_dateInput_ClientState" type="hidden" />
+<input id="ctl00_MainContent_cbo_toDate" name="ctl00$MainContent$cbo_toDate" type="text" value="" />
+<input id="ctl00_MainContent_cbo_toDate_dateInput" name="ctl00$MainContent$cbo_toDate$dateInput" type="text" value="" />
+<input id="ctl00_MainContent_cbo_toDate_dateInput_ClientState" name="ctl00_MainContent_cbo_toDate_dateInput_ClientState" type="hidden" />
+<table id="ctl00_MainContent_rblType">
+<tr><td><input id="ctl00_MainContent_rblType_0" type="radio" name="ctl00$MainContent$rblType" value="X" checked="checked" /></td></tr>
+<tr><td><input id="ctl00_MainContent_rblType_1" type="radio" name="ctl00$MainContent$rblType" value="N" /></td></tr>
+</table>
+<select name="ctl00$MainContent$ddlStore"><option value="ALL">All</option><option value="1">One</option></select>
+<span id="ctl00_MainContent_btnExportCSVDemo"><input id="ctl00_MainContent_btnExportCSVDemo_input" type="submit" value="Export CSV" /></span>
+</form>
+</body></html>
+"""
+
+LOGIN_PAGE = "<html><body><form action='/Login.aspx'><input name='email' /></form></body></html>"
+
+
+class StubPharfafHandler(BaseHTTPRequestHandler):
+    """Request handler mimicking the PHARFAF report pages."""
+
+    def log_message(self, format, *args): # Keep test output quiet
+        pass
+
+    def _report_code(self):
+        match = re.match(r'^/MIS/PHAR/PHARFAF(\d+)\.aspx$', self.path.split('?')[0])
+        return match.group(1) if match else None
+
+    def _has_session(self):
+        cookies = self.headers.get('Cookie', '')
+        return f"{SESSION_COOKIE}={SESSION_VALUE}" in cookies
+
+    def _send(self, status, body, content_type='text/html; charset=utf-8', headers=None):
+        data = body.encode('utf-8') if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.startswith('/Login.aspx'):
+            return self._send(200, LOGIN_PAGE)
+        code = self._report_code()
+        if not code:
+            return self._send(404, "Not found")
+        if not self._has_session():
+            self.send_response(302)
+            self.send_header('Location', '/Login.aspx')
+            self.send_header('Content-Length', '0')
+            return self.end_headers()
+        self._send(200, PAGE_TEMPLATE.format(code=code, viewstate=VIEWSTATE, eventvalidation=EVENTVALIDATION))
+
+    def do_POST(self):
+        code = self._report_code()
+        if not code:
+            return self._send(404, "Not found")
+        if not self._has_session():
+            return self._send(200, LOGIN_PAGE)
+        length = int(self.headers.get('Content-Length', '0'))
+        form = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode('utf-8'), keep_blank_values=True).items()}
+        if form.get('__VIEWSTATE') != VIEWSTATE or form.get('__EVENTVALIDATION') != EVENTVALIDATION:
+            return self._send(500, "<html><body>Invalid postback or callback argument.</body></html>")
+        if form.get('__EVENTTARGET') != EXPORT_TARGET:
+            # Any other postback just re-renders the page
+            return self._send(200, PAGE_TEMPLATE.format(code=code, viewstate=VIEWSTATE, eventvalidation=EVENTVALIDATION))
+        if code == HTML_ERROR_CODE:
+            return self._send(200, "<html><body>An error occurred while exporting the report.</body></html>")
+        if code == EMPTY_EXPORT_CODE:
+            return self._send(200, b"", content_type='text/csv',
+                              headers={'Content-Disposition': f'attachment; filename="BaoCaoPHARFAF{code}.csv"'})
+        from_date = form.get('ctl00$MainContent$cbo_fromDate', '')
+        to_date = form.get('ctl00$MainContent$cbo_toDate', '')
+        report_type = form.get('ctl00$MainContent$rblType', '')
+        rows = ["Ngay,Loai,SoLuong"] + [f"{from_date},{report_type},{i}" for i in range(100)] + [f"{to_date},{report_type},0"]
+        self._send(200, "\r\n".join(rows) + "\r\n", content_type='text/csv',
+                   headers={'Content-Disposition': f'attachment; filename="BaoCaoPHARFAF{code}.csv"'})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), StubPharfafHandler)
+    print(f"Stub PHARFAF server on http://{args.host}:{args.port}/MIS/PHAR/PHARFAF001.aspx "
+          f"(cookie {SESSION_COOKIE}={SESSION_VALUE})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
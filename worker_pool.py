@@ -0,0 +1,385 @@
+# filename: worker_pool.py
+import os
+import shutil
+import threading
+import time
+import traceback
+from datetime import datetime
+
+from selenium.common.exceptions import WebDriverException
+
+import config
+from chunk_planner import bisect_range, get_cost_model, span_days
+from logic_download import WebAutomation
+from run_history import get_run_history
+from page_waits import merge_wait_stats
+from retry_policy import merge_retry_stats
+from session_store import sign_in
+
+# Partial download extensions that must never be moved out of a worker folder
+PARTIAL_EXTENSIONS = ('.tmp', '.crdownload', '.part')
+WORKER_FOLDER_PREFIX = "_worker_"
+
+
+class DownloadWorkerPool:
+    """
+    Pool of independent WebAutomation workers that process date chunks in parallel.
+
+    Each worker owns a logged-in browser and a private download folder
+    (``<download_folder>/_worker_<n>``) so that the "new file" detection of
+    one browser never sees the downloads of another. Finished files are moved
+    into the shared run folder after every chunk.
+    """
+
+    def __init__(self, driver_path, download_folder, login_url, email, password, otp_secret, size=2, status_callback=None, session_store=None):
+        self.driver_path = driver_path
+        self.download_folder = download_folder
+        self.login_url = login_url
+        self.email = email
+        self.password = password
+        self.otp_secret = otp_secret
+        self.size = max(1, int(size))
+        self._status_callback = status_callback
+        self.session_store = session_store # Shares the saved login session with the workers
+        self._workers = [None] * self.size # Lazily started WebAutomation instances
+        self._closed_page_stats = {'loads': 0, 'reused': 0} # Page loads of workers already closed
+        self._closed_wait_stats = {} # Wait time of workers already closed (page_waits.py)
+        self._closed_retry_stats = {} # Retries of workers already closed (retry_policy.py)
+        self.retry_policy = None # RetryPolicy of the report being downloaded, set per report by the run
+        self.report_type = None # Report being downloaded, set per report by the run (tags the run history rows)
+        self.cancel_event = None # threading.Event of the job (job_manager.py): no new tasks once set
+        self._move_lock = threading.Lock()
+        self._stats_lock = threading.Lock() # Guards the _closed_* stats (workers close from their own threads)
+
+    def _log(self, message):
+        if self._status_callback:
+            self._status_callback(message)
+        else:
+            print(message)
+
+    # --- Worker Lifecycle ---
+
+    def _worker_folder(self, worker_num):
+        return os.path.join(self.download_folder, f"{WORKER_FOLDER_PREFIX}{worker_num}")
+
+    def _ensure_worker(self, worker_num, log_func):
+        """Returns a live, logged-in worker, (re)starting its browser if needed."""
+        automation = self._workers[worker_num]
+        if automation is not None and automation.is_session_valid():
+            return automation
+        if automation is not None:
+            log_func("Worker session is no longer valid. Restarting browser...")
+            self._close_worker(worker_num)
+
+        folder = self._worker_folder(worker_num)
+        os.makedirs(folder, exist_ok=True)
+        log_func(f"Starting browser (download folder: {folder})...")
+        automation = WebAutomation(self.driver_path, folder, status_callback=log_func)
+        try:
+            if not sign_in(automation, self.login_url, self.email, self.password, self.otp_secret, store=self.session_store, status_callback=log_func):
+                raise RuntimeError("Login failed.")
+        except Exception:
+            automation.close()
+            raise
+        self._workers[worker_num] = automation
+        return automation
+
+    def _close_worker(self, worker_num):
+        automation = self._workers[worker_num]
+        self._workers[worker_num] = None
+        if automation:
+            with self._stats_lock:
+                for key, value in automation.page_stats.items():
+                    self._closed_page_stats[key] += value
+                merge_wait_stats(self._closed_wait_stats, automation.wait_stats)
+                merge_retry_stats(self._closed_retry_stats, automation.retry_stats)
+            try:
+                automation.close()
+            except Exception as e:
+                self._log(f"Warning: Failed to close worker {worker_num + 1}: {e}")
+
+    def close(self):
+        """Closes every worker browser and removes empty worker folders."""
+        for worker_num in range(self.size):
+            self._close_worker(worker_num)
+            folder = self._worker_folder(worker_num)
+            try:
+                if os.path.isdir(folder) and not os.listdir(folder):
+                    os.rmdir(folder)
+            except OSError:
+                pass
+
+    def page_stats(self):
+        """Report page loads and reused pages summed over all workers of this pool."""
+        with self._stats_lock:
+            stats = dict(self._closed_page_stats)
+        for automation in self._workers:
+            if automation is not None:
+                for key, value in automation.page_stats.items():
+                    stats[key] += value
+        return stats
+
+    def wait_stats(self):
+        """Wait time per reason summed over all workers of this pool."""
+        with self._stats_lock:
+            stats = merge_wait_stats({}, self._closed_wait_stats)
+        for automation in self._workers:
+            if automation is not None:
+                merge_wait_stats(stats, automation.wait_stats)
+        return stats
+
+    def retry_stats(self):
+        """Retries per error class summed over all workers of this pool."""
+        with self._stats_lock:
+            stats = merge_retry_stats({}, self._closed_retry_stats)
+        for automation in self._workers:
+            if automation is not None:
+                merge_retry_stats(stats, automation.retry_stats)
+        return stats
+
+    # --- File Handling ---
+
+    def _collect_files(self, automation, log_func):
+        """
+        Moves completed files from a worker folder into the shared run folder.
+        Returns {worker file name: name in the run folder}.
+        """
+        moved = {}
+        try:
+            names = os.listdir(automation.download_folder)
+        except OSError as e:
+            log_func(f"Warning: Could not list worker folder {automation.download_folder}: {e}")
+            return moved
+
+        for name in names:
+            src = os.path.join(automation.download_folder, name)
+            if not os.path.isfile(src) or name.lower().endswith(PARTIAL_EXTENSIONS):
+                continue
+            with self._move_lock:
+                base, ext = os.path.splitext(name)
+                target_name = name
+                counter = 1
+                while os.path.exists(os.path.join(self.download_folder, target_name)):
+                    target_name = f"{base}_{counter}{ext}"
+                    counter += 1
+                try:
+                    shutil.move(src, os.path.join(self.download_folder, target_name))
+                    moved[name] = target_name
+                except OSError as e:
+                    log_func(f"Warning: Could not move '{name}' to run folder: {e}")
+        # Keep the worker folder empty so the next chunk's detection starts clean
+        automation.update_files_before_download()
+        automation.extracted_zips.clear()
+        return moved
+
+    # --- Task Processing ---
+
+    def run_chunks(self, method_name, report_url, date_ranges, status_callback=None, cost_key=None, bisect=False, checkpoint=None, cache_variant=None, cache_region=None, **kwargs):
+        """
+        Downloads every (from_date, to_date) chunk using the WebAutomation method
+        ``method_name`` (e.g. 'download_report_001') spread across the workers.
+        Successful chunks are recorded under ``cost_key`` in the chunk cost model
+        and, with a run_ledger.RunCheckpoint, in the chunk ledger; with
+        ``bisect`` failed chunks are retried as two halves. With ``cache_variant``
+        immutable chunks are added to the export cache (export_cache.py).
+        Returns a (success_count, fail_count) tuple.
+        """
+        total_chunks = len(date_ranges)
+        tasks = []
+        for chunk_num, (from_date_chunk, to_date_chunk) in enumerate(date_ranges, start=1):
+            task_kwargs = dict(kwargs, report_url=report_url, from_date=from_date_chunk, to_date=to_date_chunk)
+            tasks.append({
+                'label': f"Chunk {chunk_num}/{total_chunks}: {from_date_chunk} to {to_date_chunk}",
+                'method': method_name,
+                'kwargs': task_kwargs,
+                'key': None,
+                'cost_key': cost_key,
+                'bisect': bisect,
+                'checkpoint': checkpoint,
+                'ledger_region': cache_region,
+                'cache_variant': cache_variant,
+            })
+        return self.run_tasks(tasks, status_callback=status_callback)
+
+    def run_region_chunks(self, report_url, date_ranges, region_indices, region_names, max_per_region=1, status_callback=None, cost_key=None, bisect=False, checkpoint=None, skip=None):
+        """
+        Fans region x chunk pairs out across the workers using
+        ``download_report_for_region`` (which keeps its own retry decorator).
+        At most ``max_per_region`` exports for the same region run at once.
+        (from_date, to_date, region_idx) pairs in ``skip`` (e.g. served from
+        the export cache) are left out.
+        Returns a (success_count, fail_count) tuple.
+        """
+        total_chunks = len(date_ranges)
+        tasks = []
+        for chunk_num, (from_date_chunk, to_date_chunk) in enumerate(date_ranges, start=1):
+            for region_idx in region_indices:
+                region_name = region_names[region_idx]
+                if checkpoint is not None and checkpoint.is_complete(from_date_chunk, to_date_chunk, region_name):
+                    continue # Already downloaded by an earlier run (resume)
+                if skip and (from_date_chunk, to_date_chunk, region_idx) in skip:
+                    continue
+                tasks.append({
+                    'label': f"Region {region_name} Chunk {chunk_num}/{total_chunks}: {from_date_chunk} to {to_date_chunk}",
+                    'method': 'download_report_for_region',
+                    'kwargs': {'report_url': report_url, 'from_date': from_date_chunk, 'to_date': to_date_chunk, 'region_index': region_idx},
+                    'key': region_name,
+                    'cost_key': cost_key,
+                    'bisect': bisect,
+                    'checkpoint': checkpoint,
+                    'ledger_region': region_name,
+                    'cache_variant': 'download_report_for_region',
+                })
+        return self.run_tasks(tasks, max_per_key=max_per_region, status_callback=status_callback)
+
+    def run_tasks(self, tasks, max_per_key=None, status_callback=None):
+        """
+        Runs download tasks on the workers. Each task is a dict with 'label',
+        'method' (WebAutomation method name), 'kwargs' and an optional
+        concurrency 'key'; no more than ``max_per_key`` tasks sharing a key run
+        at the same time. Tasks with a 'cost_key' feed the chunk cost model;
+        failed tasks with 'bisect' set are re-queued as two half-range tasks.
+        Returns a (success_count, fail_count) tuple.
+        """
+        log_func = status_callback or self._log
+        pending = list(tasks)
+        active_per_key = {}
+        state_cond = threading.Condition()
+        counters = {'success': 0, 'fail': 0, 'in_flight': 0}
+
+        def take_task():
+            """Blocks until a task is runnable; returns None when none are left."""
+            with state_cond:
+                while True:
+                    if self.cancel_event is not None and self.cancel_event.is_set():
+                        counters['fail'] += len(pending)
+                        pending.clear()
+                        state_cond.notify_all()
+                        return None # Run cancelled: queued tasks are dropped, running ones finish
+                    if not pending and not counters['in_flight']:
+                        return None # Nothing left and no running task can re-queue halves
+                    for pos, task in enumerate(pending):
+                        key = task.get('key')
+                        if key is None or not max_per_key or active_per_key.get(key, 0) < max_per_key:
+                            if key is not None:
+                                active_per_key[key] = active_per_key.get(key, 0) + 1
+                            counters['in_flight'] += 1
+                            return pending.pop(pos)
+                    state_cond.wait()
+
+        def finish_task(task, ok, log, remaining=None):
+            halves = None
+            if not ok and task.get('bisect'):
+                halves = bisect_range(task['kwargs']['from_date'], task['kwargs']['to_date'], config.CHUNK_BISECT_MIN_DAYS)
+            with state_cond:
+                key = task.get('key')
+                if key is not None:
+                    active_per_key[key] -= 1
+                counters['in_flight'] -= 1
+                if halves:
+                    # Retry the failed range as two halves (recursively, down to CHUNK_BISECT_MIN_DAYS)
+                    parent = task['kwargs']
+                    for half_from, half_to in halves:
+                        pending.append(dict(task, kwargs=dict(parent, from_date=half_from, to_date=half_to),
+                                            label=f"{task['label'].split(':')[0]} half: {half_from} to {half_to} (of {parent['from_date']} to {parent['to_date']})"))
+                    log(f"Bisecting failed range {parent['from_date']} to {parent['to_date']}; re-queued both halves.")
+                else:
+                    counters['success' if ok else 'fail'] += 1
+                if remaining:
+                    # Days not covered by the exports taken over from another run
+                    parent = task['kwargs']
+                    for gap_from, gap_to in remaining:
+                        pending.append(dict(task, kwargs=dict(parent, from_date=gap_from, to_date=gap_to),
+                                            label=f"{task['label'].split(':')[0]} rest: {gap_from} to {gap_to}"))
+                state_cond.notify_all()
+
+        def worker_loop(worker_num):
+            prefix = f"[Worker {worker_num + 1}] "
+            worker_log = lambda message: log_func(prefix + message)
+            while True:
+                task = take_task()
+                if task is None:
+                    return
+                label = task['label']
+                task_kwargs = task['kwargs']
+                task_ok = False
+                flight = None
+                remaining = None
+                try:
+                    automation = self._ensure_worker(worker_num, worker_log)
+                    if self.retry_policy is not None:
+                        automation.retry_policy = self.retry_policy
+                    automation.report_type = self.report_type
+                    worker_log(f"--- Starting {label} ---")
+                    if task.get('cache_variant'):
+                        # Share exports with other runs asking for the same report and days (coalesce.py)
+                        flight, adopted, gaps = automation._claim_chunk(
+                            task_kwargs['report_url'], task['cache_variant'], task.get('ledger_region'),
+                            task_kwargs['from_date'], task_kwargs['to_date'], worker_log
+                        )
+                        if adopted:
+                            task_ok = True
+                            remaining = gaps
+                            if task.get('checkpoint') is not None:
+                                for adopted_from, adopted_to, adopted_path in adopted:
+                                    task['checkpoint'].record(adopted_from, adopted_to, True, adopted_path, task.get('ledger_region'))
+                            self._collect_files(automation, worker_log)
+                            worker_log(f"--- Completed {label} with exports of another run ---")
+                            continue
+                    download_method = getattr(automation, task['method'])
+                    automation.last_download_bytes = 0
+                    automation.last_download_file = None
+                    task_started = time.time()
+                    task_ok = bool(download_method(status_callback=worker_log, **task_kwargs))
+                    if task_ok and task.get('cost_key'):
+                        get_cost_model().record(
+                            task['cost_key'], span_days(task_kwargs['from_date'], task_kwargs['to_date']),
+                            time.time() - task_started, automation.last_download_bytes
+                        )
+                    if task_ok and task.get('cache_variant'):
+                        automation._store_cached_chunk(
+                            task_kwargs['report_url'], task['cache_variant'], task.get('ledger_region'),
+                            task_kwargs['from_date'], task_kwargs['to_date']
+                        )
+                    moved = self._collect_files(automation, worker_log)
+                    if moved:
+                        worker_log(f"Moved to run folder: {', '.join(moved.values())}")
+                    stored_name = moved.get(os.path.basename(automation.last_download_file or ''))
+                    if task.get('checkpoint') is not None:
+                        # Record the name in the run folder (_collect_files renames on a clash)
+                        stored_path = os.path.join(self.download_folder, stored_name) if stored_name else automation.last_download_file
+                        task['checkpoint'].record(
+                            task_kwargs['from_date'], task_kwargs['to_date'], task_ok,
+                            stored_path if task_ok else None, task.get('ledger_region')
+                        )
+                    if flight is not None:
+                        automation._finish_chunk_flight(flight, task_ok and bool(stored_name),
+                                                        os.path.join(self.download_folder, stored_name) if stored_name else None)
+                        flight = None
+                    if task_ok:
+                        worker_log(f"--- Completed {label} Successfully ---")
+                    else:
+                        worker_log(f"--- Completed {label} with FAILURE (Check Logs) ---")
+                except Exception as e:
+                    error_msg = f"ERROR in {label}: {type(e).__name__} - {str(e)[:150]}..."
+                    worker_log(error_msg)
+                    traceback.print_exc()
+                    get_run_history().record([f"worker{worker_num + 1}", datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "", task_kwargs.get('from_date', ''), "Failed in Chunk (Worker)", task_kwargs.get('to_date', ''), error_msg], report=self.report_type)
+                    if isinstance(e, (WebDriverException, RuntimeError)):
+                        # Browser is unusable: drop it so the next task restarts it
+                        self._close_worker(worker_num)
+                finally:
+                    if flight is not None:
+                        automation._finish_chunk_flight(flight, False)
+                    finish_task(task, task_ok, worker_log, remaining)
+
+        worker_count = min(self.size, len(pending))
+        if worker_count == 0:
+            return 0, 0
+        log_func(f"Processing {len(pending)} download tasks with {worker_count} parallel browser workers.")
+        threads = [threading.Thread(target=worker_loop, args=(n,), name=f"download-worker-{n + 1}", daemon=True) for n in range(worker_count)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return counters['success'], counters['fail']